@@ -0,0 +1,225 @@
+#!/usr/bin/python3
+#################################
+## Author: Heini Bergsson Debes
+#################################
+# Binary, memory-mappable container for the files written by the extractor ('adjlist', 'numified_adjlist',
+# 'translator', 'recorded_path' and 'numified_path'), so that the circuit input formatter does not have to parse
+# hex strings line by line. The container is a small header followed by named sections, each a fixed-width
+# array of little-endian unsigned integers (1, 2, 4 or 8 bytes, the smallest that fits the section's largest value):
+#   header:  magic (8 bytes) | version (u32) | number of sections (u32)
+#   section: name (24 bytes) | element width in bytes (u8) | reserved (3 bytes) | bitwidth of the largest value (u32)
+#            | number of elements (u64) | offset of the elements from the start of the file (u64, 8-byte aligned)
+# Adjacency lists are stored as compressed sparse rows (<name>_nodes, <name>_offsets, <name>_targets) and paths
+# as columns (<name>_ends = initial and final node, <name>_jumpkinds, <name>_dsts, <name>_rets), with the jumpkinds
+# encoded like in the circuit (0 jump, 1 call, 2 ret) and a ret of 0 for transitions that are not calls.
+# The sections are read through mmap, with numpy.frombuffer if numpy is installed (otherwise memoryview casts).
+# Converts in both directions when run as a script, e.g.,
+#   python3 scripts/binary_container.py -a ./embench-iot-applications/crc32 --to-binary
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import os, sys, getopt, mmap, struct
+from array import array
+
+MAGIC = b'ZEKRABIN'
+VERSION = 1
+CONTAINER_FILENAME = 'extracted.bin'
+HEADER = struct.Struct('<8sII')
+SECTION = struct.Struct('<24sB3xIQQ')
+TYPECODES = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'} # native (memoryview/array) formats of each width
+JUMPKINDS = {'jump': 0, 'call': 1, 'ret': 2}
+JUMPKIND_NAMES = {code: jumpkind for jumpkind,code in JUMPKINDS.items()}
+ADJLISTS = {'adjlist': True, 'numified_adjlist': False} # name -> written with hex labels
+PATHS = {'recorded_path': True, 'numified_path': False}
+
+def element_width(max_value):
+    for width in sorted(TYPECODES):
+        if max_value < 1 << (8*width):
+            return width
+    raise Exception('Cannot store %s in a container (values are limited to 64 bits)' %max_value)
+
+def write_container(filename, sections):
+    # sections: list of (name, values); the values are written as a little-endian array of the smallest width
+    table = []
+    payloads = []
+    offset = HEADER.size + SECTION.size*len(sections)
+    for name,values in sections:
+        offset = (offset + 7) & ~7
+        max_value = max(values) if len(values) > 0 else 0
+        width = element_width(max_value)
+        payload = array(TYPECODES[width], values)
+        if sys.byteorder == 'big': payload.byteswap()
+        table.append(SECTION.pack(name.encode(), width, max_value.bit_length(), len(values), offset))
+        payloads.append((offset, payload))
+        offset += width*len(values)
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, VERSION, len(sections)))
+        for entry in table:
+            out.write(entry)
+        for offset,payload in payloads:
+            out.write(b'\0'*(offset - out.tell()))
+            payload.tofile(out)
+    os.replace(tmp_filename, filename)
+
+class Container:
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as file_in:
+            self.mm = mmap.mmap(file_in.fileno(), 0, access=mmap.ACCESS_READ)
+        magic,version,num_sections = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise Exception('%s is not a version %s ZEKRA container' %(filename, VERSION))
+        self.sections = {} # name -> (width, bitwidth, length, offset)
+        for i in range(num_sections):
+            name,width,bitwidth,length,offset = SECTION.unpack_from(self.mm, HEADER.size + i*SECTION.size)
+            self.sections[name.rstrip(b'\0').decode()] = (width, bitwidth, length, offset)
+
+    def __contains__(self, name):
+        return name in self.sections
+
+    def length(self, name):
+        return self.sections[name][2]
+
+    def bitwidth(self, name): # bitwidth of the largest value in the section
+        return self.sections[name][1]
+
+    def values(self, name, start=0, stop=None):
+        # the elements [start:stop] of the section as a list of ints
+        width,bitwidth,length,offset = self.sections[name]
+        stop = length if stop is None else min(stop, length)
+        if stop <= start: return []
+        if numpy is not None:
+            return numpy.frombuffer(self.mm, dtype='<u%s' %width, count=stop-start, offset=offset+start*width).tolist()
+        if sys.byteorder == 'big':
+            values = array(TYPECODES[width], self.mm[offset+start*width:offset+stop*width])
+            values.byteswap()
+            return values.tolist()
+        with memoryview(self.mm) as view, view[offset+start*width:offset+stop*width] as raw, raw.cast(TYPECODES[width]) as values:
+            return values.tolist()
+
+    def chunks(self, name, chunk_size=1<<16): # the section's elements in bounded lists
+        for start in range(0, self.length(name), chunk_size):
+            yield self.values(name, start, start+chunk_size)
+
+    def close(self):
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def read_adjlist_sections(filename, name, hexify):
+    nodes, offsets, targets = [], [0], []
+    with open(filename, 'r') as file_in:
+        for line in file_in:
+            labels = line.split()
+            if len(labels) == 0: continue
+            nodes.append(int(labels[0], 16 if hexify else 10))
+            targets.extend(int(label, 16 if hexify else 10) for label in labels[1:])
+            offsets.append(len(targets))
+    return [(name+'_nodes', nodes), (name+'_offsets', offsets), (name+'_targets', targets)]
+
+def read_path_sections(filename, name, hexify):
+    jumpkinds, dsts, rets = array('B'), array('Q'), array('Q')
+    with open(filename, 'r') as file_in:
+        initial_node, final_node = [node.split('=')[1] for node in file_in.readline().split()]
+        for line in file_in:
+            fields = line.split()
+            if len(fields) == 0: continue
+            jumpkinds.append(JUMPKINDS[fields[0]])
+            dsts.append(int(fields[1], 16 if hexify else 10))
+            rets.append(int(fields[2], 16 if hexify else 10) if fields[0] == 'call' else 0)
+    ends = [int(initial_node, 16 if hexify else 10), int(final_node, 16 if hexify else 10)]
+    return [(name+'_ends', ends), (name+'_jumpkinds', jumpkinds), (name+'_dsts', dsts), (name+'_rets', rets)]
+
+def text_to_container(in_dir, filename):
+    # packs whichever of the extractor's text files exist in in_dir into one container
+    sections = []
+    for name,hexify in ADJLISTS.items():
+        if os.path.isfile(os.path.join(in_dir, name)):
+            sections.extend(read_adjlist_sections(os.path.join(in_dir, name), name, hexify))
+    if os.path.isfile(os.path.join(in_dir, 'translator')):
+        with open(os.path.join(in_dir, 'translator'), 'r') as file_in:
+            sections.append(('translator', [int(line, 16) for line in file_in if line.strip() != '']))
+    for name,hexify in PATHS.items():
+        if os.path.isfile(os.path.join(in_dir, name)):
+            sections.extend(read_path_sections(os.path.join(in_dir, name), name, hexify))
+    write_container(filename, sections)
+    return [name for name,values in sections]
+
+def container_to_text(container, out_dir):
+    # writes the text files back (byte for byte what the extractor wrote)
+    for name,hexify in ADJLISTS.items():
+        if name+'_nodes' not in container: continue
+        label = hex if hexify else str
+        offsets = container.values(name+'_offsets')
+        targets = container.values(name+'_targets')
+        with open(os.path.join(out_dir, name), 'w') as out:
+            for i,node in enumerate(container.values(name+'_nodes')):
+                out.write(' '.join([label(node)] + [label(target) for target in targets[offsets[i]:offsets[i+1]]]) + '\n')
+    if 'translator' in container:
+        with open(os.path.join(out_dir, 'translator'), 'w') as out:
+            for addr in container.values('translator'):
+                out.write('%s\n' %hex(addr))
+    for name,hexify in PATHS.items():
+        if name+'_ends' not in container: continue
+        label = hex if hexify else str
+        initial_node, final_node = container.values(name+'_ends')
+        with open(os.path.join(out_dir, name), 'w') as out:
+            out.write('initial_node=%s final_node=%s\n' %(label(initial_node), label(final_node)))
+            for jumpkinds,dsts,rets in zip(container.chunks(name+'_jumpkinds'), container.chunks(name+'_dsts'), container.chunks(name+'_rets')):
+                for jumpkind,dst,ret in zip(jumpkinds, dsts, rets):
+                    if jumpkind == JUMPKINDS['call']:
+                        out.write('call %s %s\n' %(label(dst), label(ret)))
+                    else:
+                        out.write('%s %s\n' %(JUMPKIND_NAMES[jumpkind], label(dst)))
+
+def usage():
+    print('Usage: %s -a <dir> (--to-binary | --to-text) [options]'%sys.argv[0])
+    print('Options:')
+    print('  -h                This help message')
+    print('  -a <dir>          Path to specific target application\'s directory containing (or to contain) the \'adjlist\', \'numified_adjlist\', \'translator\', \'recorded_path\', and \'numified_path\' files')
+    print('  --to-binary       Convert the text files in <dir> into a binary container')
+    print('  --to-text         Convert a binary container back into the text files in <dir>')
+    print('  --container <file> Path of the binary container (default is <dir>/%s)'%CONTAINER_FILENAME)
+
+if __name__ == '__main__':
+    app_dir=None
+    container_filename=None
+    direction=None
+    try:
+        opts,args=getopt.getopt(sys.argv[1:],'ha:',['to-binary','to-text','container='])
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(2)
+    for opt,arg in opts:
+        if opt=='-h':
+            usage()
+            sys.exit()
+        elif opt=='-a':
+            app_dir=arg
+        elif opt=='--to-binary':
+            direction='binary'
+        elif opt=='--to-text':
+            direction='text'
+        elif opt=='--container':
+            container_filename=arg
+    if not app_dir or not direction:
+        usage()
+        sys.exit(2)
+    if not container_filename:
+        container_filename=os.path.join(app_dir, CONTAINER_FILENAME)
+    if direction=='binary':
+        names=text_to_container(app_dir, container_filename)
+        print('Wrote %s sections (%s) to \'%s\' (%s bytes)'%(len(names), ', '.join(names), container_filename, os.path.getsize(container_filename)))
+    else:
+        with Container(container_filename) as container:
+            container_to_text(container, app_dir)
+        print('Wrote the text files of \'%s\' to \'%s\''%(container_filename, app_dir))
@@ -7,14 +7,22 @@
 # (2) get the hash of the encoded adjacency list, translator, and recorded execution path (after padding)
 # (3) format inputs for ZEKRA circuit
 
-import sys, getopt, math
-from poseidon.poseidon_hash import poseidon_hash, p
+import os, sys, getopt, math, time, json
+from poseidon.poseidon_hash import poseidon_hash, load_params, permute_many, p
+from poseidon.poseidon_field import set_field_backend, get_field_backend, available_backends
+from poseidon.poseidon_sponge import PoseidonSponge
+from digest_cache import DigestCache, DEFAULT_CACHE_SIZE, file_digest
+from binary_container import Container
+from packing import pack_encoded_adjlist, pack_transitions, pack_fields
 
 P_BITWIDTH=len(format(p,'0b'))
 EMPTY_DEST_ADDR=0
 JUMPKIND_BITWIDTH=2
+JUMPKIND_CODES={'jump':0,'call':1,'ret':2,'empty':3}
 LABEL_BITWIDTH=None
 BUCKET_BITWIDTH=None
+BUCKET_RADIX=8
+BUCKET_RADICES=[2,4,8,16,32] # supported by compile_circuit.py
 ADDR_BITWIDTH=None
 ADJLIST_LEVELS=None
 ADJLIST_FILENAME='adjlist'
@@ -24,6 +32,10 @@ RECORDED_PATH_FILENAME='recorded_path'
 TRANSLATOR_FILENAME='translator'
 PAD_ADJLIST=None
 PAD_PATH=None
+RECORDED_PATH_IN=None
+CONTAINER=None
+CACHE=None
+PACK_BATCH=1<<16 # transitions of the recorded execution path packed at a time
 
 def format_adjlist(adjlist, delim=' '):
     tmp = {}
@@ -34,14 +46,14 @@ def format_adjlist(adjlist, delim=' '):
         tmp[node] = neighbors
     return tmp
 
-def encode_adjlist(adjlist):
+def encode_adjlist(adjlist, radix=8):
     encoded_adjlist = [] # list of tuples (node, {bucket-rems levels})
     for node in adjlist:
         levels = {} # dictionary of bucket-rems pairs: {'bucket1':'rems1', 'bucket2':'rems2'}
         for neighbor in adjlist[node]: # dividend = divisor * quotient + remainder
             neighbor = int(neighbor)
-            bucket = int(neighbor / 8) # quotient
-            rem = neighbor % 8 # remainder
+            bucket = neighbor // radix # quotient
+            rem = neighbor % radix # remainder
             if bucket not in levels:
                 levels[bucket] = 0
             levels[bucket] |= (1 << rem) # set bit
@@ -67,11 +79,16 @@ def read_adjlist(adjlist_file, pad_adjlist=None):
 
 def read_translator(translator_file, pad_translator):
     translator=[]
-    len_without_pad = 0
     with open(translator_file, 'r') as file_in:
         for hex_addr in file_in.readlines():
             hex_addr=hex_addr.rstrip()
             translator.append(int(hex_addr,16))
+    return pad_translator_entries(translator, pad_translator)
+
+def read_container_translator(container, pad_translator):
+    return pad_translator_entries(container.values('translator'), pad_translator)
+
+def pad_translator_entries(translator, pad_translator):
     len_without_pad = len(translator)
     if pad_translator:
         if pad_translator<len(translator):
@@ -82,32 +99,88 @@ def read_translator(translator_file, pad_translator):
     translator.append(EMPTY_DEST_ADDR)
     return translator, len_without_pad
 
-def read_path(path_file, pad_path, empty_move_dst):
-    transitions = []
-    initial_node = None
-    final_node = None
-    len_without_pad = 0
-    with open(path_file, 'r') as file_in: # don't include the starting node (it is already assumed in the circuit)
-        initial_node, final_node = [node.split('=')[1] for node in file_in.readline().rstrip().split(' ')]
-        for transition in file_in.readlines():
-            transition = transition.rstrip().split(' ')
-            jumpkind,dst = transition[:2]
-            ret = transition[2] if jumpkind=='call' else empty_move_dst
-            transitions.append({
-                'jumpkind':jumpkind, 
-                'dst':dst, 
-                'ret':ret})
-    len_without_pad = len(transitions)
+def read_container_adjlist(container, pad_adjlist=None):
+    # the numified adjacency list of a binary container, formatted like format_adjlist(read_adjlist(...))
+    offsets = container.values('numified_adjlist_offsets')
+    targets = container.values('numified_adjlist_targets')
+    adjlist = {}
+    for i,node in enumerate(container.values('numified_adjlist_nodes')):
+        adjlist[str(node)] = targets[offsets[i]:offsets[i+1]]
+    return pad_adjlist_entries(adjlist, pad_adjlist)
+
+def pad_adjlist_entries(adjlist, pad_adjlist):
+    # pads a formatted adjacency list (label -> neighbors)
+    len_without_pad = len(adjlist)
+    if pad_adjlist:
+        if pad_adjlist<len(adjlist):
+            raise Exception('Adjacency list contains %s nodes. Cannot apply padding of %s nodes.'%(len(adjlist), pad_adjlist))
+        # append nodes with no neighbors to adjacency list
+        while len(adjlist)<pad_adjlist:
+            adjlist[str(len(adjlist))] = []
+    return adjlist, len_without_pad
+
+def load_numified_adjlist(in_dir):
+    if CONTAINER:
+        return read_container_adjlist(CONTAINER, PAD_ADJLIST)
+    adjlist,len_without_pad = read_adjlist(in_dir+NUMIFIED_ADJLIST_FILENAME, PAD_ADJLIST)
+    return format_adjlist(adjlist), len_without_pad
+
+def read_path_header(file_in):
+    initial_node, final_node = [node.split('=')[1] for node in file_in.readline().rstrip().split(' ')]
+    return initial_node, final_node
+
+def stream_path(file_in, pad_path, empty_move_dst, counts=None):
+    # yields the transitions of an already opened path file (or pipe/FIFO) one at a time as they arrive,
+    # followed by the empty moves of the padding; counts['num_transitions_pre_pad'] is kept up to date
+    if counts is None: counts = {}
+    counts['num_transitions_pre_pad'] = 0
+    for transition in file_in:
+        transition = transition.rstrip().split(' ')
+        if transition==['']: continue
+        jumpkind,dst = transition[:2]
+        ret = transition[2] if jumpkind=='call' else empty_move_dst
+        counts['num_transitions_pre_pad'] += 1
+        yield {
+            'jumpkind':jumpkind, 
+            'dst':dst, 
+            'ret':ret}
     if pad_path:
-        if pad_path<len(transitions):
-            raise Exception('Execution path contains %s transitions. Cannot apply padding of %s moves.'%(len(transitions), pad_path))
+        if pad_path<counts['num_transitions_pre_pad']:
+            raise Exception('Execution path contains %s transitions. Cannot apply padding of %s moves.'%(counts['num_transitions_pre_pad'], pad_path))
         # append empty moves to execution path
-        while len(transitions)<pad_path:
-            transitions.append({
+        for i in range(counts['num_transitions_pre_pad'], pad_path):
+            yield {
                 'jumpkind':'empty',
                 'dst':empty_move_dst,
-                'ret':empty_move_dst})
-    path={'transitions':transitions,'initial_node':initial_node,'final_node':final_node,'num_transitions_pre_pad':len_without_pad}
+                'ret':empty_move_dst}
+
+def stream_container_path(container, name, pad_path, empty_move_dst, counts=None):
+    # container counterpart of stream_path, yielding (jumpkind code, dst, ret) with ret=empty_move_dst unless
+    # the transition is a call
+    if counts is None: counts = {}
+    counts['num_transitions_pre_pad'] = container.length(name+'_jumpkinds')
+    if pad_path and pad_path<counts['num_transitions_pre_pad']:
+        raise Exception('Execution path contains %s transitions. Cannot apply padding of %s moves.'%(counts['num_transitions_pre_pad'], pad_path))
+    for jumpkinds,dsts,rets in zip(container.chunks(name+'_jumpkinds'), container.chunks(name+'_dsts'), container.chunks(name+'_rets')):
+        for jumpkind,dst,ret in zip(jumpkinds, dsts, rets):
+            yield jumpkind, dst, ret if jumpkind==JUMPKIND_CODES['call'] else empty_move_dst
+    if pad_path:
+        # append empty moves to execution path
+        for i in range(counts['num_transitions_pre_pad'], pad_path):
+            yield JUMPKIND_CODES['empty'], empty_move_dst, empty_move_dst
+
+def read_container_path(container, name, pad_path, empty_move_dst):
+    counts = {}
+    initial_node, final_node = container.values(name+'_ends')
+    transitions = [{'jumpkind':jumpkind, 'dst':dst, 'ret':ret} for jumpkind,dst,ret in stream_container_path(container, name, pad_path, empty_move_dst, counts)]
+    return {'transitions':transitions,'initial_node':str(initial_node),'final_node':str(final_node),'num_transitions_pre_pad':counts['num_transitions_pre_pad']}
+
+def read_path(path_file, pad_path, empty_move_dst):
+    counts = {}
+    with open(path_file, 'r') as file_in: # don't include the starting node (it is already assumed in the circuit)
+        initial_node, final_node = read_path_header(file_in)
+        transitions = list(stream_path(file_in, pad_path, empty_move_dst, counts))
+    path={'transitions':transitions,'initial_node':initial_node,'final_node':final_node,'num_transitions_pre_pad':counts['num_transitions_pre_pad']}
     return path
 
 def binify_encoded_adjlist(adjlist_encoded):
@@ -115,7 +188,7 @@ def binify_encoded_adjlist(adjlist_encoded):
     for node,levels in adjlist_encoded:
         neighbors = ''
         for bucket,rems in levels.items():
-            neighbors += '%s%s' %(format(rems,'08b'),format(bucket,'0%sb'%int(BUCKET_BITWIDTH)))
+            neighbors += '%s%s' %(format(rems,'0%sb'%BUCKET_RADIX),format(bucket,'0%sb'%int(BUCKET_BITWIDTH)))
         if len(neighbors)==0: neighbors='0'
         binified.append((node, neighbors))
     return binified
@@ -123,66 +196,64 @@ def binify_encoded_adjlist(adjlist_encoded):
 def numify_binified_adjlist(adjlist_binified):
     return [(node, int(encoded_neighbors,2)) for node,encoded_neighbors in adjlist_binified]
 
+def binify_transition(transition):
+    jumpkind,dst,ret = (format(0,'0%sb'%JUMPKIND_BITWIDTH),format(int(transition['dst'],16),'0%sb'%ADDR_BITWIDTH),format(0,'0%sb'%ADDR_BITWIDTH))
+    if transition['jumpkind']=='call':
+        jumpkind=format(1,'0%sb'%JUMPKIND_BITWIDTH)
+        ret=format(int(transition['ret'],16),'0%sb'%ADDR_BITWIDTH)
+    elif transition['jumpkind']=='ret':
+        jumpkind=format(2,'0%sb'%JUMPKIND_BITWIDTH)
+    elif transition['jumpkind']=='empty':
+        jumpkind=format(3,'0%sb'%JUMPKIND_BITWIDTH)
+    return ret+dst+jumpkind # reverse order
+
+def absorb_transitions(sponge, batch):
+    # packs the batched transitions into field elements and absorbs them (emptying the batch)
+    jumpkinds,dsts,rets=batch
+    if len(jumpkinds)==0: return
+    packed=pack_transitions(jumpkinds,dsts,rets,JUMPKIND_BITWIDTH,ADDR_BITWIDTH)
+    sponge.absorb_packed(pack_fields(packed,sponge.elem_bitwidth,sponge.elems_per_field_element),len(jumpkinds))
+    for column in batch: column.clear()
+
 def binify_path(path):
-    binified = []
-    for transition in path['transitions']:
-        jumpkind,dst,ret = (format(0,'0%sb'%JUMPKIND_BITWIDTH),format(int(transition['dst'],16),'0%sb'%ADDR_BITWIDTH),format(0,'0%sb'%ADDR_BITWIDTH))
-        if transition['jumpkind']=='call':
-            jumpkind=format(1,'0%sb'%JUMPKIND_BITWIDTH)
-            ret=format(int(transition['ret'],16),'0%sb'%ADDR_BITWIDTH)
-        elif transition['jumpkind']=='ret':
-            jumpkind=format(2,'0%sb'%JUMPKIND_BITWIDTH)
-        elif transition['jumpkind']=='empty':
-            jumpkind=format(3,'0%sb'%JUMPKIND_BITWIDTH)
-        encoded=ret+dst+jumpkind # reverse order
-        binified.append(encoded)
-    return binified
+    return [binify_transition(transition) for transition in path['transitions']]
 
 def numify_binified_path(path):
     return [int(transition, 2) for transition in path]
 
 def hash(padded_list):
-    # hash first chunk
-    poseidon_state=[0]*9 # empty state
+    # padded_list must already be a multiple of 8 (see make_multiple_of); PoseidonSponge hashes the
+    # chunks one at a time, keeping the state in the field backend's representation between calls
+    return PoseidonSponge().absorb(padded_list).finalize()
+
+def hash_many(padded_lists):
+    # hash() of every list (lists may differ in length): the sponges advance chunk by chunk in lockstep, so that the
+    # permutations of each chunk run as one batch (see permute_many)
+    field=get_field_backend()
+    rate=PoseidonSponge.RATE
+    params=load_params(rate+1,field)
+    states=[[field.to_field(0)]*(rate+1) for padded_list in padded_lists]
+    remaining=[idx for idx,padded_list in enumerate(padded_lists) if len(padded_list)>0]
     i=0
-    while i<8:
-        poseidon_state[i+1]=padded_list[i]
-        i+=1
-    poseidon_state=poseidon_hash(poseidon_state)
-
-    # hash remaining chunks
-    remaining_chunks=int(len(padded_list)/8)-1
-    i=0
-    while i<remaining_chunks:
-        j=0
-        while j<8:
-            poseidon_state[j+1]=padded_list[(i+1)*8+j]+poseidon_state[j+1]
-            j+=1
-        poseidon_state=poseidon_hash(poseidon_state)
-        i+=1
-    return poseidon_state[2]
+    while len(remaining)>0:
+        for idx in remaining:
+            for j,elem in enumerate(padded_lists[idx][i:i+rate]):
+                states[idx][j+1]=field.to_field(elem)+states[idx][j+1]
+        for idx,state in zip(remaining,permute_many([states[idx] for idx in remaining],params)):
+            states[idx]=state
+        i+=rate
+        remaining=[idx for idx in remaining if i<len(padded_lists[idx])]
+    return [field.from_field(state[2]) for state in states]
 
 def compress(tmp_list, elem_bitwidth):
     p_bitwidth=len(format(p,'0b'))
     elems_per_field_element=math.floor(p_bitwidth/elem_bitwidth)
-    compressed=[0]*math.ceil(len(tmp_list)/elems_per_field_element)
+    num_field_elements=math.ceil(len(tmp_list)/elems_per_field_element)
 
     print('\telems_per_field_element: %s (using %s-bit p)' %(elems_per_field_element,p_bitwidth))
-    print('\toccupies %s field elements after compression' %len(compressed))
+    print('\toccupies %s field elements after compression' %num_field_elements)
 
-    i=0
-    while i<len(compressed):
-        j=0
-        k=0
-        tmp_list_idx=i*elems_per_field_element
-        while j<elems_per_field_element and tmp_list_idx<len(tmp_list):
-            elem=tmp_list[tmp_list_idx]
-            compressed[i]=compressed[i]+(elem*2**k)
-            j+=1
-            k+=elem_bitwidth
-            tmp_list_idx+=1
-        i+=1
-    return compressed
+    return pack_fields(tmp_list,elem_bitwidth,elems_per_field_element)
 
 def make_multiple_of(tmp_list, factor=8, extend=0):
     padded_len=int(math.ceil(float(len(tmp_list)+extend)/factor)*factor)
@@ -190,39 +261,48 @@ def make_multiple_of(tmp_list, factor=8, extend=0):
     padded.extend([0]*(padded_len-len(tmp_list)))
     return padded
 
-def hash_translator(translator, nonce_translator):
+def sponge_checkpoint(compressed, num_nonces):
+    return PoseidonSponge().absorb(compressed).checkpoint(num_nonces)
+
+def finalize_checkpoint(checkpoint, nonces):
+    # the nonces are the only input after the checkpoint, so this costs a single call to Poseidon
+    return PoseidonSponge.from_checkpoint(checkpoint).finalize(nonces)
+
+def checkpoint_translator(translator):
     print('Starting hashing of the translator')
     print('\tADDR_BITWIDTH: %s'%(ADDR_BITWIDTH))
 
     translator_compressed=compress(translator,ADDR_BITWIDTH)
     translator_padded=make_multiple_of(translator_compressed,8,1) # we consider poseidon with 8 inputs, so we pad the translator to make it divisible by 8 (we reserve one field element for the nonce)
 
-    translator_padded[len(translator_padded)-1]=nonce_translator
-
     print('\tpadding translator with %s additional field elements (Poseidon call has arity 8 and we need to reserve 1 element for the translator nonce)' %(len(translator_padded)-len(translator_compressed)))
     print('\tcalls to Poseidon needed: %s' %math.ceil(len(translator_padded)/8))
 
-    return hash(translator_padded)
+    return sponge_checkpoint(translator_compressed, 1)
 
-def hash_adjlist(adjlist, levels, nonce_adjlist):
+def hash_translator(translator, nonce_translator):
+    return finalize_checkpoint(checkpoint_translator(translator), [nonce_translator])
+
+def checkpoint_adjlist(adjlist, levels):
     adjlist=[encoded_neighbors for node,encoded_neighbors in adjlist]
 
-    neighbors_bitwidth=levels*(BUCKET_BITWIDTH+8)
+    neighbors_bitwidth=levels*(BUCKET_BITWIDTH+BUCKET_RADIX)
 
     print('Starting hashing of the encoded adjacency list')
-    print('\tneighbors_bitwidth: %s (%s levels * (%s-bit buckets + 8-bit rems))'%(neighbors_bitwidth,levels,BUCKET_BITWIDTH))
+    print('\tneighbors_bitwidth: %s (%s levels * (%s-bit buckets + %s-bit rems))'%(neighbors_bitwidth,levels,BUCKET_BITWIDTH,BUCKET_RADIX))
 
     adjlist_compressed=compress(adjlist,neighbors_bitwidth)
     adjlist_padded=make_multiple_of(adjlist_compressed,8,1) # we consider poseidon with 8 inputs, so we pad the adjlist to make it divisible by 8 (we reserve one field element for the nonce)
 
-    adjlist_padded[len(adjlist_padded)-1]=nonce_adjlist
-
     print('\tpadding compressed path with %s additional field elements (Poseidon call has arity 8 and we need to reserve 1 element for the adjacency list nonce)' %(len(adjlist_padded)-len(adjlist_compressed)))
     print('\tcalls to Poseidon needed: %s' %math.ceil(len(adjlist_padded)/8))
 
-    return hash(adjlist_padded)
+    return sponge_checkpoint(adjlist_compressed, 1)
 
-def hash_path(path, nonce_verifier, nonce_path):
+def hash_adjlist(adjlist, levels, nonce_adjlist):
+    return finalize_checkpoint(checkpoint_adjlist(adjlist, levels), [nonce_adjlist])
+
+def checkpoint_path(path):
     transition_bitwidth=JUMPKIND_BITWIDTH+ADDR_BITWIDTH*2
 
     print('Starting hashing of the execution path')
@@ -231,18 +311,30 @@ def hash_path(path, nonce_verifier, nonce_path):
     path_compressed=compress(path,transition_bitwidth)
     path_padded=make_multiple_of(path_compressed,8,2) # we consider poseidon with 8 inputs, so we pad the path to make it divisible by 8 (we reserve two field elements for the two nonces)
 
-    path_padded[len(path_padded)-2]=nonce_verifier
-    path_padded[len(path_padded)-1]=nonce_path
-
     print('\tpadding compressed path with %s additional field elements (Poseidon call has arity 8 and we need to reserve 2 elements for the verifier and execution path nonces)' %(len(path_padded)-len(path_compressed)))
     print('\tcalls to Poseidon needed: %s' %math.ceil(len(path_padded)/8))
 
-    return hash(path_padded)
+    return sponge_checkpoint(path_compressed, 2)
 
-def main(in_dir, out_dir, nonce_verifier, nonce_path, nonce_translator, nonce_adjlist):
+def hash_path(path, nonce_verifier, nonce_path):
+    return finalize_checkpoint(checkpoint_path(path), [nonce_verifier, nonce_path])
+
+def checkpoint_path_sponge(sponge):
+    # streaming counterpart of checkpoint_path (same checkpoint and the same report)
+    print('Starting hashing of the execution path')
+    print('\ttransition_bitwidth: %s (%s-bit jumpkind||%s-bit dest address||%s-bit ret address)'%(sponge.elem_bitwidth,JUMPKIND_BITWIDTH,ADDR_BITWIDTH,ADDR_BITWIDTH))
+    print('\telems_per_field_element: %s (using %s-bit p)' %(sponge.elems_per_field_element,P_BITWIDTH))
+    checkpoint=sponge.checkpoint(2)
+    print('\toccupies %s field elements after compression' %sponge.num_field_elements)
+    print('\tpadding compressed path with %s additional field elements (Poseidon call has arity 8 and we need to reserve 2 elements for the verifier and execution path nonces)' %((-(sponge.num_field_elements+2))%8+2))
+    print('\tcalls to Poseidon needed: %s' %(sponge.num_calls+1))
+    return checkpoint
+
+def main(in_dir, out_dir, nonce_verifier, nonce_path, nonce_translator, nonce_adjlist, numified_adjlist=None):
+    # numified_adjlist is the (adjacency list, length without padding) of load_numified_adjlist if already loaded
     numified_adjlist_filename_in = in_dir+NUMIFIED_ADJLIST_FILENAME
     numified_path_filename_in    = in_dir+NUMIFIED_PATH_FILENAME
-    recorded_path_filename_in    = in_dir+RECORDED_PATH_FILENAME
+    recorded_path_filename_in    = RECORDED_PATH_IN if RECORDED_PATH_IN else in_dir+RECORDED_PATH_FILENAME
     translator_filename_in       = in_dir+TRANSLATOR_FILENAME
 
     encoded_adjlist_filename_out        = out_dir+'in_encoded_adjlist'
@@ -261,13 +353,19 @@ def main(in_dir, out_dir, nonce_verifier, nonce_path, nonce_translator, nonce_ad
 
     #############################################################
     ## Create circuit input files for the encoded adjacency list
-    adjlist,len_without_pad = read_adjlist(numified_adjlist_filename_in, PAD_ADJLIST)
-    adjlist = format_adjlist(adjlist)
-    adjlist_encoded  = encode_adjlist(adjlist)
-    adjlist_binified = binify_encoded_adjlist(adjlist_encoded)
-    adjlist_numified = numify_binified_adjlist(adjlist_binified)
+    cached=None
+    if CACHE:
+        adjlist_cache_key=CACHE.key('adjlist', file=file_digest(CONTAINER.filename if CONTAINER else numified_adjlist_filename_in), pad=PAD_ADJLIST, levels=ADJLIST_LEVELS, bucket_bitwidth=BUCKET_BITWIDTH, bucket_radix=BUCKET_RADIX)
+        cached=CACHE.get(adjlist_cache_key)
+    if cached:
+        num_nodes,len_without_pad,adjlist_numified=cached['num_nodes'],cached['len_without_pad'],[(str(node),neighbors) for node,neighbors in enumerate(cached['encoded'])]
+    else:
+        adjlist,len_without_pad = numified_adjlist if numified_adjlist else load_numified_adjlist(in_dir)
+        adjlist_encoded  = encode_adjlist(adjlist, BUCKET_RADIX)
+        adjlist_numified = pack_encoded_adjlist(adjlist_encoded, BUCKET_BITWIDTH, BUCKET_RADIX)
+        num_nodes = len(adjlist)
 
-    output='The encoded adjacency list contains %s nodes'%len(adjlist)
+    output='The encoded adjacency list contains %s nodes'%num_nodes
     if PAD_ADJLIST: output+=' (%s without padding)'%len_without_pad
     print(output)
 
@@ -275,7 +373,15 @@ def main(in_dir, out_dir, nonce_verifier, nonce_path, nonce_translator, nonce_ad
         file_out.write('\n'.join(str(neighbors) for node,neighbors in adjlist_numified))
     print('Wrote encoded adjacency list to file \'%s\'' %encoded_adjlist_filename_out)
 
-    adjlist_hash = hash_adjlist(adjlist_numified, ADJLIST_LEVELS, nonce_adjlist)
+    # the nonce is hashed last, so the sponge state before the final chunk is cached and reused for any nonce
+    if cached:
+        adjlist_checkpoint = cached['checkpoint']
+        print('Found the encoded adjacency list\'s sponge checkpoint in the cache (%s), finishing the hash with 1 call to Poseidon'%adjlist_cache_key)
+    else:
+        adjlist_checkpoint = checkpoint_adjlist(adjlist_numified, ADJLIST_LEVELS)
+        if CACHE:
+            CACHE.put(adjlist_cache_key, {'num_nodes':num_nodes, 'len_without_pad':len_without_pad, 'encoded':[neighbors for node,neighbors in adjlist_numified], 'checkpoint':adjlist_checkpoint})
+    adjlist_hash = finalize_checkpoint(adjlist_checkpoint, [nonce_adjlist])
 
     with open(encoded_adjlist_digest_filename_out, 'w') as file_out: 
         file_out.write(str(adjlist_hash))
@@ -284,7 +390,16 @@ def main(in_dir, out_dir, nonce_verifier, nonce_path, nonce_translator, nonce_ad
 
     #############################################################
     ## Create circuit input file for translator
-    translator,len_without_pad=read_translator(translator_filename_in, PAD_ADJLIST) # the size should follow that of the adjacency list
+    cached=None
+    if CACHE:
+        translator_cache_key=CACHE.key('translator', file=file_digest(CONTAINER.filename if CONTAINER else translator_filename_in), pad=PAD_ADJLIST, addr_bitwidth=ADDR_BITWIDTH)
+        cached=CACHE.get(translator_cache_key)
+    if cached:
+        translator,len_without_pad=cached['translator'],cached['len_without_pad']
+    elif CONTAINER:
+        translator,len_without_pad=read_container_translator(CONTAINER, PAD_ADJLIST) # the size should follow that of the adjacency list
+    else:
+        translator,len_without_pad=read_translator(translator_filename_in, PAD_ADJLIST) # the size should follow that of the adjacency list
 
     output='The translator contains %s addresses'%len(translator)
     if PAD_ADJLIST: output+=' (%s without padding)'%len_without_pad
@@ -294,7 +409,14 @@ def main(in_dir, out_dir, nonce_verifier, nonce_path, nonce_translator, nonce_ad
         file_out.write('\n'.join(str(addr) for addr in translator))
     print('Wrote translator to file \'%s\'' %translator_filename_out)
 
-    translator_hash=hash_translator(translator, nonce_translator)
+    if cached:
+        translator_checkpoint=cached['checkpoint']
+        print('Found the translator\'s sponge checkpoint in the cache (%s), finishing the hash with 1 call to Poseidon'%translator_cache_key)
+    else:
+        translator_checkpoint=checkpoint_translator(translator)
+        if CACHE:
+            CACHE.put(translator_cache_key, {'len_without_pad':len_without_pad, 'translator':translator, 'checkpoint':translator_checkpoint})
+    translator_hash=finalize_checkpoint(translator_checkpoint, [nonce_translator])
 
     with open(translator_digest_filename_out, 'w') as file_out: 
         file_out.write(str(translator_hash))
@@ -303,7 +425,10 @@ def main(in_dir, out_dir, nonce_verifier, nonce_path, nonce_translator, nonce_ad
 
     #############################################################
     ## Create circuit input files for the numified execution path
-    numified_path=read_path(numified_path_filename_in, PAD_PATH, len(adjlist))
+    if CONTAINER:
+        numified_path=read_container_path(CONTAINER, 'numified_path', PAD_PATH, num_nodes)
+    else:
+        numified_path=read_path(numified_path_filename_in, PAD_PATH, num_nodes)
 
     output='The numified execution path contains %s transitions'%len(numified_path['transitions'])
     if PAD_PATH: output+=' (%s without padding)'%numified_path['num_transitions_pre_pad']
@@ -340,58 +465,177 @@ def main(in_dir, out_dir, nonce_verifier, nonce_path, nonce_translator, nonce_ad
 
     #############################################################
     ## Create circuit input files for the recorded execution path
-    recorded_path=read_path(recorded_path_filename_in, PAD_PATH, str(hex(EMPTY_DEST_ADDR)))
-
-    output='The recorded execution path contains %s transitions'%len(recorded_path['transitions'])
-    if PAD_PATH: output+=' (%s without padding)'%recorded_path['num_transitions_pre_pad']
+    ## (streamed: each transition is written and absorbed into the sponge as soon as it is read)
+    cached=None
+    stream_container=CONTAINER and not RECORDED_PATH_IN # an explicitly given recorded path takes precedence
+    if stream_container:
+        recorded_path_filename_in=CONTAINER.filename
+    if CACHE and recorded_path_filename_in!='-' and os.path.isfile(recorded_path_filename_in):
+        path_cache_key=CACHE.key('recorded_path', file=file_digest(recorded_path_filename_in), pad=PAD_PATH, addr_bitwidth=ADDR_BITWIDTH)
+        cached=CACHE.get(path_cache_key)
+    transition_bitwidth=JUMPKIND_BITWIDTH+ADDR_BITWIDTH*2
+    sponge=PoseidonSponge(transition_bitwidth)
+    num_transitions=0
+    counts={}
+    if stream_container:
+        file_in=None
+        transitions=stream_container_path(CONTAINER, 'recorded_path', PAD_PATH, EMPTY_DEST_ADDR, counts)
+    else:
+        file_in=sys.stdin if recorded_path_filename_in=='-' else open(recorded_path_filename_in, 'r')
+        read_path_header(file_in)
+        transitions=((JUMPKIND_CODES[transition['jumpkind']],int(transition['dst'],16),int(transition['ret'],16)) for transition in stream_path(file_in, PAD_PATH, str(hex(EMPTY_DEST_ADDR)), counts))
+    batch=([],[],[]) # columns of jumpkinds, dsts and rets, packed and absorbed PACK_BATCH transitions at a time
+    batch_size=PACK_BATCH-PACK_BATCH%sponge.elems_per_field_element # so that only the final field element is partially filled
+    with open(recorded_path_filename_out, 'w') as file_out:
+        for jumpkind,dst,ret in transitions:
+            if num_transitions>0: file_out.write('\n')
+            file_out.write('%s %s %s'%(jumpkind,dst,ret))
+            num_transitions+=1
+            if cached: continue
+            batch[0].append(jumpkind)
+            batch[1].append(dst)
+            batch[2].append(ret)
+            if len(batch[0])==batch_size:
+                absorb_transitions(sponge, batch)
+        if not cached: absorb_transitions(sponge, batch)
+    if file_in: file_in.close()
+
+    output='The recorded execution path contains %s transitions'%num_transitions
+    if PAD_PATH: output+=' (%s without padding)'%counts['num_transitions_pre_pad']
     print(output)
-
-    with open(recorded_path_filename_out, 'w') as file_out: 
-        output=''
-        for transition in recorded_path['transitions']:
-            jumpkind=transition['jumpkind']
-            if jumpkind=='jump':jumpkind=0
-            elif jumpkind=='call':jumpkind=1
-            elif jumpkind=='ret':jumpkind=2
-            elif jumpkind=='empty':jumpkind=3
-            output+='%s %s %s\n'%(jumpkind,int(transition['dst'],16),int(transition['ret'],16))
-        file_out.write(output.rstrip())
     print('Wrote recorded execution path to file \'%s\'' %recorded_path_filename_out)
 
-    recorded_path_binified = binify_path(recorded_path)
-    recorded_path_numified = numify_binified_path(recorded_path_binified)
-    recorded_path_hash = hash_path(recorded_path_numified, nonce_verifier, nonce_path)
+    # a new verifier nonce (attestation challenge) for the same path only costs one call to Poseidon
+    if cached:
+        recorded_path_checkpoint=cached['checkpoint']
+        print('Found the recorded execution path\'s sponge checkpoint in the cache (%s), finishing the hash with 1 call to Poseidon'%path_cache_key)
+    else:
+        recorded_path_checkpoint=checkpoint_path_sponge(sponge)
+        if CACHE and recorded_path_filename_in!='-' and os.path.isfile(recorded_path_filename_in):
+            CACHE.put(path_cache_key, {'checkpoint':recorded_path_checkpoint})
+    recorded_path_hash=finalize_checkpoint(recorded_path_checkpoint, [nonce_verifier, nonce_path])
 
     with open(recorded_path_digest_filename_out, 'w') as file_out: 
         file_out.write(str(recorded_path_hash))
     print('Wrote recorded execution path digest to file \'%s\''%recorded_path_digest_filename_out)
     print('Recorded execution path hash: %s'%recorded_path_hash)
 
-def get_min_adjlist_levels(in_dir):
-    numified_adjlist_filename_in=in_dir+NUMIFIED_ADJLIST_FILENAME
-    adjlist,len_without_pad = read_adjlist(numified_adjlist_filename_in,PAD_ADJLIST)
-    adjlist = format_adjlist(adjlist)
-    encoded_adjlist = encode_adjlist(adjlist)
-    levels_required = len(max([list(levels) for node,levels in encoded_adjlist], key=len))
-    return levels_required
-
-def get_min_label_bitwidth(in_dir):
-    numified_adjlist_filename_in=in_dir+NUMIFIED_ADJLIST_FILENAME
-    adjlist,len_without_pad=read_adjlist(numified_adjlist_filename_in,PAD_ADJLIST)
+def main_paths(in_dir, out_dir, paths_in, nonce_verifier, nonce_path, nonce_translator, nonce_adjlist, processes=None, summary_filename=None):
+    # multi-path mode: the CFG artifacts are encoded and hashed once, then every recorded execution path of paths_in (a
+    # directory of path files, a file, or '-' for stdin, each path starting with its 'initial_node=...' line) gets its
+    # own set of circuit input files in out_dir/<name>, with the paths hashed concurrently. A path (or file of paths)
+    # that cannot be formatted is reported and skipped; the outcome of every path goes to a JSON summary (like --batch).
+    # Returns the number of failed paths
+    from pipeline import ExtractionResult, format_inputs, format_paths, read_paths # pipeline builds on this module
+    start=time.perf_counter()
+    extraction=ExtractionResult.from_container(CONTAINER.filename) if CONTAINER else ExtractionResult.from_dir(in_dir)
+    inputs=format_inputs(extraction, nonce_verifier, nonce_path, nonce_translator, nonce_adjlist, PAD_ADJLIST, PAD_PATH, ADJLIST_LEVELS, LABEL_BITWIDTH, BUCKET_BITWIDTH, BUCKET_RADIX, ADDR_BITWIDTH)
+    print('Encoded adjacency list hash: %s'%inputs.digests['adjlist'])
+    print('Translator hash: %s'%inputs.digests['translator'])
+    print('Encoded and hashed the CFG once in %.3f s'%(time.perf_counter()-start))
+
+    names,paths=[],[]
+    summary_paths=[] # per path (or unreadable file): name, status, output directory and digest or error
+    if paths_in=='-':
+        sources=[('path',sys.stdin)]
+    elif os.path.isdir(paths_in):
+        sources=[(filename,os.path.join(paths_in,filename)) for filename in sorted(os.listdir(paths_in)) if os.path.isfile(os.path.join(paths_in,filename))]
+    else:
+        sources=[(os.path.basename(paths_in),paths_in)]
+    for name,source in sources:
+        try:
+            file_in=source if source==sys.stdin else open(source,'r')
+            with file_in:
+                source_paths=list(read_paths(file_in))
+        except Exception as e:
+            summary_paths.append({'name': name, 'status': 'error', 'error': '%s: %s'%(type(e).__name__, e)})
+            print('[-] %s: %s'%(name,summary_paths[-1]['error']))
+            continue
+        for i,path in enumerate(source_paths):
+            names.append(name if len(source_paths)==1 and paths_in!='-' else '%s_%s'%(name,i))
+            paths.append(path)
+    if len(set(names))!=len(names):
+        raise Exception('The names of the execution paths (their output directories) are not unique')
+
+    start=time.perf_counter()
+    results=format_paths(inputs, extraction.translator, paths, pad_path=PAD_PATH, processes=processes)
+    print('Hashed %s execution paths in %.3f s'%(len([result for status,result in results if status=='ok']),time.perf_counter()-start))
+    for name,(status,result) in zip(names,results):
+        if status!='ok':
+            summary_paths.append({'name': name, 'status': 'error', 'error': result})
+            print('[-] %s: %s'%(name,result))
+            continue
+        path_out_dir=os.path.join(out_dir,name)
+        os.makedirs(path_out_dir,exist_ok=True)
+        result.write(path_out_dir)
+        summary_paths.append({'name': name, 'status': 'ok', 'output_dir': path_out_dir, 'transitions': result.recorded_path.num_transitions_pre_pad, 'recorded_path_digest': str(result.digests['recorded_path'])})
+        print('%s: %s transitions, recorded execution path hash: %s -> %s'%(name,result.recorded_path.num_transitions_pre_pad,result.digests['recorded_path'],path_out_dir))
+
+    num_failed=len([path for path in summary_paths if path['status']!='ok'])
+    summary={'output_dir': out_dir, 'num_paths': len(summary_paths), 'num_failed': num_failed, 'paths': summary_paths}
+    summary_filename=summary_filename or os.path.join(out_dir,'summary.json')
+    os.makedirs(os.path.dirname(os.path.abspath(summary_filename)),exist_ok=True)
+    with open(summary_filename,'w') as out:
+        json.dump(summary,out,indent=2)
+        out.write('\n')
+    print('Formatted %s of %s execution paths, wrote the summary to \'%s\''%(len(summary_paths)-num_failed,len(summary_paths),summary_filename))
+    return num_failed
+
+def required_adjlist_levels(adjlist, radix):
+    encoded_adjlist = encode_adjlist(adjlist, radix)
+    return len(max([list(levels) for node,levels in encoded_adjlist], key=len))
+
+def required_label_bitwidth(adjlist):
+    return len(format(len(adjlist),'0b')) # the final label is used as the empty label
+
+def required_bucket_bitwidth(adjlist, radix):
+    return len(format(math.floor(len(adjlist)/radix),'0b'))
+
+def bucket_radix_cost(adjlist, radix):
+    # (levels, bucket bitwidth, bits per node, field elements after compression) of the encoding with the given radix
+    # at its minimum levels and bucket bitwidth; the field elements are None if a node does not fit into one
+    levels=required_adjlist_levels(adjlist, radix)
+    bucket_bitwidth=required_bucket_bitwidth(adjlist, radix)
+    neighbors_bitwidth=max(levels,1)*(bucket_bitwidth+radix)
+    if neighbors_bitwidth>=P_BITWIDTH:
+        return levels,bucket_bitwidth,neighbors_bitwidth,None
+    return levels,bucket_bitwidth,neighbors_bitwidth,math.ceil(len(adjlist)/math.floor(P_BITWIDTH/neighbors_bitwidth))
+
+def get_min_adjlist_levels(adjlist):
+    return required_adjlist_levels(adjlist, BUCKET_RADIX)
+
+def get_min_label_bitwidth(adjlist):
     max_label=len(adjlist)
-    bitwidth=len(format(max_label,'0b'))
+    bitwidth=required_label_bitwidth(adjlist)
     print('The input adjacency list contains %s entries/nodes (i.e., max label is %s, which occupies %s bits)' %(len(adjlist),max_label,bitwidth))
     return bitwidth
 
-def get_min_bucket_bitwidth(in_dir):
-    numified_adjlist_filename_in=in_dir+NUMIFIED_ADJLIST_FILENAME
-    adjlist,len_without_pad=read_adjlist(numified_adjlist_filename_in,PAD_ADJLIST)
-    max_label=len(adjlist) # the final label is used as the empty label
-    max_bucket=math.floor(max_label/8)
-    max_bucket_bitwidth=len(format(max_bucket,'0b'))
-    return max_bucket_bitwidth
+def get_min_bucket_bitwidth(adjlist):
+    return required_bucket_bitwidth(adjlist, BUCKET_RADIX)
+
+def choose_bucket_radix(adjlist, radices=BUCKET_RADICES, verbose=True):
+    # the radix for which the encoded adjacency list (at its minimum levels and bucket bitwidth) packs into the fewest
+    # field elements, i.e., the fewest calls to Poseidon when hashing it. Ties are broken in favor of the default
+    # radix of 8 and then the smaller radix (the circuit checks one candidate remainder bit per unit of radix)
+    best=None
+    for radix in radices:
+        levels,bucket_bitwidth,neighbors_bitwidth,field_elements=bucket_radix_cost(adjlist, radix)
+        if field_elements is None:
+            if verbose: print('\tradix %2s: %s levels * (%s-bit buckets + %s-bit rems) exceeds p\'s bitwidth' %(radix,levels,bucket_bitwidth,radix))
+            continue
+        if verbose: print('\tradix %2s: %s levels * (%s-bit buckets + %s-bit rems) = %s bits per node, %s field elements after compression' %(radix,levels,bucket_bitwidth,radix,neighbors_bitwidth,field_elements))
+        if best is None or (field_elements,radix!=8,radix)<(best[1],best[0]!=8,best[0]):
+            best=(radix,field_elements)
+    if best is None:
+        raise Exception('The encoded adjacency list does not fit into a field element with any of the radices %s'%radices)
+    return best[0]
 
 def get_min_addr_bitwidth(in_dir):
+    if CONTAINER:
+        max_address=max(CONTAINER.values('adjlist_nodes')+CONTAINER.values('adjlist_targets'))
+        bitwidth=len(format(max_address,'0b'))
+        print('The maximum address in the input adjacency list is %s and occupies %s bits' %(hex(max_address),bitwidth))
+        return bitwidth
     adjlist_filename_in=in_dir+ADJLIST_FILENAME
     adjlist,len_without_pad=read_adjlist(adjlist_filename_in,PAD_ADJLIST)
     max_address=0
@@ -407,6 +651,7 @@ def get_min_addr_bitwidth(in_dir):
 
 def usage():
     print('Usage: %s -a <dir> [options]'%sys.argv[0])
+    print('       %s --batch <manifest> [-j <num>] [--output-dir <dir>] [--summary <file>] [--field-backend <name>]'%sys.argv[0])
     print('Options:')
     print('  -h                       This help message')
     print('  -a <dir>                 Path to specific target application\'s directory containing the \'adjlist\', \'numified_adjlist\', \'translator\', \'recorded_path\', and \'numified_path\' files')
@@ -420,7 +665,17 @@ def usage():
     print('  --nonce-adjlist <num>    Blinding factor (nonce) to hash with the encoded adjacency list (default 0)')
     print('  --label-bitwidth <num>   Use <num> bits to represent each numified destination address when compressing/hashing the numified execution path (default is to use the minimum number of bits as determined by the size of the adjacency list).')
     print('  --bucket-bitwidth <num>  Use <num> bits to represent each quotient (bucket) in the adjacency list encoding (default is to use the miminum number of bits as determined by the length of the adjacency list).')
+    print('  --bucket-radix <num>     Use <num> (%s) labels per bucket in the adjacency list encoding, i.e., encode each neighbor as the quotient (bucket) and the remainder of its label divided by <num>, with the remainders of a bucket stored as a <num>-bit mask. Use \'auto\' to pick the radix that compresses the adjacency list into the fewest field elements (default is 8). The circuit must be compiled with the same radix.'%', '.join(str(radix) for radix in BUCKET_RADICES))
     print('  --address-bitwidth <num> Use <num> bits to represent each destination address when compressing/hashing the raw/recorded execution path (default is to use the minimum number of bits as determined by the recorded execution path provided as input).')
+    print('  --recorded-path <file>   Read the recorded execution path from <file> instead of the application directory. The path is hashed while it is being read, so <file> may also be a pipe or FIFO (use \'-\' for stdin)')
+    print('  --cache-dir <dir>        Cache the encoded adjacency list and translator in <dir>, keyed by the content of the input files, the bitwidths, levels and padding, together with the sponge state of each structure (and of the recorded execution path) right before its nonces are hashed. Later runs against the same CFG then only hash the execution path, and a new nonce costs a single call to Poseidon (default is to not cache)')
+    print('  --cache-size <MB>        Maximum size of the cache directory before the least recently used entries are evicted (default %s MB)'%(DEFAULT_CACHE_SIZE//(1024*1024)))
+    print('  --field-backend <name>   Field arithmetic backend used for hashing and packing: %s (default is gmpy2 if installed, otherwise python; can also be set through the ZEKRA_FIELD_BACKEND environment variable). Long lists are packed column-wise with numpy instead, if it is installed. All backends produce identical digests.'%', '.join(available_backends()))
+    print('  --container <file>       Read the adjacency lists, translator and execution paths from the binary container <file> (see binary_container.py) instead of the text files in the application directory')
+    print('  --batch <manifest>       Format every job of the JSON manifest <manifest>, i.e., a list of jobs (or {"defaults": {...}, "jobs": [...]}) that each name an \'app_dir\' (or a \'container\') and may set \'name\', \'nonce_verifier\', \'nonce_path\', \'nonce_translator\', \'nonce_adjlist\', \'pad_adjlist_to\', \'pad_path_to\', \'adjlist_levels\', \'label_bitwidth\', \'bucket_bitwidth\', \'bucket_radix\' and \'address_bitwidth\' like the options above. The circuit input files of each job are stored in <dir>/<name> (see --output-dir, default ./batch) and the timings, digests and parameters of all jobs in a JSON summary')
+    print('  --paths <dir|file>       Multi-path mode: encode and hash the CFG artifacts of <dir> once and format every recorded execution path (in the format of \'recorded_path\', numified with the translator) found in the files of directory <dir|file>, or in the file <dir|file> itself (use \'-\' for stdin), one after the other. The circuit input files for each path are stored in <dir>/<name> (see --output-dir), where <name> is the name of its file (followed by its index if the file holds several paths). The paths are hashed concurrently (see -j). A path that cannot be formatted (e.g., one that visits a node that is not in the CFG) is reported and skipped, the outcome of every path is stored in a JSON summary (see --summary, default <dir>/summary.json) and the exit status is 1 if any path failed')
+    print('  -j <num>                 Number of processes to run the batch jobs across, or to hash the paths of --paths with (default is the number of CPUs)')
+    print('  --summary <file>         Store the JSON summary of the batch (or of --paths) in <file> (default is <dir>/summary.json)')
 
 if __name__ == '__main__':
     in_dir  = None
@@ -429,8 +684,14 @@ if __name__ == '__main__':
     nonce_path       = 0
     nonce_translator = 0
     nonce_adjlist    = 0
+    cache_dir        = None
+    cache_size       = DEFAULT_CACHE_SIZE
+    batch_manifest   = None
+    batch_processes  = None
+    batch_summary    = None
+    paths_in         = None
     try:
-        opts,args=getopt.getopt(sys.argv[1:],'ha:',['pad-adjlist-to=','pad-path-to=','adjlist-levels=','output-dir=','nonce-verifier=','nonce-path=','nonce-translator=','nonce-adjlist=','label-bitwidth=','bucket-bitwidth=','address-bitwidth='])
+        opts,args=getopt.getopt(sys.argv[1:],'ha:j:',['pad-adjlist-to=','pad-path-to=','adjlist-levels=','output-dir=','nonce-verifier=','nonce-path=','nonce-translator=','nonce-adjlist=','label-bitwidth=','bucket-bitwidth=','bucket-radix=','address-bitwidth=','recorded-path=','cache-dir=','cache-size=','field-backend=','container=','batch=','summary=','paths='])
     except getopt.GetoptError as err:
         print(err)
         usage()
@@ -479,14 +740,55 @@ if __name__ == '__main__':
             LABEL_BITWIDTH=int(arg)
         elif opt=='--bucket-bitwidth':
             BUCKET_BITWIDTH=int(arg)
+        elif opt=='--bucket-radix':
+            if arg=='auto':
+                BUCKET_RADIX=None
+            elif arg.isdigit() and int(arg) in BUCKET_RADICES:
+                BUCKET_RADIX=int(arg)
+            else:
+                print('%s: the bucket radix must be one of %s (or auto).'%(sys.argv[0],', '.join(str(radix) for radix in BUCKET_RADICES)))
+                usage()
+                sys.exit()
         elif opt=='--address-bitwidth':
             ADDR_BITWIDTH=int(arg)
+        elif opt=='--recorded-path':
+            RECORDED_PATH_IN=arg
+        elif opt=='--cache-dir':
+            cache_dir=arg
+        elif opt=='--cache-size':
+            cache_size=int(arg)*1024*1024
+        elif opt=='--field-backend':
+            if arg not in available_backends():
+                print('%s: the field backend \'%s\' is not available (choose from: %s).'%(sys.argv[0],arg,', '.join(available_backends())))
+                usage()
+                sys.exit()
+            set_field_backend(arg)
+        elif opt=='--container':
+            CONTAINER=Container(arg)
+        elif opt=='--batch':
+            batch_manifest=arg
+        elif opt=='-j':
+            batch_processes=int(arg)
+        elif opt=='--summary':
+            batch_summary=arg
+        elif opt=='--paths':
+            paths_in=arg
+    if batch_manifest:
+        from pipeline import load_manifest, run_batch
+        summary,summary_filename=run_batch(load_manifest(batch_manifest), out_dir or './batch', batch_processes, batch_summary)
+        print('Formatted %s of %s jobs in %.3f s, wrote the summary to \'%s\''%(summary['num_jobs']-summary['num_failed'],summary['num_jobs'],summary['seconds'],summary_filename))
+        sys.exit(1 if summary['num_failed']>0 else 0)
     if not in_dir:
         print('%s: fatal error: no application input directory specified \n'%sys.argv[0])
         usage()
         sys.exit()
 
-    min_adjlist_levels=get_min_adjlist_levels(in_dir)
+    numified_adjlist=load_numified_adjlist(in_dir) # parsed once, for the minimums and for main
+    if not BUCKET_RADIX:
+        print('Choosing the bucket radix:')
+        BUCKET_RADIX=choose_bucket_radix(numified_adjlist[0])
+        print('Chose BUCKET_RADIX=%s\n' %BUCKET_RADIX)
+    min_adjlist_levels=get_min_adjlist_levels(numified_adjlist[0])
     if not ADJLIST_LEVELS: 
         ADJLIST_LEVELS=min_adjlist_levels
     else:
@@ -494,7 +796,7 @@ if __name__ == '__main__':
             print('%s: the encoded adjacency list requires minimum %s levels.'%(sys.argv[0],min_adjlist_levels))
             usage()
             sys.exit()
-    min_label_bitwidth=get_min_label_bitwidth(in_dir)
+    min_label_bitwidth=get_min_label_bitwidth(numified_adjlist[0])
     if not LABEL_BITWIDTH: 
         LABEL_BITWIDTH=min_label_bitwidth
     else:
@@ -502,7 +804,7 @@ if __name__ == '__main__':
             print('%s: the provided label bitwidth is too small. Minimum bitwidth is %s.'%(sys.argv[0],min_label_bitwidth))
             usage()
             sys.exit()
-    min_bucket_bitwidth=get_min_bucket_bitwidth(in_dir)
+    min_bucket_bitwidth=get_min_bucket_bitwidth(numified_adjlist[0])
     if not BUCKET_BITWIDTH:
         BUCKET_BITWIDTH=min_bucket_bitwidth
     else:
@@ -518,15 +820,23 @@ if __name__ == '__main__':
             print('%s: the provided address bitwidth is too small. Minimum bitwidth is %s.'%(sys.argv[0],min_addr_bitwidth))
             usage()
             sys.exit()
-    encoded_neighbors_bitwidth=(BUCKET_BITWIDTH+8)*ADJLIST_LEVELS
+    encoded_neighbors_bitwidth=(BUCKET_BITWIDTH+BUCKET_RADIX)*ADJLIST_LEVELS
     if encoded_neighbors_bitwidth>=P_BITWIDTH:
-        print('%s: (BUCKET_BITWIDTH+8)*ADJ_LIST_LEVELS is %s which exceeds p\'s bitwidth of %s bits (see the implementation notes)'%(sys.argv[0],encoded_neighbors_bitwidth,P_BITWIDTH))
+        print('%s: (BUCKET_BITWIDTH+BUCKET_RADIX)*ADJ_LIST_LEVELS is %s which exceeds p\'s bitwidth of %s bits (see the implementation notes)'%(sys.argv[0],encoded_neighbors_bitwidth,P_BITWIDTH))
         usage()
         sys.exit()
     if not out_dir:
         out_dir=in_dir
+    if cache_dir:
+        CACHE=DigestCache(cache_dir, cache_size)
 
     print('Minimum:     ADJLIST_LEVELS=%s LABEL_BITWIDTH=%s BUCKET_BITWIDTH=%s ADDR_BITWIDTH=%s' %(min_adjlist_levels,min_label_bitwidth,min_bucket_bitwidth,min_addr_bitwidth))
-    print('Considering: ADJLIST_LEVELS=%s LABEL_BITWIDTH=%s BUCKET_BITWIDTH=%s ADDR_BITWIDTH=%s\n' %(ADJLIST_LEVELS,LABEL_BITWIDTH,BUCKET_BITWIDTH,ADDR_BITWIDTH))
+    print('Considering: ADJLIST_LEVELS=%s LABEL_BITWIDTH=%s BUCKET_BITWIDTH=%s ADDR_BITWIDTH=%s' %(ADJLIST_LEVELS,LABEL_BITWIDTH,BUCKET_BITWIDTH,ADDR_BITWIDTH))
+    if BUCKET_RADIX!=8: print('Bucket radix: %s' %BUCKET_RADIX)
+    print('Field backend: %s\n' %get_field_backend().name)
+
+    if paths_in:
+        num_failed=main_paths(in_dir, out_dir, paths_in, nonce_verifier, nonce_path, nonce_translator, nonce_adjlist, batch_processes, batch_summary)
+        sys.exit(1 if num_failed>0 else 0)
 
-    main(in_dir, out_dir, nonce_verifier, nonce_path, nonce_translator, nonce_adjlist)
+    main(in_dir, out_dir, nonce_verifier, nonce_path, nonce_translator, nonce_adjlist, numified_adjlist)
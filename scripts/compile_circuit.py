@@ -5,13 +5,19 @@
 # Purpose is to:
 # (1) initialize the sizes of the data structures in the ZEKRA circuit
 # (2) compile the high-level ZEKRA program code into the low-level arithmetic circuit (including formatting the circuit inputs) using the xjsnark backend
+# With --build-dir, the two are split into a build phase (patching a copy of the Java files and running javac), which is
+# cached per circuit, and an evaluate phase, which runs the cached classes on the inputs. The input and output
+# directories are then read from system properties instead of being patched into the source, so new inputs for the
+# same circuit never recompile it. (The xjsnark backend cannot load a circuit from its .arith file, so every run
+# still generates the circuit in memory before evaluating the witness.)
 
-import sys, getopt, math
+import os, sys, getopt, math, re, json, shutil, hashlib, tempfile
 import subprocess
 
 JUMPKIND_BITWIDTH=2
 LABEL_BITWIDTH=None
 BUCKET_BITWIDTH=None
+BUCKET_RADIX=8
 ADDR_BITWIDTH=None
 ADJLIST_SIZE=None
 ADJLIST_LEVELS=None
@@ -25,15 +31,25 @@ COMPUTE_WORKLOAD_DISTRIBUTION=False
 
 COMPONENTS_DIR='./components'
 
-def compile(component_dir, component_name, with_poseidon=True):
-    cmd = ['javac', '-d', 'bin', \
+BUILD_DIR=None
+BUILD_ONLY=False
+BUILD_INFO_FILENAME='build.json'
+INPUT_DIR_PROPERTY='zekra.inputPathPrefix'
+OUTPUT_DIR_PROPERTY='zekra.outputFilesPath'
+
+def compile(component_dir, component_name, with_poseidon=True, bin_dir='bin'):
+    cmd = ['javac', '-d', bin_dir, \
         '-cp', 'xjsnark_backend.jar', \
         '%s/%s.java'%(component_dir,component_name)]
     if with_poseidon: cmd.extend(['%s/PoseidonHash.java'%(component_dir)])
     # print(' '.join(cmd))
     subprocess.run(cmd, stderr=subprocess.PIPE, check=True)
-    cmd = ['java', '-Xmx10g', \
-        '-cp', 'bin:xjsnark_backend.jar', \
+    return run(component_name, bin_dir)
+
+def run(component_name, bin_dir='bin', properties={}):
+    cmd = ['java', '-Xmx10g'] + \
+        ['-D%s=%s'%(name,value) for name,value in properties.items()] + \
+        ['-cp', '%s:xjsnark_backend.jar'%bin_dir, \
         'xjsnark.%s.%s'%(component_name,component_name)]
     # print(' '.join(cmd))
     output=subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
@@ -80,14 +96,38 @@ def set_label_bitwidth(contents, bitwidth):
             replace_line='%sstate.assign(uintDestNode, %s);'
         if 'UnsignedInteger uintDestNode = dest[i].copy(' in line:
             replace_line='%sUnsignedInteger uintDestNode = dest[i].copy(%s);'
-        if 'UnsignedInteger bucket = uintDestNode.div(UnsignedInteger.instantiateFrom(4, 8)).copy(' in line:
-            replace_line='%sUnsignedInteger bucket = uintDestNode.div(UnsignedInteger.instantiateFrom(4, 8)).copy(%s);'
+        if 'UnsignedInteger bucket = uintDestNode.div(UnsignedInteger.instantiateFrom(' in line: # the divisor is set by set_bucket_radix
+            contents[idx]=re.sub(r'\.copy\(\d+\);$', '.copy(%s);'%bitwidth, line)
         if 'CircuitGenerator.__getActiveCircuitGenerator().__addOneAssertion(shadowStackTop.isNotEqualTo(UnsignedInteger.instantiateFrom(' in line:
             replace_line='%sCircuitGenerator.__getActiveCircuitGenerator().__addOneAssertion(shadowStackTop.isNotEqualTo(UnsignedInteger.instantiateFrom(%s, SHADOWSTACK_DEPTH)).getWire());'
         if replace_line:
             contents[idx]=replace_line%(' '*count_leading_whitespace(line),bitwidth)
     return contents
 
+def set_bucket_radix(contents, radix):
+    # the adjacency list encoding splits each label into a bucket (label/radix) and a remainder (label%radix), which is
+    # stored as a radix-bit bitmask; the generated code assumes radix 8 (3-bit remainders, 8-bit bitmasks) unless patched
+    radix_bitwidth=int(math.log(radix, 2))
+    substitutions=[
+        (r'destNode\.mod\(BigInteger\.valueOf\(\d+\)\)', 'destNode.mod(BigInteger.valueOf(%s))'%radix),
+        (r'destNode\.divide\(BigInteger\.valueOf\(\d+\)\)', 'destNode.divide(BigInteger.valueOf(%s))'%radix),
+        (r'shiftRight\(k \+ BUCKET_BITWIDTH\)\.and\(BigInteger\.valueOf\(\d+L?\)\)', 'shiftRight(k + BUCKET_BITWIDTH).and(BigInteger.valueOf(%s%s))'%(2**radix-1,'L' if radix>31 else '')),
+        (r'\(BUCKET_BITWIDTH( ?)\+( ?)\d+\)', r'(BUCKET_BITWIDTH\1+\g<2>%s)'%radix), # also in the error message of the levels check
+        (r'e=2\*\*\(destNode%\d+\)', 'e=2**(destNode%%%s)'%radix),
+        (r'uintDestNode\.(div|mod)\(UnsignedInteger\.instantiateFrom\(\d+, \d+\)\)', r'uintDestNode.\1(UnsignedInteger.instantiateFrom(%s, %s))'%(radix_bitwidth+1,radix)),
+        (r'UnsignedInteger pos = UnsignedInteger\.instantiateFrom\(\d+, (.*)\)\.copy\(\d+\);', r'UnsignedInteger pos = UnsignedInteger.instantiateFrom(%s, \1).copy(%s);'%(radix_bitwidth,radix_bitwidth)),
+        (r'for \(double j = 0, k = 1; j < \d+; j\+\+, k = Math\.pow\(2, j\)\)', 'for (double j = 0, k = 1; j < %s; j++, k = Math.pow(2, j))'%radix),
+        (r'(eAndR1 = .*, )\d+\);$', r'\g<1>%s);'%radix)] # e = 2**pos occupies radix bits
+    if radix>31: # 2**j no longer fits into an int
+        substitutions.append((r'new Double\(k\)\.intValue\(\)', 'BigInteger.valueOf(new Double(k).longValue())'))
+    else:
+        substitutions.append((r'BigInteger\.valueOf\(new Double\(k\)\.longValue\(\)\)', 'new Double(k).intValue()'))
+    for idx,line in enumerate(contents):
+        for pattern,replacement in substitutions:
+            line=re.sub(pattern, replacement, line)
+        contents[idx]=line
+    return contents
+
 def set_val(contents, data_structure, val):
     for idx,line in enumerate(contents):
         replace_line=None
@@ -118,6 +158,15 @@ def set_output_dir(contents, out_dir):
             break
     return contents
 
+def set_dir_properties(contents):
+    # replaces the directories patched in by set_input_dir/set_output_dir with system properties (see evaluate)
+    for idx,line in enumerate(contents):
+        if 'inputPathPrefix =' in line:
+            contents[idx]='%sinputPathPrefix = System.getProperty("%s", "");'%(' '*count_leading_whitespace(line),INPUT_DIR_PROPERTY)
+        elif 'Config.outputFilesPath =' in line:
+            contents[idx]='%sConfig.outputFilesPath = System.getProperty("%s", "");'%(' '*count_leading_whitespace(line),OUTPUT_DIR_PROPERTY)
+    return contents
+
 def get_constraints(output):
     constraints=None
     for line in output.split('\n'):
@@ -144,17 +193,25 @@ def write_component(filename, program_lines):
     with open(filename, 'w') as out_file:
         for line in program_lines: out_file.write('%s\r\n'%line)
 
+def build_params():
+    # the parameters of the circuit, in the order of configure_data_structures (and of pipeline.CircuitConfig.key)
+    return (ADJLIST_SIZE, ADJLIST_LEVELS, EXECUTION_PATH_SIZE, SHADOWSTACK_DEPTH, LABEL_BITWIDTH, BUCKET_BITWIDTH, ADDR_BITWIDTH, BUCKET_RADIX)
+
 def adjust_data_structures(program_lines):
-    stack_top_bitwidth = int(math.log(SHADOWSTACK_DEPTH, 2))+1
+    return configure_data_structures(program_lines, *build_params())
+
+def configure_data_structures(program_lines, adjlist_size, adjlist_levels, execution_path_size, shadowstack_depth, label_bitwidth, bucket_bitwidth, addr_bitwidth, bucket_radix=8):
+    stack_top_bitwidth = int(math.log(shadowstack_depth, 2))+1
     program_lines = set_shadow_stack_top_bitwidth(program_lines,stack_top_bitwidth)
     program_lines = set_val(program_lines,'JUMPKIND_BITWIDTH',JUMPKIND_BITWIDTH)
-    program_lines = set_label_bitwidth(program_lines,LABEL_BITWIDTH)
-    program_lines = set_val(program_lines,'BUCKET_BITWIDTH',BUCKET_BITWIDTH)
-    program_lines = set_val(program_lines,'ADDR_BITWIDTH',ADDR_BITWIDTH)
-    program_lines = set_val(program_lines,'ADJLIST_SIZE',ADJLIST_SIZE)
-    program_lines = set_val(program_lines,'ADJLIST_LEVELS',ADJLIST_LEVELS)
-    program_lines = set_val(program_lines,'EXECUTION_PATH_SIZE',EXECUTION_PATH_SIZE)
-    program_lines = set_val(program_lines,'SHADOWSTACK_DEPTH',SHADOWSTACK_DEPTH)
+    program_lines = set_label_bitwidth(program_lines,label_bitwidth)
+    program_lines = set_val(program_lines,'BUCKET_BITWIDTH',bucket_bitwidth)
+    program_lines = set_bucket_radix(program_lines,bucket_radix)
+    program_lines = set_val(program_lines,'ADDR_BITWIDTH',addr_bitwidth)
+    program_lines = set_val(program_lines,'ADJLIST_SIZE',adjlist_size)
+    program_lines = set_val(program_lines,'ADJLIST_LEVELS',adjlist_levels)
+    program_lines = set_val(program_lines,'EXECUTION_PATH_SIZE',execution_path_size)
+    program_lines = set_val(program_lines,'SHADOWSTACK_DEPTH',shadowstack_depth)
     return program_lines
 
 def configure_component(component_dir, component_name):
@@ -171,9 +228,75 @@ def configure_main_component(in_dir, out_dir):
     program_lines=set_output_dir(program_lines,out_dir)
     write_component(filename,program_lines)
 
+def build_key(params, program_lines, poseidon_lines):
+    # the parameters name the build, and the digest of the patched sources tells apart builds of different circuit code
+    h=hashlib.sha256()
+    for line in program_lines+poseidon_lines:
+        h.update(line.encode()+b'\n')
+    return '%s_%s_%s'%(ZEKRA_COMPONENT_NAME,'_'.join(str(param) for param in params),h.hexdigest()[:16])
+
+def read_build_info(build_dir):
+    with open(os.path.join(build_dir,BUILD_INFO_FILENAME), 'r') as file_in:
+        return json.load(file_in)
+
+def write_build_info(build_dir, info):
+    tmp_filename=os.path.join(build_dir,BUILD_INFO_FILENAME+'.tmp')
+    with open(tmp_filename, 'w') as file_out:
+        json.dump(info, file_out, indent=2)
+    os.replace(tmp_filename, os.path.join(build_dir,BUILD_INFO_FILENAME))
+
+def build(build_root, params, zekra_dir=None):
+    # patches a copy of the ZEKRA Java files for params (see build_params) and compiles it into build_root/<key>,
+    # unless that build exists already; returns (build directory, whether it was cached)
+    zekra_dir=zekra_dir or ZEKRA_DIR
+    program_lines=configure_data_structures(read_component('%s/%s.java'%(zekra_dir,ZEKRA_COMPONENT_NAME)), *params)
+    program_lines=set_dir_properties(program_lines)
+    poseidon_lines=read_component('%s/PoseidonHash.java'%zekra_dir)
+    build_dir=os.path.join(build_root,build_key(params,program_lines,poseidon_lines))
+    if os.path.isfile(os.path.join(build_dir,BUILD_INFO_FILENAME)):
+        return build_dir,True
+    os.makedirs(build_root, exist_ok=True)
+    tmp_dir=tempfile.mkdtemp(dir=build_root, suffix='.tmp') # renamed once complete, so a failed build is never reused
+    try:
+        src_dir=os.path.join(tmp_dir,'src')
+        os.makedirs(src_dir)
+        write_component('%s/%s.java'%(src_dir,ZEKRA_COMPONENT_NAME),program_lines)
+        write_component('%s/PoseidonHash.java'%src_dir,poseidon_lines)
+        cmd = ['javac', '-d', os.path.join(tmp_dir,'bin'), \
+            '-cp', 'xjsnark_backend.jar', \
+            '%s/%s.java'%(src_dir,ZEKRA_COMPONENT_NAME), '%s/PoseidonHash.java'%src_dir]
+        subprocess.run(cmd, stderr=subprocess.PIPE, check=True)
+        write_build_info(tmp_dir, {'params':list(params), 'constraints':None})
+        os.rename(tmp_dir, build_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isfile(os.path.join(build_dir,BUILD_INFO_FILENAME)): raise # otherwise built concurrently by another process
+    return build_dir,False
+
+def evaluate(build_dir, in_dir, out_dir):
+    # runs the compiled circuit of build_dir on the inputs in in_dir, storing its output files in out_dir; the first
+    # evaluation also stores the .arith file and the number of constraints in build_dir
+    stdout,stderr=run(ZEKRA_COMPONENT_NAME, os.path.join(build_dir,'bin'), {INPUT_DIR_PROPERTY: in_dir+'/' if in_dir else '', OUTPUT_DIR_PROPERTY: out_dir})
+    info=read_build_info(build_dir)
+    path_arith=os.path.join(out_dir,'%s.arith'%ZEKRA_COMPONENT_NAME)
+    if info['constraints'] is None and get_constraints(stdout) is not None and os.path.isfile(path_arith):
+        shutil.copy2(path_arith, os.path.join(build_dir,'%s.arith'%ZEKRA_COMPONENT_NAME))
+        info['constraints']=get_constraints(stdout)
+        write_build_info(build_dir, info)
+    return stdout,stderr
+
 def main(in_dir, out_dir):
-    configure_main_component(in_dir, out_dir)
-    stdout,stderr=compile(ZEKRA_DIR,ZEKRA_COMPONENT_NAME)
+    if BUILD_DIR:
+        build_dir,cached=build(BUILD_DIR, build_params())
+        if cached:
+            print('Found the compiled ZEKRA circuit in \'%s\', skipping the compilation.' %build_dir)
+        else:
+            print('Compiled the ZEKRA circuit into \'%s\'.' %build_dir)
+        if BUILD_ONLY: return
+        stdout,stderr=evaluate(build_dir, in_dir, out_dir)
+    else:
+        configure_main_component(in_dir, out_dir)
+        stdout,stderr=compile(ZEKRA_DIR,ZEKRA_COMPONENT_NAME)
     total_constraints=get_constraints(stdout)
     
     print('Successfully compiled the ZEKRA circuit.\nTotal constraints: %s' %total_constraints)
@@ -227,16 +350,19 @@ def usage():
     print('  --stack-depth <num>      Set <num> as the maximum depth of the shadow stack data structure (execution paths that surpass this upper bound will cause the proof to become rejected so it must be set appropriately)')
     print('  --label-bitwidth <num>   Set <num> as the number of bits to represent each numified destination address when compressing/hashing the numified execution path')
     print('  --bucket-bitwidth <num>  Set <num> as the number of bits to represent each quotient (bucket) in the adjacency list encoding')
+    print('  --bucket-radix <num>     Set <num> (a power of 2 between 2 and 32) as the radix of the adjacency list encoding, i.e., the number of labels per bucket (default is 8). Must match the radix used by \'circuit_input_formatter.py\'')
     print('  --address-bitwidth <num> Set <num> as the number of bits to represent each destination address when compressing/hashing the raw/recorded execution path')
     print('  --input-dir <dir>        Directory containing the output files from \'circuit_input_formatter.py\' (default is to check the current working directory)')
     print('  --output-dir <dir>       Store the <%s.arith> and <%s_Sample_Run1> files in <dir> (default is to store the files in the current working directory)' %(ZEKRA_COMPONENT_NAME,ZEKRA_COMPONENT_NAME))
+    print('  --build-dir <dir>        Compile the circuit into <dir>/<key> (with <key> made of the parameters above and a digest of the patched Java files) and then evaluate it on the inputs of --input-dir. A later run with the same parameters reuses the compiled classes and only evaluates the new inputs. The first evaluation also stores the <%s.arith> file and the number of constraints in <dir>/<key> (default is to patch the Java files in place and compile them on every run)' %ZEKRA_COMPONENT_NAME)
+    print('  --build-only             With --build-dir, only compile the circuit (if it is not in <dir> already) without evaluating any inputs')
     print('  --components-dir <dir>   If -v is used, then <dir> is the path to the directory containing the different ZEKRA components \'%s_c1,...,%s_c6\' (default is %s)' %(ZEKRA_COMPONENT_NAME,ZEKRA_COMPONENT_NAME,COMPONENTS_DIR))
 
 if __name__ == '__main__':
     in_dir=''
     out_dir=''
     try:
-        opts,args=getopt.getopt(sys.argv[1:],'hv',['zekra-dir=','adjlist-len=','adjlist-levels=','path-len=','stack-depth=','label-bitwidth=','bucket-bitwidth=','address-bitwidth=','input-dir=','output-dir=','components-dir='])
+        opts,args=getopt.getopt(sys.argv[1:],'hv',['zekra-dir=','adjlist-len=','adjlist-levels=','path-len=','stack-depth=','label-bitwidth=','bucket-bitwidth=','bucket-radix=','address-bitwidth=','input-dir=','output-dir=','components-dir=','build-dir=','build-only'])
     except getopt.GetoptError as err:
         print(err)
         usage()
@@ -262,6 +388,12 @@ if __name__ == '__main__':
             LABEL_BITWIDTH=int(arg)
         elif opt=='--bucket-bitwidth':
             BUCKET_BITWIDTH=int(arg)
+        elif opt=='--bucket-radix':
+            BUCKET_RADIX=int(arg)
+            if BUCKET_RADIX<2 or BUCKET_RADIX>32 or BUCKET_RADIX&(BUCKET_RADIX-1)!=0:
+                print('%s: the bucket radix must be a power of 2 between 2 and 32.'%sys.argv[0])
+                usage()
+                sys.exit()
         elif opt=='--address-bitwidth':
             ADDR_BITWIDTH=int(arg)
         elif opt=='--input-dir':
@@ -273,7 +405,16 @@ if __name__ == '__main__':
         elif opt=='--components-dir':
             if arg.endswith('/'): arg=arg[:-1]
             COMPONENTS_DIR=arg
+        elif opt=='--build-dir':
+            if arg.endswith('/'): arg=arg[:-1]
+            BUILD_DIR=arg
+        elif opt=='--build-only':
+            BUILD_ONLY=True
     if not (ADJLIST_SIZE and ADJLIST_LEVELS and EXECUTION_PATH_SIZE and SHADOWSTACK_DEPTH and LABEL_BITWIDTH and BUCKET_BITWIDTH and ADDR_BITWIDTH):
         usage()
         sys.exit()
+    if BUILD_ONLY and not BUILD_DIR:
+        print('%s: --build-only requires --build-dir.'%sys.argv[0])
+        usage()
+        sys.exit()
     main(in_dir, out_dir)
@@ -0,0 +1,178 @@
+#################################
+## Author: Heini Bergsson Debes
+#################################
+# Array-backed (CSR) control-flow graph used by the extractor to produce the translator, the numified
+# adjacency list and the raw adjacency list in linear time. Nodes are numbered in the order of the CFG they
+# were built from; every node keeps its address and block id, and addr_index maps an address to the first
+# node with that address (like cfg.get_all_nodes(addr)[0] does for an angr CFG).
+# GraphBuilder is the mutable counterpart used while the CFG is being completed (e.g. with the nodes and edges
+# taken by the recorded execution path); freeze() turns it into a CSRGraph.
+
+from array import array
+
+class GraphBuilder:
+    def __init__(self):
+        self.addrs = []
+        self.block_ids = []
+        self.successors = []
+        self.addr_index = {}
+        self.edges = set()
+
+    @classmethod
+    def from_cfg(cls, cfg):
+        # keeps the node order and the (insertion) order of the successors of the networkx graph behind an angr CFG
+        builder = cls()
+        graph = cfg.graph
+        node_index = {}
+        for node in graph.nodes():
+            node_index[node] = builder.add_node(node.addr, node.block_id)
+        for node in graph.nodes():
+            u = node_index[node]
+            for successor in graph.successors(node):
+                builder.add_edge(u, node_index[successor])
+        return builder
+
+    def to_dict(self):
+        return {'addrs':self.addrs, 'block_ids':self.block_ids, 'successors':self.successors}
+
+    @classmethod
+    def from_dict(cls, serialized):
+        builder = cls()
+        for addr,block_id in zip(serialized['addrs'], serialized['block_ids']):
+            builder.add_node(addr, block_id)
+        for u,successors in enumerate(serialized['successors']):
+            for v in successors:
+                builder.add_edge(u, v)
+        return builder
+
+    def add_node(self, addr, block_id=None):
+        index = len(self.addrs)
+        self.addrs.append(addr)
+        self.block_ids.append(addr if block_id is None else block_id)
+        self.successors.append([])
+        self.addr_index.setdefault(addr, index)
+        return index
+
+    def node(self, addr): # index of the node with addr (added if it does not exist yet)
+        index = self.addr_index.get(addr)
+        if index is None: index = self.add_node(addr)
+        return index
+
+    def add_edge(self, u, v): # adds edge if it doesn't already exist
+        if (u,v) in self.edges: return
+        self.edges.add((u,v))
+        self.successors[u].append(v)
+
+    def add_execution_path(self, initial_node, transitions):
+        # add the nodes and edges taken by the execution path that are missing from the CFG
+        state = self.node(initial_node)
+        for transition in transitions:
+            if transition['jumpkind'] == 'call':
+                self.node(transition['ret']) # return node (just add it to the CFG)
+            dst = self.node(transition['dst'])
+            self.add_edge(state, dst)
+            state = dst
+
+    def freeze(self):
+        offsets = array('q', [0])
+        targets = array('q')
+        for successors in self.successors:
+            targets.extend(successors)
+            offsets.append(len(targets))
+        return CSRGraph(self.addrs, self.block_ids, offsets, targets, self.addr_index)
+
+class CSRGraph:
+    def __init__(self, addrs, block_ids, offsets, targets, addr_index):
+        self.addrs = addrs
+        self.block_ids = block_ids
+        self.offsets = offsets
+        self.targets = targets
+        self.addr_index = addr_index
+
+    @property
+    def num_nodes(self):
+        return len(self.addrs)
+
+    @property
+    def num_edges(self):
+        return len(self.targets)
+
+    def successors(self, u):
+        return self.targets[self.offsets[u]:self.offsets[u+1]]
+
+    def reachable(self, roots): # flags the nodes reachable from the root nodes
+        reached = bytearray(self.num_nodes)
+        pending = [u for u in roots]
+        for u in pending: reached[u] = 1
+        offsets = self.offsets
+        targets = self.targets
+        while len(pending) > 0:
+            u = pending.pop()
+            for k in range(offsets[u], offsets[u+1]):
+                v = targets[k]
+                if not reached[v]:
+                    reached[v] = 1
+                    pending.append(v)
+        return reached
+
+    def prune(self, roots):
+        # drops the nodes (and their edges) not reachable from the root nodes; the remaining nodes keep their
+        # relative order and so does every successor list. Returns the pruned graph
+        keep = self.reachable(roots)
+        index = [-1]*self.num_nodes
+        addrs = []
+        block_ids = []
+        for u in range(self.num_nodes):
+            if keep[u]:
+                index[u] = len(addrs)
+                addrs.append(self.addrs[u])
+                block_ids.append(self.block_ids[u])
+        offsets = array('q', [0])
+        targets = array('q')
+        for u in range(self.num_nodes):
+            if keep[u]:
+                targets.extend(index[v] for v in self.successors(u)) # successors of a reachable node are reachable
+                offsets.append(len(targets))
+        addr_index = {}
+        for u,addr in enumerate(addrs):
+            addr_index.setdefault(addr, u)
+        return CSRGraph(addrs, block_ids, offsets, targets, addr_index)
+
+    def label_order(self):
+        # The numeric labels used by ZEKRA: nodes are labeled in order of first appearance when listing every
+        # node followed by its successors, i.e., the labeling networkx produced when rebuilding the graph from
+        # its adjacency list and converting its node labels to integers.
+        # Returns (order, labels) with order[label] = node and labels[node] = label
+        labels = [-1]*self.num_nodes
+        order = []
+        offsets = self.offsets
+        targets = self.targets
+        for u in range(self.num_nodes):
+            if labels[u] < 0:
+                labels[u] = len(order)
+                order.append(u)
+            for k in range(offsets[u], offsets[u+1]):
+                v = targets[k]
+                if labels[v] < 0:
+                    labels[v] = len(order)
+                    order.append(v)
+        return order, labels
+
+    def label_translator(self, labels):
+        # hex(block id) -> label, ordered by label
+        translator = {}
+        for u in range(self.num_nodes):
+            translator[hex(self.block_ids[u])] = labels[u]
+        return {k: translator[k] for k in sorted(translator, key=translator.get)}
+
+    def numified_adjlist(self, order, labels):
+        adjlist = []
+        for label,u in enumerate(order):
+            adjlist.append(' '.join([str(label)] + [str(labels[v]) for v in self.successors(u)]))
+        return adjlist
+
+    def adjlist(self):
+        adjlist = []
+        for u in range(self.num_nodes):
+            adjlist.append(' '.join([hex(self.addrs[u])] + [hex(self.addrs[v]) for v in self.successors(u)]))
+        return adjlist
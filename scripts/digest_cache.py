@@ -0,0 +1,88 @@
+#################################
+## Author: Heini Bergsson Debes
+#################################
+# Content-addressed on-disk cache for the circuit input formatter: entries hold the encoded
+# adjacency list / translator and the sponge state right before their nonces are hashed (so any
+# nonce costs one call to Poseidon), keyed by the hash of the input file plus every parameter that
+# influences the encoding (bitwidths, levels and padding, but not the nonces).
+# The extractor also stores files (compiled binaries) and CFGs in it.
+# The cache is bounded in size; the least recently used entries are evicted first.
+
+import os, json, shutil, hashlib, tempfile
+
+DEFAULT_CACHE_SIZE=256*1024*1024 # bytes
+
+def file_digest(filename):
+    h=hashlib.sha256()
+    with open(filename, 'rb') as file_in:
+        for block in iter(lambda: file_in.read(1<<20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+class DigestCache:
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_SIZE):
+        self.cache_dir=cache_dir
+        self.max_bytes=max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, kind, **params):
+        description=json.dumps({'kind':kind, 'params':params}, sort_keys=True)
+        return '%s-%s'%(kind, hashlib.sha256(description.encode()).hexdigest())
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, '%s.json'%key)
+
+    def file_path(self, key):
+        return os.path.join(self.cache_dir, '%s.bin'%key)
+
+    def get(self, key):
+        filename=self.path(key)
+        try:
+            with open(filename, 'r') as file_in:
+                entry=json.load(file_in)
+        except (OSError, ValueError):
+            return None
+        os.utime(filename) # mark as recently used
+        return entry
+
+    def put(self, key, entry):
+        fd,tmp_filename=tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as file_out:
+            json.dump(entry, file_out)
+        os.replace(tmp_filename, self.path(key)) # atomic, concurrent writers of the same key are harmless
+        self.evict()
+
+    def get_file(self, key, filename): # copies the cached file to filename, if present
+        cached_filename=self.file_path(key)
+        try:
+            shutil.copy2(cached_filename, filename)
+        except OSError:
+            return False
+        os.utime(cached_filename) # mark as recently used
+        return True
+
+    def put_file(self, key, filename):
+        fd,tmp_filename=tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        os.close(fd)
+        shutil.copy2(filename, tmp_filename)
+        os.replace(tmp_filename, self.file_path(key))
+        self.evict()
+
+    def evict(self):
+        entries=[]
+        total=0
+        for f in os.scandir(self.cache_dir):
+            if not f.name.endswith(('.json', '.bin')): continue
+            try:
+                stat=f.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, f.path))
+            total+=stat.st_size
+        for mtime,size,filename in sorted(entries):
+            if total<=self.max_bytes: break
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            total-=size
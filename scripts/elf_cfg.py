@@ -0,0 +1,228 @@
+#################################
+## Author: Heini Bergsson Debes
+#################################
+# Lightweight CFG backend for the extractor built on pyelftools and capstone instead of angr's CFGFast.
+# Code is discovered by recursive descent from the entry point and the function symbols, followed by a scan
+# of the gaps the descent did not reach, and split into basic blocks the way CFGFast (normalize=True) does:
+# a block ends at every jump, call and return, at string instructions with a rep prefix (which loop on
+# themselves), and wherever another block jumps to. Calls get an edge to the callee plus one to the return
+# site, unless the callee never returns (no-return imports such as exit or abort, and the functions that can
+# only end in calls to them).
+# Indirect jumps/calls are not resolved and imported functions (SimProcedures in angr) get no nodes, so the
+# graph covers the part of angr's CFG that lies inside the binary; the extractor adds whatever the recorded
+# execution path takes on top of that anyway. Like VEX, blocks are capped at 99 instructions, but VEX may also
+# end a long block early because of the size of its IR, which is not modeled here.
+# Addresses match angr's: position independent executables are mapped at PIE_BASE like cle does.
+
+try:
+    import capstone
+    from capstone import x86_const
+    from elftools.elf.elffile import ELFFile
+    from elftools.elf.relocation import RelocationSection
+except ImportError:
+    capstone = None
+
+import heapq
+from csr_graph import GraphBuilder
+
+PIE_BASE = 0x400000
+MAX_BLOCK_INSTRUCTIONS = 99
+NO_RETURN = {'exit', '_exit', '_Exit', 'abort', '__assert_fail', '__stack_chk_fail', '__libc_start_main', 'longjmp', '_longjmp', 'siglongjmp', '__longjmp_chk', 'err', 'errx', 'verr', 'verrx', 'pthread_exit', '__cxa_throw', '__cxa_rethrow', '_Unwind_Resume'}
+
+def version():
+    return capstone.__version__ if capstone is not None else None
+
+class ElfCode:
+    def __init__(self, filename):
+        if capstone is None:
+            raise Exception('The capstone CFG backend requires the capstone and pyelftools packages (pip3 install capstone pyelftools)')
+        with open(filename, 'rb') as file_in:
+            elf = ELFFile(file_in)
+            machine = elf['e_machine']
+            if machine == 'EM_X86_64':
+                self.md = capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_64)
+            elif machine == 'EM_386':
+                self.md = capstone.Cs(capstone.CS_ARCH_X86, capstone.CS_MODE_32)
+            else:
+                raise Exception('The capstone CFG backend does not support %s binaries' %machine)
+            self.md.detail = True
+            self.base = PIE_BASE if elf['e_type'] == 'ET_DYN' else 0
+            self.entry = elf['e_entry'] + self.base
+            self.sections = [] # (start, end, data) of the executable sections
+            for section in elf.iter_sections():
+                if section['sh_flags'] & 0x4 and section['sh_type'] != 'SHT_NOBITS': # SHF_EXECINSTR
+                    start = section['sh_addr'] + self.base
+                    self.sections.append((start, start + section['sh_size'], section.data()))
+            self.functions = set()
+            for section in elf.iter_sections():
+                if section['sh_type'] not in ('SHT_SYMTAB', 'SHT_DYNSYM'): continue
+                for symbol in section.iter_symbols():
+                    if symbol['st_info']['type'] == 'STT_FUNC' and symbol['st_value'] != 0 and self.contains(symbol['st_value'] + self.base):
+                        self.functions.add(symbol['st_value'] + self.base)
+            self.imports = {} # GOT slot -> name of the imported function
+            for section in elf.iter_sections():
+                if not isinstance(section, RelocationSection) or section['sh_link'] == 0: continue
+                symbols = elf.get_section(section['sh_link'])
+                for relocation in section.iter_relocations():
+                    if relocation['r_info_sym'] == 0: continue
+                    name = symbols.get_symbol(relocation['r_info_sym']).name.split('@')[0]
+                    self.imports[relocation['r_offset'] + self.base] = name
+        self.decoded = {}
+
+    def contains(self, addr):
+        return any(start <= addr < end for start,end,data in self.sections)
+
+    def instruction(self, addr): # (size, kind, target) of the instruction at addr, or None if it cannot be decoded
+        if addr in self.decoded: return self.decoded[addr]
+        insn = None
+        for start,end,data in self.sections:
+            if start <= addr < end:
+                insn = next(self.md.disasm(data[addr-start:addr-start+16], addr, count=1), None)
+                break
+        self.decoded[addr] = None if insn is None else (insn.size,) + self.classify(insn)
+        return self.decoded[addr]
+
+    def classify(self, insn):
+        # kind is one of: ret, halt, call, icall, jump, ijump, cond, rep, None (any other instruction)
+        # target is the (immediate) destination, or the imported function's name for jumps/calls through the GOT
+        operand = insn.operands[0] if len(insn.operands) > 0 else None
+        target = None
+        if operand is not None and operand.type == x86_const.X86_OP_IMM:
+            target = operand.imm
+        elif operand is not None and operand.type == x86_const.X86_OP_MEM and operand.mem.base == x86_const.X86_REG_RIP and operand.mem.index == 0:
+            target = self.imports.get(insn.address + insn.size + operand.mem.disp)
+        elif operand is not None and operand.type == x86_const.X86_OP_MEM and operand.mem.base == 0 and operand.mem.index == 0:
+            target = self.imports.get(operand.mem.disp)
+        if insn.group(capstone.CS_GRP_RET) or insn.group(capstone.CS_GRP_IRET):
+            return ('ret', None)
+        if insn.id in (x86_const.X86_INS_HLT, x86_const.X86_INS_UD2):
+            return ('halt', None)
+        if insn.group(capstone.CS_GRP_CALL):
+            return ('call', target) if isinstance(target, int) else ('icall', target)
+        if insn.group(capstone.CS_GRP_JUMP):
+            if insn.id in (x86_const.X86_INS_JMP, x86_const.X86_INS_LJMP):
+                return ('jump', target) if isinstance(target, int) else ('ijump', target)
+            return ('cond', target)
+        if insn.mnemonic.split(' ')[0] in ('rep', 'repe', 'repne', 'repz', 'repnz'):
+            return ('rep', insn.address)
+        return (None, None)
+
+def discover(code):
+    # recursive descent from the entry point and the function symbols, followed by a scan of whatever the
+    # descent did not reach (padding, the PLT header, code after indirect jumps), like CFGFast's complete scan.
+    # Returns the block leaders and the function entries
+    leaders = {code.entry} | code.functions
+    functions = set(leaders)
+    descend(code, sorted(leaders), leaders, functions)
+    for start,end,data in code.sections:
+        addr = start
+        while addr < end:
+            if addr not in code.decoded:
+                leaders.add(addr)
+                descend(code, [addr], leaders, functions)
+            instruction = code.decoded[addr]
+            addr += 1 if instruction is None else instruction[0]
+    return leaders, functions
+
+def descend(code, pending, leaders, functions):
+    while len(pending) > 0:
+        addr = pending.pop()
+        while addr not in code.decoded:
+            instruction = code.instruction(addr)
+            if instruction is None: break
+            size,kind,target = instruction
+            if kind in ('call', 'jump', 'cond') and isinstance(target, int) and code.contains(target):
+                leaders.add(target)
+                pending.append(target)
+                if kind == 'call': functions.add(target)
+            if kind in ('call', 'icall', 'cond', 'rep'):
+                leaders.add(addr + size) # the block ends here
+            if kind == 'rep':
+                leaders.add(addr)
+            if kind in ('ret', 'halt', 'jump', 'ijump'): break
+            addr += size
+
+def split_blocks(code, leaders):
+    # block addr -> (last instruction addr, its size, kind, target, addr after the block)
+    blocks = {}
+    pending = sorted(leaders)
+    heapq.heapify(pending)
+    while len(pending) > 0:
+        leader = heapq.heappop(pending)
+        if leader in blocks or code.decoded.get(leader) is None: continue
+        addr = leader
+        num_instructions = 1
+        while True:
+            size,kind,target = code.decoded[addr]
+            end = addr + size
+            if kind is not None or end in leaders or code.decoded.get(end) is None: break
+            if num_instructions == MAX_BLOCK_INSTRUCTIONS: # VEX does not lift longer blocks, the rest is a block of its own
+                leaders.add(end)
+                heapq.heappush(pending, end)
+                break
+            addr = end
+            num_instructions += 1
+        blocks[leader] = (addr, size, kind, target, end)
+    return blocks
+
+def callee_returns(kind, target, functions, returning):
+    if isinstance(target, str): return target not in NO_RETURN # imported function
+    if kind == 'icall' or target not in functions: return True # unresolved
+    return target in returning
+
+def find_returning(code, blocks, functions):
+    # fixed point over the functions that can return: a function returns if a ret (or an unresolved indirect
+    # jump) is reachable from its entry, following return sites only after calls to returning functions
+    returning = set()
+    def plt_stub_returns(function):
+        block = blocks.get(function)
+        return block is not None and block[2] == 'ijump' and isinstance(block[3], str) and block[3] not in NO_RETURN
+    changed = True
+    while changed:
+        changed = False
+        for function in functions:
+            if function in returning or function not in blocks: continue
+            if plt_stub_returns(function):
+                returning.add(function)
+                changed = True
+                continue
+            seen = {function}
+            pending = [function]
+            while len(pending) > 0:
+                last,size,kind,target,end = blocks[pending.pop()]
+                successors = []
+                if kind == 'ret' or (kind == 'ijump' and not isinstance(target, str)) or (kind == 'jump' and target != function and target in functions and target in returning):
+                    returning.add(function)
+                    changed = True
+                    break
+                if kind == 'jump' and target not in functions: successors.append(target)
+                if kind in ('cond', 'rep'): successors.extend([target, end])
+                if kind in ('call', 'icall') and callee_returns(kind, target, functions, returning): successors.append(end)
+                if kind is None: successors.append(end)
+                for successor in successors:
+                    if successor in blocks and successor not in seen:
+                        seen.add(successor)
+                        pending.append(successor)
+    return returning
+
+def build_graph(filename):
+    code = ElfCode(filename)
+    leaders, functions = discover(code)
+    blocks = split_blocks(code, leaders)
+    returning = find_returning(code, blocks, functions)
+    graph = GraphBuilder()
+    for addr in sorted(blocks):
+        graph.add_node(addr)
+    for addr in sorted(blocks):
+        last,size,kind,target,end = blocks[addr]
+        successors = []
+        if kind in ('jump', 'cond', 'call', 'rep') and isinstance(target, int):
+            successors.append(target)
+        if kind in ('cond', 'rep', None):
+            successors.append(end)
+        elif kind in ('call', 'icall') and callee_returns(kind, target, functions, returning):
+            successors.append(end) # return site
+        for successor in successors:
+            if successor in blocks:
+                graph.add_edge(graph.addr_index[addr], graph.addr_index[successor])
+    return graph
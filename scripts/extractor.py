@@ -7,133 +7,266 @@
 # (2) label translator (raw node label -> numified label),
 # (3) example execution path (with node/BBL labels already converted into the corresponsing numified version)
 
-import os, re, sys, getopt
+import os, sys, getopt, time, traceback, random, heapq, bisect
 import subprocess
+import multiprocessing
+from multiprocessing.connection import wait
 import angr
-import networkx as nx
 import statistics
 import logging
-from angr.knowledge_plugins.cfg import CFGNode
-from circuit_input_formatter import format_adjlist, encode_adjlist
+from circuit_input_formatter import format_adjlist, encode_adjlist, BUCKET_RADICES
+from digest_cache import DigestCache, DEFAULT_CACHE_SIZE, file_digest
+from csr_graph import GraphBuilder
+from label_optimizer import optimize_labels, adjlist_levels, adjlist_cost, STRATEGIES
+import elf_cfg
+from trace_recorder import TransitionBuffer, TraceRecorder, UnicornTraceRecorder, load_checkpoint, TRANSIENT_FAILURES
+from pipeline import ExtractionResult, ExecutionPath
+
+COMPILER='gcc'
+COMPILER_FLAGS=['-Os', '-g0', '-lm', '-fno-optimize-sibling-calls']
+CFG_OPTIONS={'normalize': True, 'resolve_indirect_jumps': True}
 
 def compile(c_filenames, out_file):
-    cmd = ['gcc', '-o', out_file]
+    cmd = [COMPILER, '-o', out_file]
     cmd.extend(c_filenames)
-    cmd.extend(['-Os', '-g0', '-lm', '-fno-optimize-sibling-calls'])
+    cmd.extend(COMPILER_FLAGS)
     print(' '.join(cmd))
     subprocess.run(cmd, check=True)
 
+def build(foldername, c_filenames, out_file, cache=None):
+    # compiles the application, unless a binary built from the same sources (and headers) with the same compiler and flags is cached
+    if cache:
+        sources = {f.name: file_digest(f.path) for f in os.scandir(foldername) if f.name.endswith(('.c', '.h'))}
+        compiler = subprocess.run([COMPILER, '--version'], capture_output=True, text=True).stdout.split('\n')[0]
+        build_cache_key = cache.key('build', sources=sources, compiler=compiler, flags=COMPILER_FLAGS)
+        if cache.get_file(build_cache_key, out_file):
+            print('Found the compiled application in the cache (%s)' %build_cache_key)
+            return
+    compile(c_filenames, out_file)
+    if cache:
+        cache.put_file(build_cache_key, out_file)
+
 def get_cfg(proj):
-    cfg = proj.analyses.CFGFast(normalize=True, show_progressbar=True, resolve_indirect_jumps=True)
+    cfg = proj.analyses.CFGFast(show_progressbar=True, **CFG_OPTIONS)
     return cfg
 
-def get_execution_path(proj, cfg):
-    initial_state = proj.factory.entry_state()
+def get_graph(proj, out_file, cache=None, backend='angr'):
+    # the CFG (its nodes, edges and block addresses) only depends on the binary, the backend (and its version) and the CFG options
+    if cache:
+        if backend=='angr': cfg_cache_key = cache.key('cfg', binary=file_digest(out_file), angr=angr.__version__, options=CFG_OPTIONS)
+        else: cfg_cache_key = cache.key('cfg', binary=file_digest(out_file), capstone=elf_cfg.version())
+        cached = cache.get(cfg_cache_key)
+        if cached:
+            print('Found the CFG in the cache (%s)' %cfg_cache_key)
+            return GraphBuilder.from_dict(cached)
+    if backend=='angr':
+        graph = GraphBuilder.from_cfg(get_cfg(proj)) # extract CFG
+    else:
+        graph = elf_cfg.build_graph(out_file)
+    if cache:
+        cache.put(cfg_cache_key, graph.to_dict())
+    return graph
+
+def cross_check_cfg(proj, out_file, max_listed=20):
+    # compares the nodes and edges (by address) found by both backends; angr's nodes outside the binary
+    # (SimProcedures, unresolvable targets) have no counterpart in the capstone backend and are ignored
+    main_object = proj.loader.main_object
+    def inside(addr): return main_object.min_addr <= addr <= main_object.max_addr
+    def nodes_and_edges(graph):
+        nodes = {addr for addr in graph.addrs if inside(addr)}
+        edges = {(graph.addrs[u],graph.addrs[v]) for u,successors in enumerate(graph.successors) for v in successors if inside(graph.addrs[u]) and inside(graph.addrs[v])}
+        return nodes, edges
+    angr_nodes, angr_edges = nodes_and_edges(get_graph(proj, out_file, backend='angr'))
+    capstone_nodes, capstone_edges = nodes_and_edges(get_graph(proj, out_file, backend='capstone'))
+    def listed(items):
+        items = sorted(items)
+        text = ' '.join(('%s' %hex(item)) if isinstance(item, int) else '%s->%s' %(hex(item[0]), hex(item[1])) for item in items[:max_listed])
+        return text + (' ...' if len(items) > max_listed else '')
+    output  = 'CFG cross-check (angr vs. capstone backend, nodes inside the binary only):\n'
+    output += 'Nodes: %d (angr), %d (capstone), %d in common\n' %(len(angr_nodes), len(capstone_nodes), len(angr_nodes & capstone_nodes))
+    output += 'Edges: %d (angr), %d (capstone), %d in common\n' %(len(angr_edges), len(capstone_edges), len(angr_edges & capstone_edges))
+    output += 'Nodes only found by angr: %s\n' %listed(angr_nodes - capstone_nodes)
+    output += 'Nodes only found by capstone: %s\n' %listed(capstone_nodes - angr_nodes)
+    output += 'Edges only found by angr: %s\n' %listed(angr_edges - capstone_edges)
+    output += 'Edges only found by capstone: %s\n' %listed(capstone_edges - angr_edges)
+    return output
+
+def get_execution_path(proj, trace_filename=None, use_unicorn=False, checkpoint_filename=None, checkpoint_interval=None, resume=False):
+    transitions = TransitionBuffer(trace_filename) # streamed to trace_filename (if given) as it is recorded
+    if use_unicorn: # the recorded run is concrete, so it can be executed natively rather than lifted block by block
+        initial_state = proj.factory.entry_state(add_options=angr.options.unicorn)
+        recorder = UnicornTraceRecorder(proj, transitions, checkpoint_filename=checkpoint_filename, checkpoint_interval=checkpoint_interval)
+    else:
+        initial_state = proj.factory.entry_state()
+        recorder = TraceRecorder(transitions, checkpoint_filename=checkpoint_filename, checkpoint_interval=checkpoint_interval)
+    if resume and checkpoint_filename and os.path.exists(checkpoint_filename):
+        initial_state = recorder.resume(load_checkpoint(checkpoint_filename, proj))
+        transitions = recorder.transitions
+        print('[+] Resuming execution path recording from %s (%s steps, %s transitions)' %(checkpoint_filename, recorder.steps, len(transitions)))
     simgr = proj.factory.simgr(initial_state)
-    transitions  = []
-    initial_node = 0
-    final_node   = 0
-    end_state    = None
+    simgr.use_technique(recorder)
     try:
-        first_step = True
-        while True:
-            simgr.step()
-            if first_step:
-                initial_node=list(simgr.active[0].history.recent_bbl_addrs)[-1]
-                first_step=False
-            if len(simgr.active)==1:
-                jumpkind=list(simgr.active[0].history.jumpkinds)[-1]
-                if jumpkind=='Ijk_Call':
-                    transitions.append({
-                        'jumpkind':'call', 
-                        'dst':simgr.active[0].history.jump_target._model_concrete.value, 
-                        'ret':simgr.active[0].callstack.ret_addr})
-                elif jumpkind=='Ijk_Ret':
-                    transitions.append({
-                        'jumpkind':'ret', 
-                        'dst':simgr.active[0].history.jump_target._model_concrete.value, 
-                        'ret':None})
-                elif jumpkind=='Ijk_Boring':
-                    transitions.append({
-                        'jumpkind':'jump', 
-                        'dst':simgr.active[0].history.jump_target._model_concrete.value, 
-                        'ret':None})
-                elif jumpkind=='Ijk_Exit':
-                    end_state='reached an exit'
-                    break
-                else:
-                    print("[-] Encountered currently unsupported jumpkind = %s in execution path" %jumpkind)
-                    exit(1)
-            else:
-                if len(simgr.deadended)==1: end_state='done'
-                elif len(simgr.errored)==1: end_state='the error \'%s\' was raised' %simgr.errored[0].error
-                else: end_state='something happened'
-                break
-    except Exception as e:
+        simgr.run()
+    except TRANSIENT_FAILURES as e:
+        print('%s: %s' %(type(e).__name__, e))
+        if recorder.save_checkpoint(): # keep the work done so far
+            print('[-] Saved checkpoint after %s steps to %s (rerun with --resume to continue from there)' %(recorder.steps, checkpoint_filename))
+        exit(1)
+    except Exception as e: # deterministic, resuming would fail the same way
         print(e)
         exit(1)
-
-    # add missing nodes and edges
-    state=initial_node
-    for transition in transitions:
-        if transition['jumpkind']=='call':
-            if len(cfg.get_all_nodes(transition['ret']))==0: # return node does not exist in the current CFG
-                node=CFGNode(transition['ret'], 0, cfg)
-                cfg.graph.add_node(node) # just add it to the CFG
-        if len(cfg.get_all_nodes(transition['dst']))==0: # destination node does not exist in the current CFG
-            node=CFGNode(transition['dst'], 0, cfg)
-            cfg.graph.add_node(node) # just add it to the CFG
-        edge=(cfg.get_all_nodes(state)[0], cfg.get_all_nodes(transition['dst'])[0])
-        cfg.graph.add_edge(edge[0],edge[1]) # adds edge if it doesn't already exist
-        state=transition['dst']
-
-    final_node=transitions[-1]['dst']
-    path={'transitions':transitions, 'initial_node':initial_node, 'final_node':final_node}
-    return end_state,cfg,path
-
-# function code taken from https://stackoverflow.com/a/51827284
-def find_repeated_sequences(s):
-    match = re.findall(r'((\b.+?\b)(?:\s\2)+)', s)
-    return [(m[1], int((len(m[0]) + 1) / (len(m[1]) + 1))) for m in match]
-
-def generate_label_translator(labeled_cfg, raw_cfg, optimized_labeled_cfg):
-    label_translator_optimized={}
-    for labeled_node, raw_node in zip(labeled_cfg.nodes(), raw_cfg.nodes()):
-        optimized_label=None
-        for j in optimized_labeled_cfg.nodes():
-            if str(labeled_node)==optimized_labeled_cfg._node[j]['old_label']:
-                optimized_label=j
-                break
-        if optimized_label==None: raise Exception('Something happened.')
-        label_translator_optimized[hex(raw_node.block_id)]=optimized_label
-
-    label_translator={}
-    for k in sorted(label_translator_optimized, key=label_translator_optimized.get, reverse=False):
-        label_translator[k]=label_translator_optimized[k]
-
-    return label_translator
+    transitions.flush()
+    if checkpoint_filename and os.path.exists(checkpoint_filename):
+        os.remove(checkpoint_filename) # the recording is complete
+    initial_node = recorder.initial_node
+    end_state    = recorder.end_state
+
+    final_node=transitions.last['dst']
+    # the rest of the extraction (CFG fix-up, compression, output) works on the whole path, so a streamed trace is read back into memory here
+    path={'transitions':list(transitions), 'initial_node':initial_node, 'final_node':final_node}
+    return end_state,transitions,path
+
+def lce_structure(tokens):
+    # prefix hashes (mod the Mersenne prime 2^61-1) answering longest-common-extension queries in O(log l)
+    mod=(1<<61)-1
+    base=random.Random(len(tokens)).randrange(1<<20, mod-1)
+    n=len(tokens)
+    H=[0]*(n+1)
+    P=[1]*(n+1)
+    for i,token in enumerate(tokens):
+        H[i+1]=(H[i]*base+token+1)%mod
+        P[i+1]=P[i]*base%mod
+    def equal(i, j, length): # tokens[i:i+length]==tokens[j:j+length]
+        return (H[i+length]-H[i]*P[length]-H[j+length]+H[j]*P[length])%mod==0
+    def extend(i, j, limit, step): # longest l<=limit such that tokens i,i+step,... match tokens j,j+step,... (galloping search)
+        if limit==0 or tokens[i]!=tokens[j]: return 0
+        matches=(lambda l: equal(i,j,l)) if step>0 else (lambda l: equal(i-l+1,j-l+1,l))
+        lo=1
+        while lo*2<=limit and matches(lo*2): lo*=2
+        hi=min(lo*2,limit+1) # matches(lo) holds, matches(hi) does not (or hi>limit)
+        while hi-lo>1:
+            mid=(lo+hi)//2
+            if matches(mid): lo=mid
+            else: hi=mid
+        return lo
+    def lcp(i, j): # longest common prefix of the suffixes starting at i and j
+        return extend(i, j, n-max(i,j), 1)
+    def lcs(i, j): # longest common suffix of the prefixes ending at (and including) i and j
+        return extend(i, j, min(i,j)+1, -1)
+    return lcp, lcs
+
+def find_runs(tokens):
+    # all maximal repetitions (runs) as (start, end, smallest period) in O(n log n) following the runs theorem
+    # (Bannai et al.): every run has a Lyndon root, w.r.t. one of the two orders of the alphabet, which is the
+    # longest Lyndon word starting at its position, so it suffices to extend those words to the left and right
+    n=len(tokens)
+    lcp,lcs=lce_structure(tokens)
+    runs=set()
+    for sign in (1,-1):
+        def smaller(i, j): # suffix i < suffix j (a proper prefix is smaller)
+            l=lcp(i,j)
+            if i+l==n: return True
+            if j+l==n: return False
+            return sign*tokens[i+l]<sign*tokens[j+l]
+        next_smaller=[n]*n # next smaller suffix, i.e., the end of the longest Lyndon word starting at i
+        for i in range(n-1,-1,-1):
+            j=i+1
+            while j<n and not smaller(j,i): j=next_smaller[j]
+            next_smaller[i]=j
+        for i in range(n):
+            j=next_smaller[i]
+            if j>=n: continue
+            period=j-i
+            right=lcp(i,j)
+            left=lcs(i-1,j-1) if i>0 else 0
+            if left+right>=period:
+                runs.add((i-left,j+right,period))
+    return sorted(runs)
+
+def prefix_squares(tokens, extensions, lcs):
+    # the shortest period of the squares starting at each position whose second half does not end with the last
+    # token of the first half but with one that extends it (see compress)
+    extended={} # token -> the tokens it extends
+    for token,longer_tokens in extensions.items():
+        for longer in longer_tokens: extended.setdefault(longer, []).append(token)
+    occurrences={}
+    shortest={}
+    for j,token in enumerate(tokens):
+        for shorter in extended.get(token, []):
+            positions=occurrences.get(shorter, [])
+            for k in positions[bisect.bisect_left(positions, j//2):]: # the square tokens[2k-j+1:j+1] starts at 0 or later
+                period=j-k
+                if period>1 and lcs(k-1,j-1)<period-1: continue
+                start=2*k-j+1
+                if start not in shortest or period<shortest[start]: shortest[start]=period
+        occurrences.setdefault(token, []).append(j)
+    return shortest
+
+def find_repeated_sequences(tokens, extensions=None):
+    # scans the tokens from left to right and, at each position, takes the shortest consecutively repeated
+    # sequence (if any) with all of its consecutive repetitions. Returns (start, length, repetitions) tuples.
+    # With extensions (token -> the tokens that extend it), the last repetition may also end with a token that
+    # extends the last token of the sequence, as when matching the transitions as text (see compress)
+    runs=find_runs(tokens)
+    if extensions:
+        lcp,lcs=lce_structure(tokens)
+        prefix=prefix_squares(tokens, extensions, lcs)
+    repetitions=[]
+    active=[] # heap of (period, end) of the runs started so far
+    next_run=0
+    i=0
+    while i<len(tokens):
+        while next_run<len(runs) and runs[next_run][0]<=i:
+            start,end,period=runs[next_run]
+            heapq.heappush(active, (period,end))
+            next_run+=1
+        while len(active)>0 and active[0][1]<i+2*active[0][0]: # no longer repeats starting at i
+            heapq.heappop(active)
+        period=None
+        if len(active)>0:
+            period,end=active[0]
+            count=(end-i)//period
+            j=i+count*period
+            if extensions and j+period<=len(tokens) and tokens[j+period-1] in extensions.get(tokens[i+period-1], ()) and (period==1 or lcp(i,j)>=period-1):
+                count+=1
+        if extensions and i in prefix and (period is None or prefix[i]<period):
+            period,count=prefix[i],2
+        if period is not None:
+            repetitions.append((i,period,count))
+            i+=period*count
+        else:
+            i+=1
+    return repetitions
 
 def compress(path):
-    transitions_merged_str = ''
+    # encode each distinct transition as an integer so loops can be found in (near) linear time. The output is
+    # exactly that of matching the transitions as text ('jumpkind-dst-ret ...') with a regex and removing every
+    # repetition found from that text with str.replace: the last repetition of a sequence may end inside a
+    # transition that extends the sequence's last transition as text (e.g., call-5-6 and call-5-67), and each
+    # repetition is removed (in the order found) wherever it still occurs as often, not only where it was found
     separator = '-'
-    for transition in path['transitions']:
-        transition = '%s%s%s%s%s' %(transition['jumpkind'], separator, transition['dst'], separator, transition['ret'])
-        transitions_merged_str += '%s ' %transition
-
-    repetitions = find_repeated_sequences(transitions_merged_str)
-
-    # compress the execution path (remove consecutively repeating BBL sequences, i.e., "loops")
-    for repetition in repetitions:
-        sequence = '%s '%repetition[0] * int(repetition[1])
-        transitions_merged_str = transitions_merged_str.replace(sequence, '%s '%repetition[0])
-    # recreate the compressed execution path
-    tmp = []
-    for transition in transitions_merged_str.strip().split(' '):
-        jumpkind,dst,ret = transition.split(separator)
-        tmp.append({
-            'jumpkind': jumpkind, 
-            'dst': dst, 
-            'ret': ret})
+    transitions = [(str(transition['jumpkind']), str(transition['dst']), str(transition['ret'])) for transition in path['transitions']]
+    ids = {}
+    tokens = [ids.setdefault(transition, len(ids)) for transition in transitions]
+    texts = sorted((separator.join(transition), token) for transition,token in ids.items())
+    extensions = {} # token -> the tokens whose text extends its text
+    for k,(text,token) in enumerate(texts):
+        j = k+1
+        while j < len(texts) and texts[j][0].startswith(text): # sorted, so the extensions follow the text
+            extensions.setdefault(token, set()).add(texts[j][1])
+            j += 1
+
+    # compress the execution path (remove consecutively repeating BBL sequences, i.e., "loops") with one
+    # character per transition (at most 0x110000 distinct ones), so that str.replace only ever matches whole transitions
+    encoded = ''.join(chr(token) for token in tokens)
+    compressed = encoded
+    repetitions = []
+    for start,length,count in find_repeated_sequences(tokens, extensions):
+        sequence = encoded[start:start+length]
+        compressed = compressed.replace(sequence*count, sequence)
+        repetitions.append((' '.join(separator.join(transition) for transition in transitions[start:start+length]), count))
+    distinct = list(ids)
+    tmp = [dict(zip(('jumpkind', 'dst', 'ret'), distinct[ord(token)])) for token in compressed]
 
     sequence_lengths       = [] # list of sequence lengths
     sequence_repetitions   = [] # list of sequence repetitions
@@ -171,6 +304,24 @@ def compress(path):
     path['transitions'] = tmp
     return path, stats
 
+def fold(path):
+    # compresses the execution path until no consecutively repeated sequences remain, which also folds nested
+    # loops: once the inner loops have been compressed, the iterations of the enclosing loop become identical.
+    # Every fold removes repeated copies of a sequence that starts and ends at the same node, so the folded
+    # path is still a valid path through the CFG. Folding stops once a compression no longer shortens the path
+    # (a repetition that ends inside an extension of its last transition may not remove anything, see compress)
+    path, stats = compress(path)
+    folds = []
+    pre_fold_length = stats['execution_path_length_post_compression']
+    while True:
+        path, fold_stats = compress(path)
+        if fold_stats['execution_path_length_post_compression']==pre_fold_length: break
+        folds.append((pre_fold_length, fold_stats['execution_path_length_post_compression'], fold_stats['number_of_repetitions']))
+        pre_fold_length = fold_stats['execution_path_length_post_compression']
+    stats['folds'] = folds
+    stats['execution_path_length_post_compression'] = len(path['transitions'])
+    return path, stats
+
 def hexify_labels(path):
     path['initial_node'] = hex(path['initial_node'])
     path['final_node']   = hex(path['final_node'])
@@ -193,27 +344,6 @@ def numify_labels(path, node_label_translator):
         i+=1
     return path
 
-def write_execution_path(filename, path):
-    with open(filename, 'w') as out:
-        out.write('initial_node=%s final_node=%s\n' %(path['initial_node'], path['final_node']))
-        for transition in path['transitions']:
-            if transition['jumpkind'] == 'call':
-                out.write('%s %s %s\n' %(transition['jumpkind'], transition['dst'], transition['ret']))
-            else:
-                out.write('%s %s\n' %(transition['jumpkind'], transition['dst']))
-
-def get_addr(label, cfg):
-    addr=None
-    for node in list(cfg.graph.nodes()):
-        if str(node)==label:
-            addr=node.addr
-            break
-    return addr
-
-def write_adjlist(filename, adjlist):
-    with open(filename, 'w') as out:
-        for node in adjlist: out.write(node+'\n')
-
 def valid_execution_path(execution_path, adjlist): # checks if the execution path can traverse in the forward direction
     state = execution_path['initial_node']
     for transition in execution_path['transitions']:
@@ -227,20 +357,6 @@ def valid_execution_path(execution_path, adjlist): # checks if the execution pat
             return False
     return str(state) == str(execution_path['final_node'])
 
-def get_adjlist(cfg):
-    adjlist_labels=list(nx.generate_adjlist(cfg.graph))
-    adjlist=[]
-    for node in adjlist_labels:
-        addrs=''
-        nodes=node.split('>')
-        for _node in nodes:
-            if _node=='': continue
-            _node=str(_node).lstrip()+'>'
-            addr=get_addr(_node,cfg)
-            addrs+='%s '%hex(addr)
-        adjlist.append(addrs.rstrip())
-    return adjlist
-
 def find_c_file(foldername):
     c_files = []
     for file in os.listdir(os.fsencode(foldername)):
@@ -249,66 +365,104 @@ def find_c_file(foldername):
         c_files.append(foldername + '/' + filename)
     return c_files
 
-def run(application_foldername):
+def get_prune_roots(proj, graph, initial_node, transitions, root_names=None):
+    # the nodes reachable from the entry (or from the given addresses/symbols) are kept. The initial node of the
+    # execution path and the return nodes of its calls (which need not have any incoming edges, e.g., the 0x0
+    # returned to by the outermost call) are always roots, so the path stays valid according to the pruned adjlist
+    roots = [proj.entry] if not root_names else []
+    for name in root_names or []:
+        try:
+            roots.append(int(name, 0))
+        except ValueError:
+            symbol = proj.loader.find_symbol(name)
+            if symbol is None:
+                raise Exception('[-] Unknown root for pruning the CFG: %s' %name)
+            roots.append(symbol.rebased_addr)
+    roots.append(initial_node)
+    roots.extend(set(transition['ret'] for transition in transitions if transition['jumpkind'] == 'call'))
+    missing = [hex(addr) for addr in roots if addr not in graph.addr_index]
+    if len(missing) > 0:
+        raise Exception('[-] Root(s) for pruning the CFG not found in the CFG: %s' %' '.join(missing))
+    return [graph.addr_index[addr] for addr in roots]
+
+def run(application_foldername, options=None):
+    result, output = extract(application_foldername, options)
+    if result is not None: result.write(application_foldername)
+    return output
+
+def extract(application_foldername, options=None):
+    # returns the ExtractionResult (None when only cross-checking the CFG backends) and the stats
+    if options is None: options = {}
     output = ''
     c_filenames = find_c_file(application_foldername)
     out_file = application_foldername + '/main'
 
-    compile(c_filenames, out_file) # compile the application using GCC
+    cache = DigestCache(options['cache_dir'], options.get('cache_size', DEFAULT_CACHE_SIZE)) if options.get('cache_dir') else None
 
-    proj = angr.Project(out_file, load_options={'auto_load_libs': False}) # load the compiled application
-    cfg  = get_cfg(proj) # extract CFG
-    end_state, cfg, path = get_execution_path(proj, cfg) # get example execution path
+    build(application_foldername, c_filenames, out_file, cache) # compile the application using GCC
 
-    # hexify the labels
-    path = hexify_labels(path)
+    proj  = angr.Project(out_file, load_options={'auto_load_libs': False}) # load the compiled application
+    if options.get('cross_check_cfg'):
+        return None, '\n%s\n' %application_foldername + cross_check_cfg(proj, out_file)
+    graph = get_graph(proj, out_file, cache, options.get('cfg_backend', 'angr')) # extract CFG
+    trace_filename = application_foldername + '/trace' if options.get('stream_trace') else None
+    checkpoint_filename = application_foldername + '/trace.checkpoint'
+    end_state, transitions, path = get_execution_path(proj, trace_filename, options.get('unicorn', False), checkpoint_filename, options.get('checkpoint_interval'), options.get('resume', False)) # get example execution path
 
-    labeled_cfg=nx.convert_node_labels_to_integers(cfg.graph, ordering='default')
-    labeled_cfg_adjlist=list(nx.generate_adjlist(labeled_cfg))
-    labeled_numified_adjlist=format_adjlist(labeled_cfg_adjlist)
+    graph.add_execution_path(path['initial_node'], transitions) # add missing nodes and edges
+    graph = graph.freeze()
 
-    optimized_cfg=nx.DiGraph()
-    for node,neighbors in labeled_numified_adjlist.items():
-        optimized_cfg.add_node(node)
-        for neighbor in neighbors:
-            optimized_cfg.add_edge(node, neighbor)
+    pruned = None
+    if options.get('prune'):
+        num_nodes, num_edges = graph.num_nodes, graph.num_edges
+        roots = get_prune_roots(proj, graph, path['initial_node'], transitions, options.get('prune_roots'))
+        graph = graph.prune(roots)
+        pruned = (num_nodes-graph.num_nodes, num_nodes, num_edges-graph.num_edges, num_edges)
 
-    optimized_labeled_cfg=nx.convert_node_labels_to_integers(optimized_cfg, ordering='default',label_attribute='old_label')
-    node_label_translator=generate_label_translator(labeled_cfg, cfg.graph, optimized_labeled_cfg)
+    # hexify the labels
+    path = hexify_labels(path)
+
+    label_strategy = options.get('label_order', 'default')
+    bucket_radix = options.get('bucket_radix', 8)
+    order,labels,label_strategy,label_levels = optimize_labels(graph, label_strategy, graph.addr_index[int(path['initial_node'],16)], bucket_radix)
+    node_label_translator = graph.label_translator(labels)
 
-    with open(application_foldername + '/translator', 'w') as out:
-        for raw_address in node_label_translator:
-            out.write('%s\n' %raw_address)
 
     output += '\n%s\n' %application_foldername
     output += 'Min addr: %s\n' %hex(proj.loader.min_addr)
     output += 'Max addr: %s (bitwidth=%s)\n' %(hex(proj.loader.max_addr),len(format(proj.loader.max_addr,'0b')))
-    output += 'CFG has %d nodes and %d edges\n' %(len(cfg.graph.nodes()), len(cfg.graph.edges()))
+    if pruned is not None:
+        output += 'Pruned %d of %d nodes and %d of %d edges not reachable from the roots\n' %pruned
+    output += 'CFG has %d nodes and %d edges\n' %(graph.num_nodes, graph.num_edges)
+    if options.get('label_order', 'default') != 'default':
+        output += 'Label ordering: %s (levels required: %s)\n' %(label_strategy, ', '.join('%s=%s' %(strategy,levels) for strategy,levels in label_levels.items()))
+        default_levels = label_levels['default'] if 'default' in label_levels else adjlist_levels(graph, graph.label_order()[1], bucket_radix)
+        default_bits,default_elements,default_calls = adjlist_cost(graph.num_nodes, default_levels, bucket_radix)
+        bits,elements,calls = adjlist_cost(graph.num_nodes, label_levels[label_strategy], bucket_radix)
+        output += 'Predicted adjacency list hashing compared to the default labeling: %s -> %s levels (%s -> %s bits per node), %s -> %s field elements, %s -> %s calls to Poseidon\n' %(default_levels,label_levels[label_strategy],default_bits,bits,default_elements,elements,default_calls,calls)
     
-    numified_adjlist=list(nx.generate_adjlist(optimized_labeled_cfg))
-    write_adjlist(application_foldername+'/numified_adjlist', numified_adjlist)
-    write_adjlist(application_foldername+'/adjlist', get_adjlist(cfg))
-
-    numified_adjlist=format_adjlist(numified_adjlist)
+    numified_adjlist=format_adjlist(graph.numified_adjlist(order, labels))
     max_neighbors_set=max(numified_adjlist.values(),key=len)
-    adjlist_encoded=encode_adjlist(numified_adjlist)
+    adjlist_encoded=encode_adjlist(numified_adjlist, bucket_radix)
     levels_required=len(max([list(levels) for node,levels in adjlist_encoded], key=len))
     output += 'Adjacency list max_neighbors: %s %s\n' %(len(max_neighbors_set), max_neighbors_set)
     output += 'Bucket-rems pairs (levels) required to express the encoded adjacency list: %s\n' %levels_required
     # write raw execution path to file
-    raw_path, raw_path_stats = compress(path.copy())
-    write_execution_path('%s/recorded_path'%application_foldername, raw_path)
+    compress_path = fold if options.get('fold') else compress
+    raw_path, raw_path_stats = compress_path(path.copy())
     # numify the execution path
     path = numify_labels(path, node_label_translator)
-    path, stats = compress(path)
-    # write numified execution path to file
-    write_execution_path('%s/numified_path'%application_foldername, path)
+    path, stats = compress_path(path)
+    translator = [int(raw_address,16) for raw_address in node_label_translator]
+    result = ExtractionResult.from_graph(graph, order, labels, translator, ExecutionPath.from_dict(raw_path), ExecutionPath.from_dict(path))
     # write stats
     output += 'Execution path died because it: %s\n' %end_state
     output += 'Execution path length pre compression: %s\n' %stats['execution_path_length_pre_compression']
     output += 'Number of consecutively repeated sequences: %s\n' %stats['number_of_repetitions']
     output += 'Average (mean) length of sequences: %.2f (std=%.2f)\n' %(stats['mean_sequence_lengths'],stats['stdev_sequence_lengths'])
     output += 'Average (mean) number of sequence repetitions: %.2f (std=%.2f)\n' %(stats['mean_sequence_repetitions'],stats['stdev_sequence_repetitions'])
+    for i,(pre_fold_length,post_fold_length,repetitions) in enumerate(stats.get('folds', [])):
+        output += 'Nested loop fold %s: %s -> %s (%s consecutively repeated sequences, %.2f%% shorter)\n' %(i+1,pre_fold_length,post_fold_length,repetitions,100*(pre_fold_length-post_fold_length)/pre_fold_length)
     output += 'Execution path length post compression: %s\n' %stats['execution_path_length_post_compression']
     # compute the maximum stack depth used during execution
     max_stack_depth=0
@@ -323,7 +477,7 @@ def run(application_foldername):
     output += 'Max stack depth: %s\n' %max_stack_depth
     # test if the execution path is valid according to the adjacency list
     output += 'Execution path is valid according to the adjlist: %s\n' %valid_execution_path(path, numified_adjlist)
-    return output
+    return result, output
 
 def write_stats(message, foldername=None, mode='w'):
     filename='stats.log'
@@ -331,26 +485,80 @@ def write_stats(message, foldername=None, mode='w'):
     with open(filename, mode) as out:
         out.write(message+'\n')
 
-def main(applications_dir, target_application_dir, exclude_dirs):
+def run_worker(foldername, conn, options=None):
+    # runs in its own process (with its own angr project); any failure, including the exit() calls
+    # made while extracting the execution path, is reported back instead of taking down the batch
+    try:
+        result=('ok', run(foldername, options))
+    except BaseException as e:
+        result=('error', '%s: %s\n%s'%(type(e).__name__, e, traceback.format_exc()))
+    conn.send(result)
+    conn.close()
+
+def run_parallel(foldernames, jobs, timeout=None, options=None):
+    results={}
+    pending=list(foldernames)
+    running={} # sentinel -> (foldername, process, connection, start time)
+    while len(pending)>0 or len(running)>0:
+        while len(pending)>0 and len(running)<jobs:
+            foldername=pending.pop(0)
+            recv_conn,send_conn=multiprocessing.Pipe(duplex=False)
+            process=multiprocessing.Process(target=run_worker, args=(foldername, send_conn, options), daemon=True)
+            process.start()
+            send_conn.close()
+            running[process.sentinel]=(foldername, process, recv_conn, time.time())
+            print('[+] Started %s (pid %s)'%(foldername, process.pid))
+        ready=wait([conn for foldername,process,conn,start in running.values()]+list(running), timeout=1)
+        for sentinel,(foldername,process,conn,start) in list(running.items()):
+            result=None
+            if conn in ready or sentinel in ready:
+                try:
+                    result=conn.recv() if conn.poll() else ('error', 'worker exited with code %s'%process.exitcode)
+                except EOFError:
+                    result=('error', 'worker exited with code %s'%process.exitcode)
+            elif timeout and time.time()-start>timeout:
+                process.terminate()
+                result=('error', 'timed out after %s seconds'%timeout)
+            if result is None: continue
+            process.join()
+            conn.close()
+            del running[sentinel]
+            results[foldername]=result
+            print('[%s] Finished %s in %.1f seconds'%('+' if result[0]=='ok' else '-', foldername, time.time()-start))
+    return results
+
+def main(applications_dir, target_application_dir, exclude_dirs, jobs=None, timeout=None, options=None):
     merged_output = ''
+    failed=[]
     if target_application_dir!=None: # single application
-        output=run(target_application_dir)
+        output=run(target_application_dir, options)
         write_stats(output, target_application_dir) # log stats to file
         merged_output+=output
     else:
-        subfolders=[f.path for f in os.scandir(applications_dir) if f.is_dir()]
+        subfolders=sorted([f.path for f in os.scandir(applications_dir) if f.is_dir()])
         if len(subfolders)==0:
             print('No applications found in: %s'%applications_dir)
             exit(2)
-        for foldername in subfolders: # iterate over applications
-            tmp=foldername
-            if len(tmp.split('/'))>0:
-                tmp=tmp.split('/')[-1]
-            if tmp in exclude_dirs: continue
-            output=run(foldername)
-            write_stats(output, foldername) # log stats to file
-            merged_output+=output
+        subfolders=[foldername for foldername in subfolders if foldername.split('/')[-1] not in exclude_dirs]
+        if jobs:
+            results=run_parallel(subfolders, jobs, timeout, options)
+            for foldername in subfolders: # merge in a deterministic order, independent of completion order
+                status,output=results[foldername]
+                if status!='ok':
+                    failed.append(foldername)
+                    print('[-] %s failed: %s'%(foldername, output))
+                    continue
+                write_stats(output, foldername) # log stats to file
+                merged_output+=output
+            if len(failed)>0:
+                merged_output+='\nFailed applications (%s of %s): %s\n'%(len(failed), len(subfolders), ' '.join(failed))
+        else:
+            for foldername in subfolders: # iterate over applications
+                output=run(foldername, options)
+                write_stats(output, foldername) # log stats to file
+                merged_output+=output
     print(merged_output)
+    return failed
 
 def usage():
     print('Usage: %s [options]'%sys.argv[0])
@@ -360,13 +568,31 @@ def usage():
     print('  -d <path/to/dir> Directory containing target applications organized into folders (default is to consider the \'./embench-iot-applications\' directory)')
     print('  -a <path>        Path to specific target application')
     print('  -e <name1,name2> Comma separated list of application folders to exclude')
+    print('  -j <num>         Process up to <num> applications in parallel, each in its own worker process (a failing application is reported without stopping the others)')
+    print('  --timeout <sec>  With -j, abort any application that takes longer than <sec> seconds (default is no timeout); exits with status 1 if any application failed or timed out')
+    print('  --fold           Fold nested loops: keep compressing the execution path until no consecutively repeated sequences remain (reports how much shorter each fold made the path)')
+    print('  --stream-trace   Stream the recorded transitions to the application\'s \'trace\' file while recording, keeping only a bounded buffer of them in memory during the recording (the trace is read back into memory afterwards to fix up the CFG, compress and write the execution path, so the peak memory still grows with the length of the path)')
+    print('  --unicorn        Execute the (concrete) recorded run with angr\'s unicorn engine instead of stepping through every basic block with VEX (records the same execution path, faster)')
+    print('  --checkpoint <n> Checkpoint the recording (transitions and simulation state) to the application\'s \'trace.checkpoint\' file every <n> steps (and when the recording is interrupted or runs out of memory; not for deterministic failures such as an unsupported jumpkind, which a resumed recording would run into again)')
+    print('  --resume         Resume recording the execution path from the application\'s \'trace.checkpoint\' file (if present)')
+    print('  --cache-dir <dir> Cache compiled applications and their CFGs in <dir>, keyed by the content of the sources, the compiler and its flags (binaries), and by the binary, the angr version and the CFG options (CFGs), so unchanged applications are neither recompiled nor analyzed again (default is to not cache)')
+    print('  --cache-size <MB> Maximum size of the cache directory before the least recently used entries are evicted (default %s MB)'%(DEFAULT_CACHE_SIZE//(1024*1024)))
+    print('  --cfg-backend <name> Extract the CFG with angr\'s CFGFast (\'angr\', default) or with the lightweight pyelftools+capstone backend (\'capstone\'), which finds the same nodes and edges inside the binary (save for resolved indirect jumps and a few blocks VEX splits differently, see --cross-check-cfg) in a fraction of the time')
+    print('  --prune          Remove the nodes of the CFG that are not reachable from the entry point of the application (or from the --prune-roots), e.g., dead functions, before numbering them (reports how many nodes and edges were removed)')
+    print('  --prune-roots <addr1,symbol2> With --prune, keep the nodes reachable from these comma separated addresses and/or symbol names instead of from the entry point (the nodes of the recorded execution path are always kept)')
+    print('  --label-order <name> Order in which the nodes are labeled: \'default\' (the order of the CFG), \'bfs\', \'rcm\' (reverse Cuthill-McKee), \'greedy\' (packs the successors of each node into the same bucket of labels) or \'best\' (whichever needs the fewest levels). Fewer levels make the encoded adjacency list smaller; reports the levels and the predicted savings in field elements and calls to Poseidon when hashing the adjacency list')
+    print('  --bucket-radix <num> Number of labels per bucket (%s) of the adjacency list encoding for which the levels are reported and the labels are ordered (default is 8). The circuit inputs must be formatted and the circuit compiled with the same radix'%', '.join(str(radix) for radix in BUCKET_RADICES))
+    print('  --cross-check-cfg Only extract the CFG with both backends and report the nodes and edges on which they differ (no execution path is recorded)')
 
 if __name__ == '__main__':
     applications_dir='./embench-iot-applications'
     target_application_dir=None
     exclude_dirs=[]
+    jobs=None
+    timeout=None
+    options={}
     try:
-        opts,args=getopt.getopt(sys.argv[1:],'hvd:a:e:')
+        opts,args=getopt.getopt(sys.argv[1:],'hvd:a:e:j:',['timeout=','fold','stream-trace','unicorn','checkpoint=','resume','cache-dir=','cache-size=','cfg-backend=','prune','prune-roots=','label-order=','bucket-radix=','cross-check-cfg'])
     except getopt.GetoptError as err:
         print(err)
         usage()
@@ -385,4 +611,49 @@ if __name__ == '__main__':
             target_application_dir=arg
         elif opt=='-e':
             exclude_dirs=[foldername for foldername in arg.split(',')]
-    main(applications_dir, target_application_dir, exclude_dirs)
+        elif opt=='-j':
+            jobs=int(arg)
+        elif opt=='--timeout':
+            timeout=float(arg)
+        elif opt=='--fold':
+            options['fold']=True
+        elif opt=='--stream-trace':
+            options['stream_trace']=True
+        elif opt=='--unicorn':
+            options['unicorn']=True
+        elif opt=='--checkpoint':
+            options['checkpoint_interval']=int(arg)
+        elif opt=='--resume':
+            options['resume']=True
+        elif opt=='--cfg-backend':
+            if arg not in ('angr', 'capstone'):
+                print('Unknown CFG backend: %s'%arg)
+                usage()
+                sys.exit(2)
+            options['cfg_backend']=arg
+        elif opt=='--prune':
+            options['prune']=True
+        elif opt=='--prune-roots':
+            options['prune']=True
+            options['prune_roots']=[root for root in arg.split(',') if root!='']
+        elif opt=='--label-order':
+            if arg not in STRATEGIES+['best']:
+                print('Unknown label ordering: %s'%arg)
+                usage()
+                sys.exit(2)
+            options['label_order']=arg
+        elif opt=='--bucket-radix':
+            if not arg.isdigit() or int(arg) not in BUCKET_RADICES:
+                print('Unknown bucket radix: %s'%arg)
+                usage()
+                sys.exit(2)
+            options['bucket_radix']=int(arg)
+        elif opt=='--cross-check-cfg':
+            options['cross_check_cfg']=True
+        elif opt=='--cache-dir':
+            options['cache_dir']=arg
+        elif opt=='--cache-size':
+            options['cache_size']=int(arg)*1024*1024
+    failed=main(applications_dir, target_application_dir, exclude_dirs, jobs, timeout, options)
+    if len(failed)>0:
+        sys.exit(1)
@@ -0,0 +1,150 @@
+#################################
+## Author: Heini Bergsson Debes
+#################################
+# Chooses the numeric labels of the CFG's nodes so that the encoded adjacency list needs as few levels as possible.
+# encode_adjlist stores the neighbors of a node as bucket-rems pairs (bucket = label/radix, 8 by default), one pair
+# (level) per distinct bucket, so ADJLIST_LEVELS is the largest number of distinct buckets among the successors of
+# any node and depends only on how the labels of neighbors are grouped into buckets of radix labels.
+# Every strategy returns (order, labels) like CSRGraph.label_order, i.e., order[label] = node and
+# labels[node] = label, so the translator, the numified adjacency list and the numified path stay consistent:
+# - default: the labeling networkx produced (first appearance when listing every node followed by its successors)
+# - bfs:     breadth-first order over the successors, starting from the given root
+# - rcm:     reverse Cuthill-McKee (bandwidth reduction) over the undirected CFG
+# - greedy:  bucket packing; the successors of nodes with most successors are merged into clusters of at most
+#            radix nodes first, the clusters are then packed into buckets (best fit decreasing) and the buckets are
+#            padded to radix labels with unclustered nodes, so every cluster keeps to a single bucket
+# - best:    whichever of the above needs the fewest levels (the default labeling wins ties)
+
+import math
+from collections import deque
+from circuit_input_formatter import P_BITWIDTH
+
+STRATEGIES = ['default', 'bfs', 'rcm', 'greedy']
+
+def adjlist_levels(graph, labels, radix=8):
+    levels = 0
+    for u in range(graph.num_nodes):
+        levels = max(levels, len(set(labels[v] // radix for v in graph.successors(u))))
+    return levels
+
+def adjlist_cost(num_nodes, levels, radix=8):
+    # the size of the adjacency list's hash input as computed by circuit_input_formatter (without padding):
+    # (neighbors bitwidth, field elements after compression, calls to Poseidon including the nonce)
+    bucket_bitwidth = len(format(math.floor(num_nodes / radix), '0b'))
+    neighbors_bitwidth = max(levels, 1) * (bucket_bitwidth + radix)
+    elems_per_field_element = math.floor(P_BITWIDTH / neighbors_bitwidth)
+    if elems_per_field_element == 0:
+        return neighbors_bitwidth, None, None # does not fit into a field element (see the implementation notes)
+    field_elements = math.ceil(num_nodes / elems_per_field_element)
+    return neighbors_bitwidth, field_elements, math.ceil((field_elements + 1) / 8)
+
+def labels_from_order(order):
+    labels = [-1] * len(order)
+    for label,u in enumerate(order):
+        labels[u] = label
+    return order, labels
+
+def bfs_order(graph, root=0):
+    order = []
+    seen = bytearray(graph.num_nodes)
+    for start in [root] + list(range(graph.num_nodes)):
+        if seen[start]: continue
+        seen[start] = 1
+        pending = deque([start])
+        while len(pending) > 0:
+            u = pending.popleft()
+            order.append(u)
+            for v in graph.successors(u):
+                if not seen[v]:
+                    seen[v] = 1
+                    pending.append(v)
+    return labels_from_order(order)
+
+def rcm_order(graph):
+    neighbors = [set() for u in range(graph.num_nodes)]
+    for u in range(graph.num_nodes):
+        for v in graph.successors(u):
+            if u != v:
+                neighbors[u].add(v)
+                neighbors[v].add(u)
+    order = []
+    seen = bytearray(graph.num_nodes)
+    for start in sorted(range(graph.num_nodes), key=lambda u: len(neighbors[u])): # each component from a node of minimum degree
+        if seen[start]: continue
+        seen[start] = 1
+        pending = deque([start])
+        while len(pending) > 0:
+            u = pending.popleft()
+            order.append(u)
+            for v in sorted(neighbors[u], key=lambda v: len(neighbors[v])):
+                if not seen[v]:
+                    seen[v] = 1
+                    pending.append(v)
+    order.reverse()
+    return labels_from_order(order)
+
+def greedy_clusters(graph, radix=8):
+    # the successors of nodes with most successors first are merged into clusters of at most radix nodes;
+    # returns every cluster (nodes that ended up in no cluster are clusters of their own)
+    parent = list(range(graph.num_nodes))
+    size = [1] * graph.num_nodes
+    def find(u):
+        while parent[u] != u:
+            parent[u] = parent[parent[u]]
+            u = parent[u]
+        return u
+    successor_sets = [sorted(set(graph.successors(u))) for u in range(graph.num_nodes)]
+    successor_sets = sorted([successors for successors in successor_sets if len(successors) > 1], key=len, reverse=True)
+    for successors in successor_sets:
+        groups = [] # roots of the merged clusters of this node's successors
+        for root in sorted(set(find(v) for v in successors), key=lambda root: size[root], reverse=True):
+            for group in groups:
+                if size[group] + size[root] <= radix:
+                    parent[root] = group
+                    size[group] += size[root]
+                    break
+            else:
+                groups.append(root)
+    clusters = {}
+    for u in range(graph.num_nodes):
+        clusters.setdefault(find(u), []).append(u)
+    return list(clusters.values())
+
+def greedy_order(graph, radix=8):
+    clusters = greedy_clusters(graph, radix)
+    fillers = [cluster[0] for cluster in clusters if len(cluster) == 1]
+    buckets = [[] for free in range(radix+1)] # free slots -> buckets (lists of nodes) with that many free slots
+    for cluster in sorted([cluster for cluster in clusters if len(cluster) > 1], key=len, reverse=True):
+        free = next((free for free in range(len(cluster), radix) if len(buckets[free]) > 0), radix) # best fit
+        bucket = buckets[free].pop() if free < radix else []
+        bucket.extend(cluster)
+        buckets[free - len(cluster)].append(bucket)
+    # the labels are contiguous, so a bucket that is not full would shift every later cluster off the buckets:
+    # the free slots are filled with unclustered nodes (fullest buckets first) and the unclustered nodes that remain
+    # follow the full buckets. Only if they run out are the buckets that could not be filled laid out last, where
+    # a cluster may straddle two buckets (but never more, a cluster has at most radix nodes)
+    full = buckets[0]
+    partial = []
+    for free in range(1, radix):
+        for bucket in buckets[free]:
+            take = min(free, len(fillers))
+            bucket.extend(fillers[len(fillers)-take:])
+            del fillers[len(fillers)-take:]
+            (full if len(bucket) == radix else partial).append(bucket)
+    return labels_from_order([u for bucket in full for u in bucket] + fillers + [u for bucket in partial for u in bucket])
+
+def optimize_labels(graph, strategy='best', root=0, radix=8):
+    # returns (order, labels, strategy, report): the labeling of the chosen strategy and the levels each strategy tried needs
+    candidates = STRATEGIES if strategy == 'best' else [strategy]
+    best = None
+    report = {}
+    for candidate in candidates:
+        if candidate == 'default': order,labels = graph.label_order()
+        elif candidate == 'bfs': order,labels = bfs_order(graph, root)
+        elif candidate == 'rcm': order,labels = rcm_order(graph)
+        elif candidate == 'greedy': order,labels = greedy_order(graph, radix)
+        else: raise Exception('[-] Unknown label ordering strategy: %s' %candidate)
+        report[candidate] = adjlist_levels(graph, labels, radix)
+        if best is None or report[candidate] < report[best[0]]:
+            best = (candidate, order, labels)
+    return best[1], best[2], best[0], report
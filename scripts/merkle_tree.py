@@ -0,0 +1,130 @@
+#################################
+## Author: Heini Bergsson Debes
+#################################
+# Merkle-tree commitment over the packed field elements of the encoded adjacency list and the translator, as an
+# alternative to the linear sponge of circuit_input_formatter.hash, which is strictly sequential and has to be
+# recomputed in full whenever an entry changes. It is not wired into circuit_input_formatter.py or compile_circuit.py:
+# the ZEKRA circuit only verifies the sponge digests, so a Merkle commitment could never satisfy it.
+# Every inner node is Poseidon with t=arity+1 over [0, child_1, ..., child_arity] (the first element is the capacity,
+# like in the sponge) and its digest is the first rate element. The leaves are the field elements themselves (as
+# packed by compress), padded with zeros to arity**depth leaves; subtrees that only hold padding are taken from a
+# table of zero hashes and cost no calls to Poseidon. The commitment is Poseidon with t=3 over [0, root, nonce], so
+# a new nonce costs a single call (like the sponge checkpoints).
+# The nodes of each level are hashed in lockstep (poseidon_hash_many), and the levels with many nodes (the bottom
+# level holds (arity-1)/arity of all calls) can be split across a pool of processes. update() replaces a few leaves
+# and only rehashes the nodes on their paths to the root, i.e., at most depth calls to Poseidon per changed leaf.
+
+import math
+import multiprocessing
+from poseidon.poseidon_hash import poseidon_hash_many
+from poseidon.poseidon_field import set_field_backend, get_field_backend
+
+MIN_ARITY = 2
+MAX_ARITY = 8 # Poseidon is instantiated for t <= 9 (see poseidon_constants)
+PARALLEL_MIN_NODES = 256 # levels with fewer nodes are hashed in this process
+_ZEROS = {} # arity -> zero hashes, _ZEROS[arity][height] = root of a subtree of that height holding only zeros
+
+def check_arity(arity):
+    if arity < MIN_ARITY or arity > MAX_ARITY:
+        raise Exception('The arity of the Merkle tree must be between %s and %s (got %s)' %(MIN_ARITY, MAX_ARITY, arity))
+
+def tree_depth(num_leaves, arity):
+    # the smallest depth (at least 1, so the root is always a hash) with room for num_leaves leaves
+    depth = 1
+    while arity**depth < num_leaves:
+        depth += 1
+    return depth
+
+def hash_nodes(children, arity):
+    # the parents of every run of arity children (len(children) must be a multiple of arity)
+    return [state[1] for state in poseidon_hash_many([[0] + children[i:i+arity] for i in range(0, len(children), arity)])]
+
+def hash_nodes_worker(args):
+    field_backend, children, arity = args
+    set_field_backend(field_backend)
+    return hash_nodes(children, arity)
+
+def zero_hashes(arity, depth):
+    zeros = _ZEROS.setdefault(arity, [0])
+    while len(zeros) <= depth:
+        zeros.append(hash_nodes([zeros[-1]]*arity, arity)[0])
+    return zeros[:depth+1]
+
+def merkle_commitment(root, nonces):
+    # the digest of the root and the nonces, like the sponge digest of the same entries
+    return poseidon_hash_many([[0, root] + list(nonces)])[0][1]
+
+class MerkleTree:
+    def __init__(self, leaves, arity=MAX_ARITY, depth=None, processes=1):
+        check_arity(arity)
+        self.arity = arity
+        self.depth = tree_depth(len(leaves), arity) if depth is None else depth
+        if arity**self.depth < len(leaves):
+            raise Exception('A Merkle tree of arity %s and depth %s cannot hold %s leaves' %(arity, self.depth, len(leaves)))
+        self.zeros = zero_hashes(arity, self.depth)
+        self.num_calls = 0 # calls to Poseidon so far (not counting the zero hashes)
+        # levels[0] are the leaves and levels[height] the nodes of that height that are not entirely padding
+        self.levels = [list(leaves)]
+        pool = multiprocessing.Pool(processes) if processes > 1 and len(leaves) >= arity*PARALLEL_MIN_NODES else None
+        try:
+            for height in range(self.depth):
+                children = self.padded_children(height, 0, len(self.levels[height]))
+                self.levels.append(self.hash_level(children, pool, processes))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    @property
+    def root(self):
+        return self.levels[-1][0] if len(self.levels[-1]) > 0 else self.zeros[self.depth]
+
+    @property
+    def num_leaves(self):
+        return len(self.levels[0])
+
+    def padded_children(self, height, start, stop):
+        # the nodes [start:stop] of the given height, rounded out to whole groups of siblings with zero hashes
+        start -= start % self.arity
+        stop += (-stop) % self.arity
+        nodes = self.levels[height][start:stop]
+        return nodes + [self.zeros[height]]*(stop - start - len(nodes))
+
+    def hash_level(self, children, pool, processes):
+        num_parents = len(children)//self.arity
+        self.num_calls += num_parents
+        if pool is None or num_parents < PARALLEL_MIN_NODES:
+            return hash_nodes(children, self.arity)
+        # contiguous groups of whole sibling runs, one per process
+        step = math.ceil(num_parents/processes)*self.arity
+        field_backend = get_field_backend().name
+        groups = pool.map(hash_nodes_worker, [(field_backend, children[i:i+step], self.arity) for i in range(0, len(children), step)])
+        return [parent for group in groups for parent in group]
+
+    def commitment(self, nonces):
+        return merkle_commitment(self.root, nonces)
+
+    def update(self, changes):
+        # changes maps leaf indices to their new values (indices past the last leaf extend the tree with zero leaves);
+        # the nodes on the paths of the changed leaves are rehashed once per level, each level in one batch
+        dirty = set()
+        leaves = self.levels[0]
+        for index,value in changes.items():
+            if index < 0 or index >= self.arity**self.depth:
+                raise Exception('Leaf %s is outside of the Merkle tree of arity %s and depth %s' %(index, self.arity, self.depth))
+            if index >= len(leaves):
+                leaves.extend([0]*(index + 1 - len(leaves)))
+            leaves[index] = value
+            dirty.add(index//self.arity)
+        for height in range(1, self.depth + 1):
+            nodes = self.levels[height]
+            num_nodes = math.ceil(len(self.levels[height-1])/self.arity)
+            if len(nodes) < num_nodes:
+                nodes.extend([self.zeros[height]]*(num_nodes - len(nodes)))
+            dirty = sorted(dirty)
+            children = [child for parent in dirty for child in self.padded_children(height-1, parent*self.arity, parent*self.arity + 1)]
+            self.num_calls += len(dirty)
+            for parent,value in zip(dirty, hash_nodes(children, self.arity)):
+                nodes[parent] = value
+            dirty = set(parent//self.arity for parent in dirty)
+        return self.root
@@ -0,0 +1,74 @@
+#################################
+## Author: Heini Bergsson Debes
+#################################
+# Integer-native packing of the circuit inputs, replacing the binary strings built by binify_encoded_adjlist and
+# binify_path (and parsed back with int(s,2) by numify_*), and the per-field-element packing done by compress.
+# Every function produces exactly the integers of the string-based pipeline (with the first level/element in the
+# least significant bits), provided that the values fit into their bitwidths, which circuit_input_formatter checks.
+# With numpy installed, large lists are packed column-wise: each field element is assembled in four little-endian
+# uint64 limbs (p has 254 bits) with shifts and ors, and the limbs are turned into Python ints with int.from_bytes.
+# Without numpy (or for short lists and values wider than 64 bits), each field element is packed by the selected
+# field backend (see poseidon_field.get_field_backend).
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import math
+from poseidon.poseidon_field import get_field_backend
+
+LIMBS = 4 # uint64 limbs per field element (enough for 256 bits)
+NUMPY_MIN_ELEMS = 256 # below this, converting to and from numpy arrays costs more than it saves
+JUMPKIND_CALL = 1
+
+def pack_encoded_adjlist(adjlist_encoded, bucket_bitwidth, radix):
+    # int(binify_encoded_adjlist(...)[i][1], 2) for every node: the first level ends up in the most significant
+    # bits, each level being its radix-bit rems followed by its bucket_bitwidth-bit bucket
+    level_bitwidth = bucket_bitwidth + radix
+    packed = []
+    for node,levels in adjlist_encoded:
+        neighbors = 0
+        for bucket,rems in levels.items():
+            neighbors = (neighbors << level_bitwidth) | (rems << bucket_bitwidth) | bucket
+        packed.append((node, neighbors))
+    return packed
+
+def pack_transitions(jumpkinds, dsts, rets, jumpkind_bitwidth, addr_bitwidth):
+    # int(binify_transition(...), 2) for columns of jumpkind codes and integer addresses: ret||dst||jumpkind,
+    # where ret is only kept for calls
+    if numpy is not None and len(jumpkinds) >= NUMPY_MIN_ELEMS and jumpkind_bitwidth + 2*addr_bitwidth <= 64:
+        jumpkinds = numpy.asarray(jumpkinds, dtype=numpy.uint64)
+        packed = numpy.asarray(dsts, dtype=numpy.uint64) << numpy.uint64(jumpkind_bitwidth)
+        packed |= jumpkinds
+        packed |= numpy.where(jumpkinds == JUMPKIND_CALL, numpy.asarray(rets, dtype=numpy.uint64), numpy.uint64(0)) << numpy.uint64(jumpkind_bitwidth + addr_bitwidth)
+        return packed
+    ret_shift = jumpkind_bitwidth + addr_bitwidth
+    return [(ret << ret_shift if jumpkind == JUMPKIND_CALL else 0) | (dst << jumpkind_bitwidth) | jumpkind for jumpkind,dst,ret in zip(jumpkinds, dsts, rets)]
+
+def pack_fields(elems, bitwidth, elems_per_field_element, field=None):
+    # field.pack of every run of elems_per_field_element consecutive elems (the last run may be shorter)
+    if numpy is not None and len(elems) >= NUMPY_MIN_ELEMS and bitwidth <= 64 and bitwidth*elems_per_field_element <= 64*LIMBS:
+        values = numpy.asarray(elems, dtype=numpy.uint64) if not isinstance(elems, numpy.ndarray) else elems
+        if bitwidth == 64 or int(values.max()) >> bitwidth == 0:
+            return pack_fields_numpy(values, bitwidth, elems_per_field_element)
+    if numpy is not None and isinstance(elems, numpy.ndarray):
+        elems = elems.tolist() # Python ints do not overflow
+    field = field if field is not None else get_field_backend()
+    return [field.pack(elems[i:i+elems_per_field_element], bitwidth) for i in range(0, len(elems), elems_per_field_element)]
+
+def pack_fields_numpy(values, bitwidth, elems_per_field_element):
+    num_field_elements = math.ceil(len(values)/elems_per_field_element)
+    padded = numpy.zeros(num_field_elements*elems_per_field_element, dtype=numpy.uint64)
+    padded[:len(values)] = values
+    columns = padded.reshape(num_field_elements, elems_per_field_element)
+    limbs = numpy.zeros((num_field_elements, LIMBS), dtype=numpy.uint64)
+    for k in range(elems_per_field_element):
+        shift = k*bitwidth
+        limb, offset = shift // 64, shift % 64
+        limbs[:,limb] |= columns[:,k] << numpy.uint64(offset)
+        if offset + bitwidth > 64: # the element straddles two limbs
+            limbs[:,limb+1] |= columns[:,k] >> numpy.uint64(64 - offset)
+    raw = limbs.astype('<u8').tobytes()
+    size = 8*LIMBS
+    return [int.from_bytes(raw[i:i+size], 'little') for i in range(0, len(raw), size)]
@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+#################################
+## Author: Heini Bergsson Debes
+#################################
+# Compares the string-based packing of circuit_input_formatter (binify_path/numify_binified_path followed by the
+# per-field-element packing of compress, and binify_encoded_adjlist/numify_binified_adjlist) with the integer-native
+# packing of packing.py on synthetic inputs, checks that both produce the same field elements, and reports the timings.
+# The execution path is random (seeded), with the jumpkind mix and address range of the embench applications, e.g.,
+#   python3 scripts/packing_benchmark.py -n 1000000
+
+import sys, getopt, math, random, time
+import circuit_input_formatter as formatter
+from circuit_input_formatter import binify_path, numify_binified_path, binify_encoded_adjlist, numify_binified_adjlist, encode_adjlist, P_BITWIDTH
+from poseidon.poseidon_field import get_field_backend
+import packing
+
+def random_path(num_transitions, addr_bitwidth, seed):
+    rng = random.Random(seed)
+    jumpkinds = rng.choices([0, 1, 2], weights=[6, 2, 2], k=num_transitions)
+    dsts = [rng.getrandbits(addr_bitwidth) for i in range(num_transitions)]
+    rets = [rng.getrandbits(addr_bitwidth) if jumpkind == 1 else 0 for jumpkind in jumpkinds]
+    return jumpkinds, dsts, rets
+
+def random_adjlist(num_nodes, max_neighbors, seed):
+    rng = random.Random(seed)
+    return {str(node): rng.sample(range(num_nodes), rng.randint(0, max_neighbors)) for node in range(num_nodes)}
+
+def string_pack(tmp_list, elem_bitwidth):
+    # compress() as it was before packing.py: one field.pack per field element
+    field = get_field_backend()
+    elems_per_field_element = math.floor(P_BITWIDTH/elem_bitwidth)
+    return [field.pack(tmp_list[i:i+elems_per_field_element], elem_bitwidth) for i in range(0, len(tmp_list), elems_per_field_element)]
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def report(name, reference_time, engine_time):
+    print('%-28s %10.3f s %10.3f s %8.1fx' %(name, reference_time, engine_time, reference_time/engine_time if engine_time > 0 else float('inf')))
+
+def benchmark_path(num_transitions, addr_bitwidth, seed):
+    jumpkinds, dsts, rets = random_path(num_transitions, addr_bitwidth, seed)
+    names = {code: jumpkind for jumpkind,code in formatter.JUMPKIND_CODES.items()}
+    path = {'transitions': [{'jumpkind': names[jumpkind], 'dst': hex(dst), 'ret': hex(ret)} for jumpkind,dst,ret in zip(jumpkinds, dsts, rets)]}
+    transition_bitwidth = formatter.JUMPKIND_BITWIDTH + 2*addr_bitwidth
+    elems_per_field_element = math.floor(P_BITWIDTH/transition_bitwidth)
+
+    binified, binify_time = timed(binify_path, path)
+    numified, numify_time = timed(numify_binified_path, binified)
+    reference, pack_time = timed(string_pack, numified, transition_bitwidth)
+    packed, engine_transitions_time = timed(packing.pack_transitions, jumpkinds, dsts, rets, formatter.JUMPKIND_BITWIDTH, addr_bitwidth)
+    compressed, engine_pack_time = timed(packing.pack_fields, packed, transition_bitwidth, elems_per_field_element)
+    if compressed != reference:
+        raise Exception('The packed execution path differs from the string-based packing')
+
+    print('Execution path: %s transitions of %s bits, %s field elements' %(num_transitions, transition_bitwidth, len(compressed)))
+    report('transitions (binify+numify)', binify_time + numify_time, engine_transitions_time)
+    report('field elements (compress)', pack_time, engine_pack_time)
+    report('total', binify_time + numify_time + pack_time, engine_transitions_time + engine_pack_time)
+
+def benchmark_adjlist(num_nodes, max_neighbors, radix, seed):
+    adjlist = random_adjlist(num_nodes, max_neighbors, seed)
+    encoded = encode_adjlist(adjlist, radix)
+    levels = max(1, len(max([list(levels) for node,levels in encoded], key=len)))
+    bucket_bitwidth = len(format(math.floor(num_nodes/radix), '0b'))
+    formatter.BUCKET_BITWIDTH, formatter.BUCKET_RADIX = bucket_bitwidth, radix
+
+    binified, binify_time = timed(binify_encoded_adjlist, encoded)
+    numified, numify_time = timed(numify_binified_adjlist, binified)
+    packed, engine_time = timed(packing.pack_encoded_adjlist, encoded, bucket_bitwidth, radix)
+    if packed != numified:
+        raise Exception('The packed adjacency list differs from the string-based packing')
+    neighbors_bitwidth = levels*(bucket_bitwidth + radix)
+    reference, pack_time = timed(string_pack, [neighbors for node,neighbors in numified], neighbors_bitwidth)
+    compressed, engine_pack_time = timed(packing.pack_fields, [neighbors for node,neighbors in packed], neighbors_bitwidth, math.floor(P_BITWIDTH/neighbors_bitwidth))
+    if compressed != reference:
+        raise Exception('The compressed adjacency list differs from the string-based packing')
+
+    print('Adjacency list: %s nodes, %s levels of %s bits, %s field elements' %(num_nodes, levels, bucket_bitwidth + radix, len(compressed)))
+    report('nodes (binify+numify)', binify_time + numify_time, engine_time)
+    report('field elements (compress)', pack_time, engine_pack_time)
+    report('total', binify_time + numify_time + pack_time, engine_time + engine_pack_time)
+
+def usage():
+    print('Usage: %s [options]'%sys.argv[0])
+    print('Options:')
+    print('  -h                       This help message')
+    print('  -n <num>                 Number of transitions in the execution path (default 1000000)')
+    print('  --address-bitwidth <num> Bitwidth of the addresses in the execution path (default 24)')
+    print('  --adjlist-len <num>      Number of nodes in the adjacency list (default 10000)')
+    print('  --seed <num>             Seed of the random inputs (default 0)')
+
+if __name__ == '__main__':
+    num_transitions = 1000000
+    addr_bitwidth = 24
+    adjlist_len = 10000
+    seed = 0
+    try:
+        opts,args=getopt.getopt(sys.argv[1:],'hn:',['address-bitwidth=','adjlist-len=','seed='])
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(2)
+    for opt,arg in opts:
+        if opt=='-h':
+            usage()
+            sys.exit()
+        elif opt=='-n':
+            num_transitions=int(arg)
+        elif opt=='--address-bitwidth':
+            addr_bitwidth=int(arg)
+        elif opt=='--adjlist-len':
+            adjlist_len=int(arg)
+        elif opt=='--seed':
+            seed=int(arg)
+    formatter.ADDR_BITWIDTH = addr_bitwidth
+    print('numpy: %s, field backend: %s\n' %(packing.numpy.__version__ if packing.numpy is not None else 'not installed', get_field_backend().name))
+    print('%-28s %12s %12s %9s' %('', 'strings', 'integers', 'speedup'))
+    benchmark_path(num_transitions, addr_bitwidth, seed)
+    print()
+    benchmark_adjlist(adjlist_len, 6, formatter.BUCKET_RADIX, seed)
@@ -0,0 +1,488 @@
+#################################
+## Author: Heini Bergsson Debes
+#################################
+# In-process API of the ZEKRA toolchain for callers (e.g., a service) that want to go from an extracted CFG and
+# execution path to the circuit inputs and the circuit configuration without the scripts' module globals and
+# without writing or re-reading any files in between:
+#   ExtractionResult  what extractor.py writes (raw and numified adjacency lists, translator, recorded and numified
+#                     execution paths), returned by extractor.extract or parsed once from an application directory
+#                     or a binary container
+#   CircuitInputs     what circuit_input_formatter.py writes (encoded adjacency list, translator, paths, nonces and
+#                     digests), returned by format_inputs(extraction, ...)
+#   CircuitConfig     the parameters of compile_circuit.py, returned by CircuitInputs.config(...)
+# Each stage keeps its data in memory and write() produces the same files as the corresponding script. E.g.,
+#   extraction = ExtractionResult.from_dir('./embench-iot-applications/crc32')
+#   inputs = format_inputs(extraction, nonce_verifier=42, pad_path=500)
+#   inputs.write('./out'); inputs.config(stack_depth=15).configure(program_lines)
+# The field backend is still chosen per process (see poseidon_field.set_field_backend).
+# format_paths attests many recorded paths against the CFG of one CircuitInputs (circuit_input_formatter.py --paths)
+# and run_batch formats the jobs of a manifest (circuit_input_formatter.py --batch) across a process pool.
+
+import os, math, json, time
+import multiprocessing
+from circuit_input_formatter import encode_adjlist, pad_adjlist_entries, pad_translator_entries, required_adjlist_levels, required_label_bitwidth, required_bucket_bitwidth, choose_bucket_radix, make_multiple_of, hash_many, JUMPKIND_BITWIDTH, JUMPKIND_CODES, EMPTY_DEST_ADDR, BUCKET_RADICES, P_BITWIDTH
+from binary_container import Container, write_container, read_adjlist_sections, read_path_sections, JUMPKIND_NAMES
+from packing import pack_encoded_adjlist, pack_transitions, pack_fields
+from poseidon.poseidon_sponge import PoseidonSponge
+from poseidon.poseidon_field import set_field_backend, get_field_backend
+from compile_circuit import configure_data_structures, build
+
+class ExecutionPath:
+    # an execution path as columns: the jumpkind codes of JUMPKIND_CODES and integer destinations and return nodes,
+    # where the return node of a transition that is not a call is a placeholder (0 as extracted, the empty node once
+    # formatted for the circuit)
+    def __init__(self, initial_node, final_node, jumpkinds, dsts, rets, num_transitions_pre_pad=None):
+        self.initial_node = initial_node
+        self.final_node = final_node
+        self.jumpkinds = jumpkinds
+        self.dsts = dsts
+        self.rets = rets
+        self.num_transitions_pre_pad = len(jumpkinds) if num_transitions_pre_pad is None else num_transitions_pre_pad
+
+    def __len__(self):
+        return len(self.jumpkinds)
+
+    @classmethod
+    def from_dict(cls, path):
+        # the extractor's representation: {'initial_node', 'final_node', 'transitions': [{'jumpkind', 'dst', 'ret'}]},
+        # with int labels or their hex/decimal strings
+        label = lambda x: x if isinstance(x, int) else int(x, 0)
+        transitions = path['transitions']
+        return cls(label(path['initial_node']), label(path['final_node']),
+            [JUMPKIND_CODES[transition['jumpkind']] for transition in transitions],
+            [label(transition['dst']) for transition in transitions],
+            [label(transition['ret']) if transition['jumpkind'] == 'call' else 0 for transition in transitions])
+
+    @classmethod
+    def from_sections(cls, sections, name):
+        initial_node, final_node = sections[name+'_ends']
+        return cls(initial_node, final_node, list(sections[name+'_jumpkinds']), list(sections[name+'_dsts']), list(sections[name+'_rets']))
+
+    def sections(self, name):
+        return [(name+'_ends', [self.initial_node, self.final_node]), (name+'_jumpkinds', self.jumpkinds), (name+'_dsts', self.dsts), (name+'_rets', self.rets)]
+
+    def max_stack_depth(self):
+        max_depth = depth = 0
+        for jumpkind in self.jumpkinds:
+            if jumpkind == JUMPKIND_CODES['call']:
+                depth += 1
+                max_depth = max(max_depth, depth)
+            elif jumpkind == JUMPKIND_CODES['ret']:
+                depth -= 1
+        return max_depth
+
+    def write(self, filename, label=hex):
+        # the extractor's file format (label is hex for the recorded path and str for the numified path)
+        with open(filename, 'w') as out:
+            out.write('initial_node=%s final_node=%s\n' %(label(self.initial_node), label(self.final_node)))
+            for jumpkind,dst,ret in zip(self.jumpkinds, self.dsts, self.rets):
+                if jumpkind == JUMPKIND_CODES['call']:
+                    out.write('call %s %s\n' %(label(dst), label(ret)))
+                else:
+                    out.write('%s %s\n' %(JUMPKIND_NAMES[jumpkind], label(dst)))
+
+class ExtractionResult:
+    def __init__(self, adjlist, numified_adjlist, translator, recorded_path, numified_path):
+        self.adjlist = adjlist # [(address, [successor addresses])]
+        self.numified_adjlist = numified_adjlist # [(label, [successor labels])], ordered by label
+        self.translator = translator # block address of each label
+        self.recorded_path = recorded_path # ExecutionPath over addresses
+        self.numified_path = numified_path # ExecutionPath over labels
+
+    @classmethod
+    def from_graph(cls, graph, order, labels, translator, recorded_path, numified_path):
+        # from the extractor's CSRGraph and labeling (see CSRGraph.label_order and label_optimizer)
+        adjlist = [(graph.addrs[u], [graph.addrs[v] for v in graph.successors(u)]) for u in range(graph.num_nodes)]
+        numified_adjlist = [(label, [labels[v] for v in graph.successors(u)]) for label,u in enumerate(order)]
+        return cls(adjlist, numified_adjlist, translator, recorded_path, numified_path)
+
+    @classmethod
+    def from_sections(cls, sections):
+        def adjlist(name):
+            nodes, offsets, targets = sections[name+'_nodes'], sections[name+'_offsets'], sections[name+'_targets']
+            return [(node, list(targets[offsets[i]:offsets[i+1]])) for i,node in enumerate(nodes)]
+        return cls(adjlist('adjlist'), adjlist('numified_adjlist'), list(sections['translator']),
+            ExecutionPath.from_sections(sections, 'recorded_path'), ExecutionPath.from_sections(sections, 'numified_path'))
+
+    @classmethod
+    def from_dir(cls, app_dir):
+        # parses each of the extractor's files in app_dir once
+        sections = read_adjlist_sections(os.path.join(app_dir, 'adjlist'), 'adjlist', True)
+        sections += read_adjlist_sections(os.path.join(app_dir, 'numified_adjlist'), 'numified_adjlist', False)
+        with open(os.path.join(app_dir, 'translator'), 'r') as file_in:
+            sections.append(('translator', [int(line, 16) for line in file_in if line.strip() != '']))
+        sections += read_path_sections(os.path.join(app_dir, 'recorded_path'), 'recorded_path', True)
+        sections += read_path_sections(os.path.join(app_dir, 'numified_path'), 'numified_path', False)
+        return cls.from_sections(dict(sections))
+
+    @classmethod
+    def from_container(cls, filename):
+        with Container(filename) as container:
+            return cls.from_sections({name: container.values(name) for name in container.sections})
+
+    def sections(self):
+        sections = []
+        for name,adjlist in (('adjlist', self.adjlist), ('numified_adjlist', self.numified_adjlist)):
+            offsets = [0]
+            targets = []
+            for node,successors in adjlist:
+                targets.extend(successors)
+                offsets.append(len(targets))
+            sections += [(name+'_nodes', [node for node,successors in adjlist]), (name+'_offsets', offsets), (name+'_targets', targets)]
+        sections.append(('translator', self.translator))
+        return sections + self.recorded_path.sections('recorded_path') + self.numified_path.sections('numified_path')
+
+    def write_container(self, filename):
+        write_container(filename, self.sections())
+
+    def write(self, app_dir):
+        # the files written by the extractor
+        with open(os.path.join(app_dir, 'translator'), 'w') as out:
+            for addr in self.translator:
+                out.write('%s\n' %hex(addr))
+        for filename,adjlist,label in (('numified_adjlist', self.numified_adjlist, str), ('adjlist', self.adjlist, hex)):
+            with open(os.path.join(app_dir, filename), 'w') as out:
+                for node,successors in adjlist:
+                    out.write(' '.join([label(node)] + [label(successor) for successor in successors]) + '\n')
+        self.recorded_path.write(os.path.join(app_dir, 'recorded_path'), hex)
+        self.numified_path.write(os.path.join(app_dir, 'numified_path'), str)
+
+    def max_address(self):
+        return max([node for node,successors in self.adjlist] + [successor for node,successors in self.adjlist for successor in successors] + [0])
+
+class CircuitConfig:
+    # the parameters of compile_circuit.py (the sizes of the circuit's data structures and its bitwidths)
+    def __init__(self, adjlist_size, adjlist_levels, execution_path_size, shadowstack_depth, label_bitwidth, bucket_bitwidth, addr_bitwidth, bucket_radix=8):
+        self.adjlist_size = adjlist_size
+        self.adjlist_levels = adjlist_levels
+        self.execution_path_size = execution_path_size
+        self.shadowstack_depth = shadowstack_depth
+        self.label_bitwidth = label_bitwidth
+        self.bucket_bitwidth = bucket_bitwidth
+        self.addr_bitwidth = addr_bitwidth
+        self.bucket_radix = bucket_radix
+
+    def key(self):
+        return (self.adjlist_size, self.adjlist_levels, self.execution_path_size, self.shadowstack_depth, self.label_bitwidth, self.bucket_bitwidth, self.addr_bitwidth, self.bucket_radix)
+
+    def configure(self, program_lines):
+        # sets the data structures of the ZEKRA Java program (lines as read by compile_circuit.read_component)
+        return configure_data_structures(program_lines, self.adjlist_size, self.adjlist_levels, self.execution_path_size, self.shadowstack_depth, self.label_bitwidth, self.bucket_bitwidth, self.addr_bitwidth, self.bucket_radix)
+
+    def build(self, build_root, zekra_dir=None):
+        # compiles the circuit into build_root unless it was compiled for this key before (see compile_circuit.build,
+        # and compile_circuit.evaluate to run it on inputs); returns (build directory, whether it was cached)
+        return build(build_root, self.key(), zekra_dir)
+
+    def args(self):
+        # the corresponding command line options of compile_circuit.py
+        return ['--adjlist-len', str(self.adjlist_size), '--adjlist-levels', str(self.adjlist_levels), '--path-len', str(self.execution_path_size),
+            '--stack-depth', str(self.shadowstack_depth), '--label-bitwidth', str(self.label_bitwidth), '--bucket-bitwidth', str(self.bucket_bitwidth),
+            '--address-bitwidth', str(self.addr_bitwidth), '--bucket-radix', str(self.bucket_radix)]
+
+class CircuitInputs:
+    def __init__(self, encoded_adjlist, translator, numified_path, recorded_path, nonces, digests, params, max_stack_depth):
+        self.encoded_adjlist = encoded_adjlist # encoded neighbors of every (padded) node
+        self.translator = translator # padded, followed by the empty destination address
+        self.numified_path = numified_path # padded ExecutionPath, rets are the empty node unless the transition is a call
+        self.recorded_path = recorded_path # padded ExecutionPath, padding is empty moves (jumpkind 3) to address 0
+        self.nonces = nonces # {'verifier', 'path', 'translator', 'adjlist'}
+        self.digests = digests # {'adjlist', 'translator', 'recorded_path'}
+        self.params = params # {'adjlist_levels', 'label_bitwidth', 'bucket_bitwidth', 'bucket_radix', 'addr_bitwidth'}
+        self.max_stack_depth = max_stack_depth
+
+    def config(self, stack_depth=None):
+        # the circuit these inputs fit (the shadow stack defaults to the depth the numified path needs)
+        if stack_depth is None: stack_depth = max(self.max_stack_depth, 1)
+        params = self.params
+        return CircuitConfig(len(self.encoded_adjlist), params['adjlist_levels'], len(self.recorded_path), stack_depth, params['label_bitwidth'], params['bucket_bitwidth'], params['addr_bitwidth'], params['bucket_radix'])
+
+    def files(self):
+        # file name -> contents, exactly as written by circuit_input_formatter.py
+        return {
+            'in_encoded_adjlist': '\n'.join(str(neighbors) for neighbors in self.encoded_adjlist),
+            'in_encoded_adjlist_digest': str(self.digests['adjlist']),
+            'in_translator': '\n'.join(str(addr) for addr in self.translator),
+            'in_translator_digest': str(self.digests['translator']),
+            'in_numified_path': '\n'.join('%s %s' %(dst, ret) for dst,ret in zip(self.numified_path.dsts, self.numified_path.rets)),
+            'in_initial_node': str(self.numified_path.initial_node),
+            'in_final_node': str(self.numified_path.final_node),
+            'in_nonce_verifier': str(self.nonces['verifier']),
+            'in_nonce_path': str(self.nonces['path']),
+            'in_nonce_translator': str(self.nonces['translator']),
+            'in_nonce_adjlist': str(self.nonces['adjlist']),
+            'in_recorded_path': '\n'.join('%s %s %s' %transition for transition in zip(self.recorded_path.jumpkinds, self.recorded_path.dsts, self.recorded_path.rets)),
+            'in_recorded_path_digest': str(self.digests['recorded_path']),
+        }
+
+    def write(self, out_dir):
+        for filename,contents in self.files().items():
+            with open(os.path.join(out_dir, filename), 'w') as file_out:
+                file_out.write(contents)
+
+def sponge_digest(elems, elem_bitwidth, nonces):
+    # circuit_input_formatter's hash of the elems packed into field elements, followed by the nonces
+    field_elements = pack_fields(elems, elem_bitwidth, math.floor(P_BITWIDTH/elem_bitwidth))
+    return PoseidonSponge().absorb(field_elements).finalize(nonces)
+
+def pad_execution_path(path, pad, empty_move_dst):
+    # a copy of path for the circuit: the placeholder return nodes become empty_move_dst and empty moves are appended
+    jumpkinds = list(path.jumpkinds)
+    dsts = list(path.dsts)
+    rets = [ret if jumpkind == JUMPKIND_CODES['call'] else empty_move_dst for jumpkind,ret in zip(path.jumpkinds, path.rets)]
+    if pad:
+        if pad<len(jumpkinds):
+            raise Exception('Execution path contains %s transitions. Cannot apply padding of %s moves.'%(len(jumpkinds), pad))
+        jumpkinds.extend([JUMPKIND_CODES['empty']]*(pad-len(jumpkinds)))
+        dsts.extend([empty_move_dst]*(pad-len(dsts)))
+        rets.extend([empty_move_dst]*(pad-len(rets)))
+    return ExecutionPath(path.initial_node, path.final_node, jumpkinds, dsts, rets, len(path))
+
+def format_inputs(extraction, nonce_verifier=0, nonce_path=0, nonce_translator=0, nonce_adjlist=0, pad_adjlist=None, pad_path=None,
+        adjlist_levels=None, label_bitwidth=None, bucket_bitwidth=None, bucket_radix=8, addr_bitwidth=None):
+    # circuit_input_formatter.py for an ExtractionResult: unset parameters default to their minimums (bucket_radix=None
+    # picks the radix like '--bucket-radix auto'), and parameters below their minimums raise an exception
+    for name,nonce in (('verifier', nonce_verifier), ('path', nonce_path), ('translator', nonce_translator), ('adjlist', nonce_adjlist)):
+        if len(format(nonce,'0b'))>=P_BITWIDTH:
+            raise Exception('The %s nonce is too big. Maximum bitwidth is %s due to the currently considered finite field.'%(name, P_BITWIDTH))
+    adjlist,len_without_pad = pad_adjlist_entries({str(node): successors for node,successors in extraction.numified_adjlist}, pad_adjlist)
+    if bucket_radix is None:
+        bucket_radix = choose_bucket_radix(adjlist, BUCKET_RADICES, verbose=False)
+    minimums = {
+        'adjlist_levels': required_adjlist_levels(adjlist, bucket_radix),
+        'label_bitwidth': required_label_bitwidth(adjlist),
+        'bucket_bitwidth': required_bucket_bitwidth(adjlist, bucket_radix),
+        'addr_bitwidth': len(format(extraction.max_address(),'0b')),
+    }
+    params = {'adjlist_levels': adjlist_levels, 'label_bitwidth': label_bitwidth, 'bucket_bitwidth': bucket_bitwidth, 'addr_bitwidth': addr_bitwidth}
+    for name,minimum in minimums.items():
+        if params[name] is None:
+            params[name] = minimum
+        elif params[name]<minimum:
+            raise Exception('The provided %s (%s) is too small. Minimum is %s.'%(name, params[name], minimum))
+    params['bucket_radix'] = bucket_radix
+    neighbors_bitwidth = (params['bucket_bitwidth']+bucket_radix)*params['adjlist_levels']
+    if neighbors_bitwidth>=P_BITWIDTH:
+        raise Exception('(BUCKET_BITWIDTH+BUCKET_RADIX)*ADJ_LIST_LEVELS is %s which exceeds p\'s bitwidth of %s bits (see the implementation notes)'%(neighbors_bitwidth, P_BITWIDTH))
+
+    encoded_adjlist = [neighbors for node,neighbors in pack_encoded_adjlist(encode_adjlist(adjlist, bucket_radix), params['bucket_bitwidth'], bucket_radix)]
+    translator,len_without_pad = pad_translator_entries(list(extraction.translator), pad_adjlist)
+    num_nodes = len(adjlist)
+    numified_path = pad_execution_path(extraction.numified_path, pad_path, num_nodes)
+    recorded_path = pad_execution_path(extraction.recorded_path, pad_path, EMPTY_DEST_ADDR)
+
+    addr_bitwidth = params['addr_bitwidth']
+    transitions = pack_transitions(recorded_path.jumpkinds, recorded_path.dsts, recorded_path.rets, JUMPKIND_BITWIDTH, addr_bitwidth)
+    digests = {
+        'adjlist': sponge_digest(encoded_adjlist, neighbors_bitwidth, [nonce_adjlist]),
+        'translator': sponge_digest(translator, addr_bitwidth, [nonce_translator]),
+        'recorded_path': sponge_digest(transitions, JUMPKIND_BITWIDTH+2*addr_bitwidth, [nonce_verifier, nonce_path]),
+    }
+    nonces = {'verifier': nonce_verifier, 'path': nonce_path, 'translator': nonce_translator, 'adjlist': nonce_adjlist}
+    return CircuitInputs(encoded_adjlist, translator, numified_path, recorded_path, nonces, digests, params, extraction.numified_path.max_stack_depth())
+
+def read_paths(file_in):
+    # yields every recorded execution path (the extractor's format with hex addresses) of a file or stream in which
+    # each path starts with its 'initial_node=... final_node=...' line
+    path = None
+    for line in file_in:
+        fields = line.split()
+        if len(fields) == 0: continue
+        if fields[0].startswith('initial_node='):
+            if path is not None:
+                path.num_transitions_pre_pad = len(path)
+                yield path
+            initial_node, final_node = [int(field.split('=')[1], 16) for field in fields]
+            path = ExecutionPath(initial_node, final_node, [], [], [])
+            continue
+        if path is None:
+            raise Exception('The execution path does not start with an \'initial_node=... final_node=...\' line')
+        path.jumpkinds.append(JUMPKIND_CODES[fields[0]])
+        path.dsts.append(int(fields[1], 16))
+        path.rets.append(int(fields[2], 16) if fields[0] == 'call' else 0)
+    if path is not None:
+        path.num_transitions_pre_pad = len(path)
+        yield path
+
+def numify_path(path, translator):
+    # the numified counterpart of a recorded path, labeling each address like the translator (label -> address) does
+    labels = {}
+    for label,addr in enumerate(translator):
+        labels.setdefault(addr, label)
+    def label(addr):
+        if addr not in labels:
+            raise Exception('The execution path visits %s, which is not a node of the CFG' %hex(addr))
+        return labels[addr]
+    rets = [label(ret) if jumpkind == JUMPKIND_CODES['call'] else 0 for jumpkind,ret in zip(path.jumpkinds, path.rets)]
+    return ExecutionPath(label(path.initial_node), label(path.final_node), list(path.jumpkinds), [label(dst) for dst in path.dsts], rets)
+
+def path_hash_input(path, addr_bitwidth, nonce_verifier, nonce_path):
+    # the padded list of field elements that hash() turns into the recorded path's digest (the nonces last)
+    transition_bitwidth = JUMPKIND_BITWIDTH+2*addr_bitwidth
+    field_elements = pack_fields(pack_transitions(path.jumpkinds, path.dsts, path.rets, JUMPKIND_BITWIDTH, addr_bitwidth), transition_bitwidth, math.floor(P_BITWIDTH/transition_bitwidth))
+    padded = make_multiple_of(field_elements, 8, 2)
+    padded[-2:] = [nonce_verifier, nonce_path]
+    return padded
+
+def hash_paths_worker(args):
+    field_backend, padded_lists = args
+    set_field_backend(field_backend)
+    return hash_many(padded_lists)
+
+def format_paths(inputs, translator, recorded_paths, nonces=None, pad_path=None, processes=1):
+    # the CircuitInputs of each recorded path (ExecutionPath over addresses) against the CFG of inputs, whose encoded
+    # adjacency list, translator and their digests are reused as they are. translator is the extraction's (unpadded)
+    # translator; nonces is a (verifier, path) nonce pair per path (default is those of inputs). The paths are hashed
+    # in lockstep (see hash_many), split across a pool of processes if processes > 1. Returns ('ok', CircuitInputs) per path, or
+    # ('error', message) for a path that cannot be formatted (e.g., it visits a node that is not in the CFG), so one
+    # bad path does not stop the others
+    if nonces is None: nonces = [(inputs.nonces['verifier'], inputs.nonces['path'])]*len(recorded_paths)
+    if len(nonces) != len(recorded_paths):
+        raise Exception('Got %s nonce pairs for %s execution paths' %(len(nonces), len(recorded_paths)))
+    num_nodes = len(inputs.encoded_adjlist)
+    addr_bitwidth = inputs.params['addr_bitwidth']
+    numified_paths = []
+    padded_paths = []
+    hash_inputs = []
+    errors = {} # index of the path -> error
+    for i,(path,(nonce_verifier,nonce_path)) in enumerate(zip(recorded_paths, nonces)):
+        try:
+            numified_path = pad_execution_path(numify_path(path, translator), pad_path, num_nodes)
+            padded_path = pad_execution_path(path, pad_path, EMPTY_DEST_ADDR)
+            hash_input = path_hash_input(padded_path, addr_bitwidth, nonce_verifier, nonce_path)
+        except Exception as e:
+            errors[i] = '%s: %s' %(type(e).__name__, e)
+            continue
+        numified_paths.append(numified_path)
+        padded_paths.append(padded_path)
+        hash_inputs.append(hash_input)
+    processes = min(processes or multiprocessing.cpu_count(), len(hash_inputs))
+    if processes > 1:
+        groups = [hash_inputs[i::processes] for i in range(processes)]
+        with multiprocessing.Pool(processes) as pool:
+            hashed = pool.map(hash_paths_worker, [(get_field_backend().name, group) for group in groups])
+        digests = [None]*len(hash_inputs)
+        for i,group in enumerate(hashed):
+            digests[i::processes] = group
+    else:
+        digests = hash_many(hash_inputs) if len(hash_inputs) > 0 else []
+    formatted = iter(zip(numified_paths, padded_paths, digests))
+    results = []
+    for i,(nonce_verifier,nonce_path) in enumerate(nonces):
+        if i in errors:
+            results.append(('error', errors[i]))
+            continue
+        numified_path,recorded_path,digest = next(formatted)
+        path_nonces = dict(inputs.nonces, verifier=nonce_verifier, path=nonce_path)
+        path_digests = dict(inputs.digests, recorded_path=digest)
+        results.append(('ok', CircuitInputs(inputs.encoded_adjlist, inputs.translator, numified_path, recorded_path, path_nonces, path_digests, inputs.params, numified_path.max_stack_depth())))
+    return results
+
+# manifest key -> keyword argument of format_inputs (the keys follow circuit_input_formatter.py's options)
+JOB_OPTIONS = {'nonce_verifier': 'nonce_verifier', 'nonce_path': 'nonce_path', 'nonce_translator': 'nonce_translator', 'nonce_adjlist': 'nonce_adjlist',
+    'pad_adjlist_to': 'pad_adjlist', 'pad_path_to': 'pad_path', 'adjlist_levels': 'adjlist_levels', 'label_bitwidth': 'label_bitwidth',
+    'bucket_bitwidth': 'bucket_bitwidth', 'bucket_radix': 'bucket_radix', 'address_bitwidth': 'addr_bitwidth'}
+JOB_KEYS = set(JOB_OPTIONS) | {'name', 'app_dir', 'container'}
+BATCH_EXTRACTIONS = {} # per process: app dir/container -> ExtractionResult, so jobs sharing an application parse it once
+
+def load_manifest(filename):
+    # a JSON list of jobs, or {"defaults": {...}, "jobs": [...]} where each job overrides the defaults. A job names
+    # its application with "app_dir" (or "container") and may set any key of JOB_OPTIONS; its "name" (by default
+    # its position and the application's directory name) is the name of its output directory
+    with open(filename, 'r') as file_in:
+        manifest = json.load(file_in)
+    if isinstance(manifest, list): manifest = {'jobs': manifest}
+    jobs = []
+    for i,job in enumerate(manifest['jobs']):
+        job = dict(manifest.get('defaults', {}), **job)
+        unknown = set(job) - JOB_KEYS
+        if len(unknown) > 0:
+            raise Exception('Unknown key(s) in job %s of the manifest: %s' %(i, ', '.join(sorted(unknown))))
+        if not job.get('app_dir') and not job.get('container'):
+            raise Exception('Job %s of the manifest has neither an app_dir nor a container' %i)
+        job.setdefault('name', '%s_%s' %(i, os.path.basename(os.path.normpath(job.get('container') or job['app_dir']))))
+        jobs.append(job)
+    names = [job['name'] for job in jobs]
+    if len(set(names)) != len(names):
+        raise Exception('The names of the jobs in the manifest (their output directories) are not unique')
+    return jobs
+
+def run_batch_job(job, out_dir):
+    # formats one job of the manifest into out_dir/<name>; failures are reported in the result instead of raised
+    result = {'name': job['name'], 'app_dir': job.get('app_dir'), 'container': job.get('container'), 'output_dir': os.path.join(out_dir, job['name'])}
+    start = time.perf_counter()
+    try:
+        source = job.get('container') or job['app_dir']
+        extraction = BATCH_EXTRACTIONS.get(source)
+        if extraction is None:
+            extraction = ExtractionResult.from_container(source) if job.get('container') else ExtractionResult.from_dir(source)
+            BATCH_EXTRACTIONS[source] = extraction
+        parsed = time.perf_counter()
+        options = {JOB_OPTIONS[key]: value for key,value in job.items() if key in JOB_OPTIONS}
+        if options.get('bucket_radix') == 'auto': options['bucket_radix'] = None
+        inputs = format_inputs(extraction, **options)
+        formatted = time.perf_counter()
+        os.makedirs(result['output_dir'], exist_ok=True)
+        inputs.write(result['output_dir'])
+        written = time.perf_counter()
+        config = inputs.config()
+        result.update({
+            'status': 'ok',
+            'seconds': {'parse': parsed-start, 'format': formatted-parsed, 'write': written-formatted, 'total': written-start},
+            'digests': {name: str(digest) for name,digest in inputs.digests.items()}, # decimal strings, like the in_*_digest files
+            'nonces': {name: str(nonce) for name,nonce in inputs.nonces.items()},
+            'params': inputs.params,
+            'circuit': {'adjlist_size': config.adjlist_size, 'execution_path_size': config.execution_path_size, 'max_stack_depth': inputs.max_stack_depth},
+        })
+    except Exception as e:
+        result.update({'status': 'error', 'error': '%s: %s' %(type(e).__name__, e), 'seconds': {'total': time.perf_counter()-start}})
+    return result
+
+def init_batch_worker(field_backend):
+    set_field_backend(field_backend)
+
+def run_batch_worker(args):
+    return run_batch_job(*args)
+
+def run_batch(jobs, out_dir, processes=None, summary_filename=None):
+    # runs the jobs across a pool of processes (in this process if processes is 1) and writes the summary (JSON)
+    start = time.perf_counter()
+    processes = processes or multiprocessing.cpu_count()
+    field_backend = get_field_backend().name
+    BATCH_EXTRACTIONS.clear()
+    tasks = [(job, out_dir) for job in jobs]
+    results = []
+    if processes == 1:
+        iterator = map(run_batch_worker, tasks)
+        pool = None
+    else:
+        # consecutive jobs are handed out in chunks, so the jobs of an application listed together mostly share a worker
+        # (and its parsed ExtractionResult)
+        pool = multiprocessing.Pool(max(min(processes, len(tasks)), 1), initializer=init_batch_worker, initargs=(field_backend,))
+        iterator = pool.imap(run_batch_worker, tasks, max(len(tasks)//(4*processes), 1))
+    try:
+        for result in iterator:
+            results.append(result)
+            if result['status'] == 'ok':
+                print('[+] %s: %.3f s -> %s' %(result['name'], result['seconds']['total'], result['output_dir']))
+            else:
+                print('[-] %s: %s' %(result['name'], result['error']))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    summary = {
+        'output_dir': out_dir,
+        'processes': processes,
+        'field_backend': field_backend,
+        'seconds': time.perf_counter()-start,
+        'num_jobs': len(results),
+        'num_failed': len([result for result in results if result['status'] != 'ok']),
+        'jobs': results,
+    }
+    summary_filename = summary_filename or os.path.join(out_dir, 'summary.json')
+    os.makedirs(os.path.dirname(os.path.abspath(summary_filename)), exist_ok=True)
+    with open(summary_filename, 'w') as out:
+        json.dump(summary, out, indent=2)
+        out.write('\n')
+    return summary, summary_filename
@@ -0,0 +1,96 @@
+import os
+
+p = 21888242871839275222246405745257275088548364400416034343698204186575808495617
+
+try:
+	import gmpy2
+except ImportError:
+	gmpy2 = None
+
+# Every backend represents elements of GF(p) in its own way, but they all expose the same small interface:
+#   to_field/from_field  convert between Python ints and the backend representation
+#   constant(c)          representation of an additive (round) constant
+#   coefficient(c)       representation of a matrix coefficient (multiplied with field elements)
+#   exp5(x)              x^5 of an already reduced element
+#   pack(elems, bitwidth) packs small integers into one integer (elems[0] occupying the least significant bits)
+# Sums and coefficient products are reduced with '% modulus' by the permutation itself.
+
+class PythonField:
+	name = 'python'
+
+	def __init__(self):
+		self.modulus = p
+
+	def to_field(self, x):
+		return x % p
+
+	def from_field(self, x):
+		return x
+
+	def constant(self, c):
+		return c % p
+
+	def coefficient(self, c):
+		return c % p
+
+	def exp5(self, x):
+		x2 = x*x % p
+		x4 = x2*x2 % p
+		return x4*x % p
+
+	def pack(self, elems, bitwidth):
+		packed = 0
+		for k,elem in enumerate(elems):
+			packed += elem << (k*bitwidth)
+		return packed
+
+class Gmpy2Field(PythonField):
+	name = 'gmpy2'
+
+	def __init__(self):
+		self.modulus = gmpy2.mpz(p)
+
+	def to_field(self, x):
+		return gmpy2.mpz(x) % self.modulus
+
+	def from_field(self, x):
+		return int(x)
+
+	def constant(self, c):
+		return gmpy2.mpz(c % p)
+
+	def coefficient(self, c):
+		return gmpy2.mpz(c % p)
+
+	def exp5(self, x):
+		return gmpy2.powmod(x, 5, self.modulus)
+
+	def pack(self, elems, bitwidth):
+		return int(gmpy2.pack(list(elems), bitwidth)) # every elem must fit into bitwidth bits
+
+BACKENDS = {
+	'python': PythonField,
+	'gmpy2': Gmpy2Field,
+}
+
+def available_backends():
+	return [name for name in BACKENDS if name != 'gmpy2' or gmpy2 is not None]
+
+def default_backend():
+	return 'gmpy2' if gmpy2 is not None else 'python'
+
+_FIELD = None
+
+def set_field_backend(name):
+	global _FIELD
+	if name not in BACKENDS:
+		raise Exception('Unknown field backend \'%s\' (choose from: %s)'%(name, ', '.join(BACKENDS)))
+	if name not in available_backends():
+		raise Exception('Field backend \'%s\' is not available (is the gmpy2 package installed?)'%name)
+	_FIELD = BACKENDS[name]()
+	return _FIELD
+
+def get_field_backend():
+	if _FIELD is None:
+		set_field_backend(os.environ.get('ZEKRA_FIELD_BACKEND', default_backend()))
+	return _FIELD
@@ -1,7 +1,11 @@
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
 from poseidon.poseidon_constants import POSEIDON_C
 from poseidon.poseidon_constants import POSEIDON_M
-
-p = 21888242871839275222246405745257275088548364400416034343698204186575808495617
+from poseidon.poseidon_field import p, get_field_backend
 
 def exp5(in1):
 	in2=in1*in1%p
@@ -32,24 +36,199 @@ def sbox(nRoundsF, nRoundsP, state, i):
 		state[0] = exp5(state[0])
 	return state
 
-def poseidon_hash(input):
-	nInputs = len(input)-1
-	N_ROUNDS_P = [56, 57, 56, 60, 60, 63, 64, 63]
-	t = nInputs + 1
-	nRoundsF = 8
+N_ROUNDS_F = 8
+N_ROUNDS_P = [56, 57, 56, 60, 60, 63, 64, 63]
+LOCKSTEP_MIN_STATES = 64 # smaller batches are permuted one state at a time (see permute_many)
+
+# permutation parameters per width (and per field backend), derived once on first use (see load_params)
+_BASE_PARAMS = {}
+_PARAMS = {}
+
+def mat_mul(A, B):
+	return [[sum(A[i][k]*B[k][j] for k in range(0, len(B))) % p for j in range(0, len(B[0]))] for i in range(0, len(A))]
+
+def mat_inv(A):
+	# Gauss-Jordan elimination over GF(p)
+	n = len(A)
+	aug = [[x % p for x in row] + [1 if i == j else 0 for j in range(0, n)] for i,row in enumerate(A)]
+	for col in range(0, n):
+		pivot = next(r for r in range(col, n) if aug[r][col] != 0)
+		aug[col],aug[pivot] = aug[pivot],aug[col]
+		inv = pow(aug[col][col], p-2, p)
+		aug[col] = [x*inv % p for x in aug[col]]
+		for r in range(0, n):
+			if r != col and aug[r][col] != 0:
+				f = aug[r][col]
+				aug[r] = [(x - f*y) % p for x,y in zip(aug[r], aug[col])]
+	return [row[n:] for row in aug]
+
+def derive_params(t):
+	# Precomputes the optimized round structure from the Poseidon paper (appendix B) for width t:
+	# (1) all round constants are reduced mod p once,
+	# (2) in the partial rounds the constants of state[1..t-1] are pushed through the linear layer into
+	#     the next round, leaving a single scalar constant (for state[0]) per partial round,
+	# (3) each partial round's dense MDS matrix M is factored as M = M'' * M', where M' = diag(1, M_hat)
+	#     commutes with the partial S-box and is folded into the preceding round, leaving the sparse M''
+	#     (first row, first column, identity elsewhere) in every partial round.
+	if t in _BASE_PARAMS: return _BASE_PARAMS[t]
 	nRoundsP = N_ROUNDS_P[t - 2]
+	first_partial = N_ROUNDS_F//2
+	last_partial = first_partial + nRoundsP
+	C = [c % p for c in POSEIDON_C(t)]
+	M = [[m % p for m in row] for row in POSEIDON_M(t)]
+	rc = [C[i*t:(i+1)*t] for i in range(0, N_ROUNDS_F + nRoundsP)]
+
+	# (2) constant pushing
+	for r in range(first_partial, last_partial):
+		rest = [0] + rc[r][1:]
+		pushed = [sum(M[i][j]*rest[j] for j in range(0, t)) % p for i in range(0, t)]
+		rc[r+1] = [(a + b) % p for a,b in zip(rc[r+1], pushed)]
+		rc[r] = [rc[r][0]] + [0]*(t-1)
+
+	# (3) sparse matrix factorization, processed backwards from the last partial round
+	# (the lower-right block of the matrix being factored in round r is Mhat^k, so its inverse is
+	# obtained by repeated multiplication with Mhat^-1 instead of a fresh inversion every round)
+	sparse = [None]*nRoundsP
+	cur = M
+	Mhat_inv = mat_inv([row[1:] for row in M[1:]])
+	M_hat_inv = None
+	for r in range(last_partial-1, first_partial-1, -1):
+		M_hat = [row[1:] for row in cur[1:]]
+		M_hat_inv = Mhat_inv if M_hat_inv is None else mat_mul(Mhat_inv, M_hat_inv)
+		w = [sum(cur[0][1+k]*M_hat_inv[k][j] for k in range(0, t-1)) % p for j in range(0, t-1)]
+		v = [cur[i][0] for i in range(1, t)]
+		sparse[r-first_partial] = (cur[0][0], w, v)
+		M_prime = [[1] + [0]*(t-1)] + [[0] + row for row in M_hat]
+		cur = mat_mul(M_prime, M)
+	pre_sparse = cur # replaces M in the last full round before the partial rounds
 
-	C = POSEIDON_C(t)
-	M = POSEIDON_M(t)
+	params = {
+		't': t,
+		'nRoundsP': nRoundsP,
+		'first_partial': first_partial,
+		'last_partial': last_partial,
+		'C': rc,
+		'C_partial': [rc[r][0] for r in range(first_partial, last_partial)],
+		'M': M,
+		'M_pre_sparse': pre_sparse,
+		'sparse': sparse,
+	}
+	_BASE_PARAMS[t] = params
+	return params
 
-	state = []
-	for item in input:
-		state.append(item)
-	for i in range(0, nRoundsF + nRoundsP):
-		state = ark(state, C, i*t)
-		state = sbox(nRoundsF, nRoundsP, state, i)
-		state = mix(state, M)
+def load_params(t, field=None):
+	# converts the derived parameters into the representation of the given field backend
+	if field is None: field = get_field_backend()
+	if (t, field.name) in _PARAMS: return _PARAMS[(t, field.name)]
+	base = derive_params(t)
+	constants = lambda row: [field.constant(c) for c in row]
+	coefficients = lambda row: [field.coefficient(c) for c in row]
+	params = dict(base)
+	params.update({
+		'field': field,
+		'p': field.modulus,
+		'exp5': field.exp5,
+		'C': [constants(row) for row in base['C']],
+		'C_partial': constants(base['C_partial']),
+		'M': [coefficients(row) for row in base['M']],
+		'M_pre_sparse': [coefficients(row) for row in base['M_pre_sparse']],
+		'sparse': [(field.coefficient(m00), coefficients(w), coefficients(v)) for m00,w,v in base['sparse']],
+	})
+	_PARAMS[(t, field.name)] = params
+	return params
 
-	for idx,scalar in enumerate(state):
-		state[idx] = state[idx] % p
+def full_round(state, C, M, p, exp5):
+	state = [s + c for s,c in zip(state, C)]
+	state = [exp5(s % p) for s in state]
+	return [sum(m*s for m,s in zip(row, state)) % p for row in M]
+
+def permute(state, params):
+	# state (and result) are in the representation of params['field']
+	first_partial = params['first_partial']
+	last_partial = params['last_partial']
+	C = params['C']
+	M = params['M']
+	p = params['p']
+	exp5 = params['exp5']
+	for i in range(0, first_partial-1):
+		state = full_round(state, C[i], M, p, exp5)
+	state = full_round(state, C[first_partial-1], params['M_pre_sparse'], p, exp5)
+	for c,(m00,w,v) in zip(params['C_partial'], params['sparse']):
+		x0 = state[0] + c
+		x0 = exp5(x0 % p)
+		s0 = m00*x0
+		for wj,sj in zip(w, state[1:]):
+			s0 += wj*sj
+		state = [s0 % p] + [(vi*x0 + si) % p for vi,si in zip(v, state[1:])]
+	for i in range(last_partial, N_ROUNDS_F + params['nRoundsP']):
+		state = full_round(state, C[i], M, p, exp5)
 	return state
+
+def poseidon_hash(input):
+	field = get_field_backend()
+	params = load_params(len(input), field)
+	return [field.from_field(x) for x in permute([field.to_field(x) for x in input], params)]
+
+def exp5_columns(x, p):
+	x2 = x*x % p
+	x4 = x2*x2 % p
+	return x4*x % p
+
+def full_round_columns(columns, C, M, p):
+	columns = [exp5_columns((s + c) % p, p) for s,c in zip(columns, C)]
+	mixed = []
+	for row in M:
+		acc = row[0]*columns[0]
+		for m,s in zip(row[1:], columns[1:]):
+			acc += m*s
+		mixed.append(acc % p)
+	return mixed
+
+def permute_columns(columns, params):
+	# permute() of many states in lockstep: columns[j] is a numpy object array holding element j of every state, so
+	# each round is a few array operations over the whole batch instead of a Python loop per state. In the partial
+	# rounds only state[0] is reduced; the other elements are reduced once after the last partial round
+	first_partial = params['first_partial']
+	last_partial = params['last_partial']
+	C = params['C']
+	M = params['M']
+	p = params['p']
+	for i in range(0, first_partial-1):
+		columns = full_round_columns(columns, C[i], M, p)
+	columns = full_round_columns(columns, C[first_partial-1], params['M_pre_sparse'], p)
+	for c,(m00,w,v) in zip(params['C_partial'], params['sparse']):
+		x0 = exp5_columns((columns[0] + c) % p, p)
+		s0 = m00*x0
+		for wj,sj in zip(w, columns[1:]):
+			s0 += wj*sj
+		columns = [s0 % p] + [vi*x0 + si for vi,si in zip(v, columns[1:])]
+	columns = [column % p for column in columns]
+	for i in range(last_partial, N_ROUNDS_F + params['nRoundsP']):
+		columns = full_round_columns(columns, C[i], M, p)
+	return columns
+
+def permute_many(states, params):
+	# permute() of every state (all of width params['t']). With numpy, batches of at least LOCKSTEP_MIN_STATES
+	# states of the python backend run in lockstep (see permute_columns); gmpy2's arithmetic dominates its
+	# permutations, so lockstep does not pay off there and its states are permuted one at a time
+	if numpy is None or params['field'].name != 'python' or len(states) < LOCKSTEP_MIN_STATES:
+		return [permute(state, params) for state in states]
+	columns = []
+	for j in range(0, params['t']):
+		column = numpy.empty(len(states), dtype=object)
+		column[:] = [state[j] for state in states]
+		columns.append(column)
+	return [list(state) for state in zip(*[column.tolist() for column in permute_columns(columns, params)])]
+
+def poseidon_hash_many(states):
+	# poseidon_hash of every state (of any width), in input order; states of equal width are permuted together
+	field = get_field_backend()
+	outputs = [None]*len(states)
+	by_width = {}
+	for idx,state in enumerate(states):
+		by_width.setdefault(len(state), []).append(idx)
+	for t,indices in by_width.items():
+		permuted = permute_many([[field.to_field(x) for x in states[idx]] for idx in indices], load_params(t, field))
+		for idx,state in zip(indices, permuted):
+			outputs[idx] = [field.from_field(x) for x in state]
+	return outputs
@@ -0,0 +1,115 @@
+import math
+from poseidon.poseidon_field import p, get_field_backend
+from poseidon.poseidon_hash import load_params, permute
+
+P_BITWIDTH = len(format(p, '0b'))
+
+class PoseidonSponge:
+	# Incremental version of the ZEKRA sponge (see circuit_input_formatter.hash): Poseidon with t=9, the
+	# first element is the capacity and the digest is taken from the second rate element. Full chunks of
+	# 8 field elements are permuted as soon as they are complete, so memory use stays constant.
+	# If elem_bitwidth is given, absorb() takes small elements which are packed into field elements
+	# exactly like circuit_input_formatter.compress does.
+	RATE = 8
+
+	def __init__(self, elem_bitwidth=None):
+		self.field = get_field_backend()
+		self.params = load_params(self.RATE+1, self.field)
+		self.state = [self.field.to_field(0)]*(self.RATE+1)
+		self.chunk = []
+		self.elem_bitwidth = elem_bitwidth
+		self.elems_per_field_element = math.floor(P_BITWIDTH/elem_bitwidth) if elem_bitwidth else 1
+		self.pending = []
+		self.num_elements = 0 # absorbed (unpacked) elements
+		self.num_field_elements = 0 # absorbed field elements (after packing)
+		self.num_calls = 0 # calls to Poseidon so far
+		self.num_padding = 0 # zero field elements added as padding
+		self.digest = None
+
+	def absorb(self, chunk):
+		if self.digest is not None:
+			raise Exception('Cannot absorb into a finalized sponge.')
+		for elem in chunk:
+			self.num_elements += 1
+			if self.elem_bitwidth is None:
+				self.absorb_field_element(elem)
+				continue
+			self.pending.append(elem)
+			if len(self.pending) == self.elems_per_field_element:
+				self.flush_pending()
+		return self
+
+	def absorb_packed(self, field_elements, num_elements):
+		# absorbs num_elements small elements that were already packed into field elements (e.g., by
+		# packing.pack_fields with elems_per_field_element); only the last field element may be partially
+		# filled, in which case nothing more may be absorbed before the checkpoint/finalization
+		if self.digest is not None:
+			raise Exception('Cannot absorb into a finalized sponge.')
+		if len(self.pending) > 0:
+			raise Exception('Cannot absorb packed field elements while unpacked elements are pending.')
+		self.num_elements += num_elements
+		for elem in field_elements:
+			self.absorb_field_element(elem)
+		return self
+
+	def flush_pending(self):
+		if len(self.pending) > 0:
+			self.absorb_field_element(self.field.pack(self.pending, self.elem_bitwidth))
+			self.pending = []
+
+	def absorb_field_element(self, elem):
+		self.num_field_elements += 1
+		self.chunk.append(elem)
+		if len(self.chunk) == self.RATE:
+			self.permute_chunk(self.chunk)
+			self.chunk = []
+
+	def permute_chunk(self, chunk):
+		field = self.field
+		state = self.state
+		for j,elem in enumerate(chunk):
+			state[j+1] = field.to_field(elem) + state[j+1]
+		self.state = permute(state, self.params)
+		self.num_calls += 1
+
+	def checkpoint(self, num_nonces):
+		# Absorbs everything that does not depend on the nonces and returns the sponge state right before
+		# the final chunk (which holds the last data elements followed by the zero padding and nonces), so
+		# that from_checkpoint(...).finalize(nonces) costs a single call to Poseidon for any nonces.
+		self.flush_pending()
+		if len(self.chunk)+num_nonces > self.RATE:
+			self.num_padding += self.RATE-len(self.chunk)
+			self.permute_chunk(self.chunk + [0]*(self.RATE-len(self.chunk)))
+			self.chunk = []
+		return {
+			'state': [self.field.from_field(x) for x in self.state],
+			'chunk': list(self.chunk),
+			'num_elements': self.num_elements,
+			'num_field_elements': self.num_field_elements,
+			'num_calls': self.num_calls,
+			'num_padding': self.num_padding,
+		}
+
+	@classmethod
+	def from_checkpoint(cls, checkpoint):
+		sponge = cls()
+		sponge.state = [sponge.field.to_field(x) for x in checkpoint['state']]
+		sponge.chunk = list(checkpoint['chunk'])
+		sponge.num_elements = checkpoint['num_elements']
+		sponge.num_field_elements = checkpoint['num_field_elements']
+		sponge.num_calls = checkpoint['num_calls']
+		sponge.num_padding = checkpoint['num_padding']
+		return sponge
+
+	def finalize(self, nonces=()):
+		# pads the last chunk with zeros and places the nonces in its final slots (cf. make_multiple_of)
+		if self.digest is not None: return self.digest
+		self.flush_pending()
+		nonces = list(nonces)
+		tail = self.chunk + [0]*((-(len(self.chunk)+len(nonces))) % self.RATE) + nonces
+		self.num_padding += len(tail) - len(self.chunk) - len(nonces)
+		self.chunk = []
+		for i in range(0, len(tail), self.RATE):
+			self.permute_chunk(tail[i:i+self.RATE])
+		self.digest = self.field.from_field(self.state[2])
+		return self.digest
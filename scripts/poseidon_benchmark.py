@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+#################################
+## Author: Heini Bergsson Debes
+#################################
+# Compares hashing many independent states one call at a time (poseidon_hash, and hash for sponges) with the batched
+# poseidon_hash_many and hash_many, which permute the states of each batch in lockstep (see permute_many), checks
+# that both produce the same digests, and reports the timings (best of 3 runs) for growing batch sizes, e.g.,
+#   python3 scripts/poseidon_benchmark.py -n 64,512,2048 --field-backend python
+
+import sys, getopt, random, time
+from poseidon.poseidon_hash import poseidon_hash, poseidon_hash_many, LOCKSTEP_MIN_STATES
+from poseidon.poseidon_field import p, set_field_backend, get_field_backend, available_backends
+from poseidon import poseidon_hash as engine
+from circuit_input_formatter import hash, hash_many
+
+REPEAT = 3 # the timings are the best of REPEAT runs
+
+def timed(function, *args):
+    best = None
+    for i in range(REPEAT):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+def report(name, batch_size, single_time, batch_time):
+    print('%-18s %8s %10.3f s %10.3f s %8.1fx' %(name, batch_size, single_time, batch_time, single_time/batch_time if batch_time > 0 else float('inf')))
+
+def benchmark_states(t, batch_size, seed):
+    rng = random.Random(seed)
+    states = [[rng.randrange(p) for i in range(t)] for j in range(batch_size)]
+    poseidon_hash([0]*t) # loads the parameters of width t outside of the timings
+    reference, single_time = timed(lambda states: [poseidon_hash(state) for state in states], states)
+    digests, batch_time = timed(poseidon_hash_many, states)
+    if digests != reference:
+        raise Exception('poseidon_hash_many differs from poseidon_hash')
+    report('t=%s' %t, batch_size, single_time, batch_time)
+
+def benchmark_sponges(num_chunks, batch_size, seed):
+    rng = random.Random(seed)
+    padded_lists = [[rng.randrange(p) for i in range(8*num_chunks)] for j in range(batch_size)]
+    reference, single_time = timed(lambda padded_lists: [hash(padded_list) for padded_list in padded_lists], padded_lists)
+    digests, batch_time = timed(hash_many, padded_lists)
+    if digests != reference:
+        raise Exception('hash_many differs from hash')
+    report('sponge (%s chunks)' %num_chunks, batch_size, single_time, batch_time)
+
+def usage():
+    print('Usage: %s [options]'%sys.argv[0])
+    print('Options:')
+    print('  -h                       This help message')
+    print('  -n <num,...>             Comma-separated batch sizes (default 16,64,512,2048)')
+    print('  --chunks <num>           Number of chunks of 8 field elements absorbed by each sponge (default 4)')
+    print('  --field-backend <name>   Field backend to benchmark (%s; default is %s)' %(', '.join(available_backends()), get_field_backend().name))
+    print('  --seed <num>             Seed of the random inputs (default 0)')
+
+if __name__ == '__main__':
+    batch_sizes = [16, 64, 512, 2048]
+    num_chunks = 4
+    seed = 0
+    try:
+        opts,args=getopt.getopt(sys.argv[1:],'hn:',['chunks=','field-backend=','seed='])
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(2)
+    for opt,arg in opts:
+        if opt=='-h':
+            usage()
+            sys.exit()
+        elif opt=='-n':
+            batch_sizes=[int(n) for n in arg.split(',')]
+        elif opt=='--chunks':
+            num_chunks=int(arg)
+        elif opt=='--field-backend':
+            set_field_backend(arg)
+        elif opt=='--seed':
+            seed=int(arg)
+    print('numpy: %s, field backend: %s, lockstep from %s states\n' %(engine.numpy.__version__ if engine.numpy is not None else 'not installed', get_field_backend().name, LOCKSTEP_MIN_STATES))
+    print('%-18s %8s %12s %12s %9s' %('', 'batch', 'one by one', 'batched', 'speedup'))
+    for t in [3, 9]:
+        for batch_size in batch_sizes:
+            benchmark_states(t, batch_size, seed)
+    for batch_size in batch_sizes:
+        benchmark_sponges(num_chunks, batch_size, seed)
@@ -0,0 +1,250 @@
+#################################
+## Author: Heini Bergsson Debes
+#################################
+# Records the execution path while angr steps through the application. Each transition is read from the
+# most recent history entry only (history.jumpkind/jump_target) and the history chain is trimmed after every
+# step, so neither the cost of a step nor the memory held by angr grows with the length of the path.
+# Transitions go to a TransitionBuffer, which either keeps them in memory or appends them to a file in
+# bounded batches. Only the recording itself is bounded: the extractor reads the whole trace back afterwards.
+# UnicornTraceRecorder records the same transitions when the concrete run is executed by unicorn, where a
+# single step can cover many basic blocks.
+# The recorder can periodically checkpoint the recorded transitions together with the (trimmed) simulation
+# state, so that a long recording that fails can be resumed instead of restarted. The state is pickled without
+# its project (which angr would otherwise pickle along with it) and is rebound to the live project on resume,
+# after recreating the continuations of the SimProcedures (e.g., __libc_start_main returning from main) that angr
+# hooked lazily while recording and that a freshly loaded project therefore lacks.
+
+import os, pickle, tempfile
+import angr
+
+JUMPKINDS = {'Ijk_Call': 'call', 'Ijk_Ret': 'ret', 'Ijk_Boring': 'jump'}
+# failures that need not recur when the recording is resumed; the others (e.g., an unsupported jumpkind) are
+# deterministic and a resumed recording would only run into them again, so they are not checkpointed
+TRANSIENT_FAILURES = (MemoryError, KeyboardInterrupt, OSError)
+
+def format_transition(transition):
+    if transition['jumpkind'] == 'call':
+        return '%s %s %s\n' %(transition['jumpkind'], hex(transition['dst']), hex(transition['ret']))
+    return '%s %s\n' %(transition['jumpkind'], hex(transition['dst']))
+
+def parse_transition(line):
+    fields = line.split()
+    return {
+        'jumpkind': fields[0],
+        'dst': int(fields[1], 16),
+        'ret': int(fields[2], 16) if len(fields) > 2 else None}
+
+def read_transitions(filename):
+    with open(filename, 'r') as file_in:
+        for line in file_in:
+            if line.strip() == '': continue
+            yield parse_transition(line)
+
+class TransitionBuffer:
+    def __init__(self, filename=None, buffer_size=1<<16):
+        self.filename = filename
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.count = 0
+        self.last = None
+        self.offset = 0 # size of the file after the last flush
+        if filename is not None:
+            open(filename, 'w').close()
+
+    def append(self, transition):
+        self.buffer.append(transition)
+        self.count += 1
+        self.last = transition
+        if self.filename is not None and len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.filename is None or len(self.buffer) == 0: return
+        with open(self.filename, 'a') as out:
+            for transition in self.buffer:
+                out.write(format_transition(transition))
+            self.offset = out.tell()
+        self.buffer = []
+
+    def restore(self):
+        # discards whatever was appended to the file after this buffer was checkpointed
+        if self.filename is not None:
+            with open(self.filename, 'a') as out:
+                out.truncate(self.offset)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        if self.filename is None:
+            return iter(self.buffer)
+        self.flush()
+        return read_transitions(self.filename)
+
+class TraceRecorder(angr.exploration_techniques.ExplorationTechnique):
+    # Follows the single concrete execution path of the application. The recording stops (complete) when
+    # the application reaches an exit, or when the path ends or forks (no longer exactly one active state)
+    def __init__(self, transitions, trim_history=True, checkpoint_filename=None, checkpoint_interval=None):
+        super().__init__()
+        self.transitions = transitions
+        self.trim_history = trim_history
+        self.checkpoint_filename = checkpoint_filename
+        self.checkpoint_interval = checkpoint_interval # steps between checkpoints
+        self.initial_node = None
+        self.end_state = None
+        self.steps = 0
+        self.last_state = None # last fully recorded state
+
+    def setup(self, simgr):
+        # angr only tracks the calls of states that already have a callstack, without one the first call (e.g.,
+        # from _start) would be recorded as returning to 0
+        for state in simgr.active:
+            state.callstack
+
+    def step(self, simgr, stash='active', **kwargs):
+        simgr = simgr.step(stash=stash, **kwargs)
+        if self.initial_node is None and len(simgr.active) > 0:
+            self.initial_node = simgr.active[0].history.recent_bbl_addrs[0]
+        if len(simgr.active) != 1:
+            if len(simgr.deadended) == 1: self.end_state = 'done'
+            elif len(simgr.errored) == 1: self.end_state = 'the error \'%s\' was raised' %simgr.errored[0].error
+            else: self.end_state = 'something happened'
+            return simgr
+        state = simgr.active[0]
+        self.record(state)
+        if self.trim_history:
+            state.history.trim() # drop the ancestry, only the most recent step is ever looked at
+        self.steps += 1
+        self.last_state = state
+        if self.checkpoint_interval and self.steps % self.checkpoint_interval == 0:
+            self.save_checkpoint()
+        return simgr
+
+    def save_checkpoint(self):
+        # only when checkpointing was asked for; written atomically, a failure while checkpointing never destroys
+        # the previous checkpoint
+        if not self.checkpoint_interval or self.checkpoint_filename is None or self.last_state is None: return False
+        self.transitions.flush()
+        state = self.last_state
+        checkpoint = {
+            'state': state,
+            'continuations': continuations(state.project),
+            'transitions': self.transitions,
+            'initial_node': self.initial_node,
+            'steps': self.steps}
+        fd,tmp_filename = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.checkpoint_filename)), suffix='.tmp')
+        project, state.project = state.project, None # see load_checkpoint
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                pickle.dump(checkpoint, out, protocol=pickle.HIGHEST_PROTOCOL)
+        finally:
+            state.project = project
+        os.replace(tmp_filename, self.checkpoint_filename)
+        return True
+
+    def resume(self, checkpoint):
+        # continues recording from a checkpoint; returns the state to continue stepping from
+        self.transitions = checkpoint['transitions']
+        self.transitions.restore()
+        self.initial_node = checkpoint['initial_node']
+        self.steps = checkpoint['steps']
+        self.last_state = checkpoint['state']
+        return checkpoint['state']
+
+    def record(self, state):
+        jumpkind = state.history.jumpkind
+        if jumpkind == 'Ijk_Exit':
+            self.end_state = 'reached an exit'
+        elif jumpkind in JUMPKINDS:
+            self.transitions.append({
+                'jumpkind': JUMPKINDS[jumpkind],
+                'dst': state.history.jump_target._model_concrete.value,
+                'ret': state.callstack.ret_addr if jumpkind == 'Ijk_Call' else None})
+        else:
+            raise Exception('[-] Encountered currently unsupported jumpkind = %s in execution path' %jumpkind)
+
+    def complete(self, simgr):
+        return self.end_state is not None
+
+class UnicornTraceRecorder(TraceRecorder):
+    # With unicorn, a step can cover many basic blocks (history.recent_bbl_addrs) and its history.jumpkind only
+    # says why unicorn stopped (e.g., Ijk_Boring at a hooked address), not how the blocks were left. The transitions
+    # of such a step are therefore derived by walking the blocks as VEX lifts them (cached per address): the block's
+    # jumpkind tells call/ret/jump apart, the next block executed (or the address unicorn stopped at) is the
+    # destination and a call returns right after the calling block (addr + size), which is what the callstack
+    # reports when stepping block by block. Unicorn does not split the code into the same blocks as VEX, so the
+    # walk follows VEX: straight-line code that VEX splits (e.g., at its instruction limit) is a jump to the next
+    # block, a block that unicorn splits is one block, and when unicorn stops inside a block (e.g., at an
+    # instruction it cannot decode) the destination is the start of that block, which the next step finishes.
+    # Steps that unicorn did not execute (SimProcedures, or blocks that fell back to VEX) are single blocks whose
+    # history is exact and are handled by TraceRecorder.record
+    def __init__(self, project, transitions, trim_history=True, checkpoint_filename=None, checkpoint_interval=None):
+        super().__init__(transitions, trim_history, checkpoint_filename, checkpoint_interval)
+        self.project = project
+        self.blocks = {} # addr -> (jumpkind, size, constant jump targets, whether the default exit is constant)
+
+    def block(self, addr):
+        if addr not in self.blocks:
+            block = self.project.factory.block(addr)
+            self.blocks[addr] = (block.vex.jumpkind, block.size, block.vex.constant_jump_targets, block.vex.default_exit_target is not None)
+        return self.blocks[addr]
+
+    def loops_back(self, addr, target):
+        # whether the straight-line code from addr (as split by VEX) jumps back to target
+        while True:
+            jumpkind,size,targets,direct = self.block(addr)
+            if target in targets: return True
+            if jumpkind != 'Ijk_Boring' or targets != {addr + size}: return False
+            addr += size
+
+    def record(self, state):
+        if not state.history.recent_description.startswith('<Unicorn'):
+            return super().record(state)
+        addrs = list(state.history.recent_bbl_addrs)
+        transitions = []
+        addr, i = addrs[0], 1
+        while i < len(addrs) or addr != state.addr:
+            jumpkind,size,targets,direct = self.block(addr)
+            end = addr + size
+            # unicorn split the block, unless the code that follows loops back into it (unicorn executes the first
+            # iteration of a loop entered by falling through as part of the preceding block)
+            while i < len(addrs) and addr < addrs[i] < end and addrs[i] not in targets and not self.loops_back(addr, addrs[i]): i += 1
+            next_addr = addrs[i] if i < len(addrs) else state.addr
+            if i == len(addrs) and addr < next_addr < end and next_addr not in targets: break # stopped inside the block, the next step finishes it
+            if jumpkind not in JUMPKINDS:
+                raise Exception('[-] Encountered currently unsupported jumpkind = %s in execution path' %jumpkind)
+            if jumpkind == 'Ijk_Boring' and targets == {end}: # straight-line code split by VEX
+                dst = end
+            elif not direct or next_addr in targets:
+                dst = next_addr
+            else: # stopped inside the block the branch went to
+                dst = [target for target in targets if target < next_addr < target + self.block(target)[1]]
+                if i < len(addrs) or len(dst) != 1:
+                    raise Exception('[-] Cannot derive the transition from %s to %s executed by unicorn' %(hex(addr), hex(next_addr)))
+                dst = dst[0]
+            transitions.append({
+                'jumpkind': JUMPKINDS[jumpkind],
+                'dst': dst,
+                'ret': end if jumpkind == 'Ijk_Call' else None})
+            if dst == next_addr: i += 1
+            addr = dst
+        for transition in transitions: # nothing is recorded for a step that fails (see save_checkpoint)
+            self.transitions.append(transition)
+
+def continuations(project):
+    # (address, address of the SimProcedure, name) of every continuation hooked so far, in the order they were made
+    return sorted((addr, hook.canonical.addr, hook.run_func) for addr,hook in project._sim_procedures.items() if hook.is_continuation)
+
+def load_checkpoint(filename, project):
+    # the state is stepped by the simulation manager of the given (live) project, so it must refer to that same
+    # project (its hooks, loader and factory) rather than to a copy of it. The continuations are made again in the
+    # same order, so they land on the same addresses as in the recording (which the state may already return to)
+    with open(filename, 'rb') as file_in:
+        checkpoint = pickle.load(file_in)
+    for addr,procedure_addr,name in checkpoint['continuations']:
+        procedure = project.hooked_by(procedure_addr)
+        procedure.project = project # set when the procedure first runs, i.e., not yet in a fresh project
+        if procedure.make_continuation(name) != addr:
+            raise Exception('[-] Cannot resume from %s: the continuation %s of the SimProcedure at %s is no longer at %s' %(filename, name, hex(procedure_addr), hex(addr)))
+    checkpoint['state'].project = project
+    return checkpoint
@@ -0,0 +1,9 @@
+#################################
+## Author: Heini Bergsson Debes
+#################################
+# The helper scripts import each other as top-level modules, so the tests run with scripts/ on the path.
+# Tests that need optional packages (angr, networkx, numpy) are skipped where those are not installed.
+
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'scripts'))
@@ -0,0 +1,100 @@
+import os
+import random
+import pytest
+
+import binary_container
+from binary_container import Container, write_container, text_to_container, container_to_text, CONTAINER_FILENAME
+
+TEXT_FILES = ['adjlist', 'numified_adjlist', 'translator', 'recorded_path', 'numified_path']
+APPLICATIONS_DIR = os.path.join(os.path.dirname(__file__), '..', 'embench-iot-applications')
+
+@pytest.fixture(params=['numpy', 'memoryview'])
+def reader(request, monkeypatch):
+    # Container.values reads through numpy.frombuffer if numpy is installed and memoryview casts otherwise
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(binary_container, 'numpy', None)
+    return request.param
+
+def random_text_files(rng, out_dir, num_nodes, addr_bitwidth):
+    # text files like the extractor writes them, with addresses of up to addr_bitwidth bits
+    addrs = set()
+    while len(addrs) < num_nodes:
+        addrs.add(rng.randrange(1 << addr_bitwidth))
+    addrs = list(addrs)
+    adjlist = [rng.sample(range(num_nodes), rng.randint(0, min(num_nodes, 3))) for node in range(num_nodes)]
+    with open(os.path.join(out_dir, 'adjlist'), 'w') as out:
+        for node,neighbors in enumerate(adjlist):
+            out.write(' '.join(hex(addrs[label]) for label in [node] + neighbors) + '\n')
+    with open(os.path.join(out_dir, 'numified_adjlist'), 'w') as out:
+        for node,neighbors in enumerate(adjlist):
+            out.write(' '.join(str(label) for label in [node] + neighbors) + '\n')
+    with open(os.path.join(out_dir, 'translator'), 'w') as out:
+        for addr in addrs:
+            out.write('%s\n' %hex(addr))
+    transitions = [(rng.choice(['jump', 'call', 'ret']), rng.randrange(num_nodes), rng.randrange(num_nodes)) for i in range(rng.randint(0, 300))]
+    for name,label in [('recorded_path', lambda node: hex(addrs[node])), ('numified_path', str)]:
+        with open(os.path.join(out_dir, name), 'w') as out:
+            out.write('initial_node=%s final_node=%s\n' %(label(0), label(num_nodes - 1)))
+            for jumpkind,dst,ret in transitions:
+                if jumpkind == 'call':
+                    out.write('call %s %s\n' %(label(dst), label(ret)))
+                else:
+                    out.write('%s %s\n' %(jumpkind, label(dst)))
+
+def read_files(in_dir, names):
+    contents = {}
+    for name in names:
+        with open(os.path.join(in_dir, name), 'rb') as file_in:
+            contents[name] = file_in.read()
+    return contents
+
+def round_trip(in_dir, out_dir, names):
+    filename = os.path.join(out_dir, CONTAINER_FILENAME)
+    text_to_container(in_dir, filename)
+    with Container(filename) as container:
+        container_to_text(container, out_dir)
+    assert read_files(out_dir, names) == read_files(in_dir, names)
+
+@pytest.mark.parametrize('addr_bitwidth', [8, 16, 32, 64])
+def test_text_binary_text_round_trip(tmp_path, reader, addr_bitwidth):
+    rng = random.Random(addr_bitwidth)
+    for trial in range(5):
+        in_dir = tmp_path / ('in%s' %trial)
+        out_dir = tmp_path / ('out%s' %trial)
+        in_dir.mkdir()
+        out_dir.mkdir()
+        random_text_files(rng, in_dir, rng.randint(1, 100), addr_bitwidth)
+        round_trip(in_dir, out_dir, TEXT_FILES)
+
+def test_round_trip_of_extracted_application(tmp_path, reader):
+    in_dir = os.path.join(APPLICATIONS_DIR, 'crc32')
+    names = [name for name in TEXT_FILES if os.path.isfile(os.path.join(in_dir, name))]
+    if len(names) == 0:
+        pytest.skip('crc32 has not been extracted')
+    round_trip(in_dir, str(tmp_path), names)
+
+def test_values_and_chunks(tmp_path, reader):
+    rng = random.Random(0)
+    sections = [('empty', []), ('u8', [rng.randrange(1 << 8) for i in range(100)]), ('u16', [rng.randrange(1 << 16) for i in range(100)]),
+                ('u32', [rng.randrange(1 << 32) for i in range(100)]), ('u64', [rng.randrange(1 << 64) for i in range(100)] + [(1 << 64) - 1])]
+    filename = str(tmp_path / CONTAINER_FILENAME)
+    write_container(filename, sections)
+    with Container(filename) as container:
+        for name,values in sections:
+            assert name in container
+            assert container.length(name) == len(values)
+            assert container.bitwidth(name) == max(values, default=0).bit_length()
+            assert container.values(name) == values
+            assert container.values(name, 10, 20) == values[10:20]
+            assert container.values(name, 90, 200) == values[90:200]
+            assert [value for chunk in container.chunks(name, 7) for value in chunk] == values
+        assert 'missing' not in container
+
+def test_rejects_other_files(tmp_path):
+    filename = str(tmp_path / CONTAINER_FILENAME)
+    with open(filename, 'wb') as out:
+        out.write(b'\0'*64)
+    with pytest.raises(Exception):
+        Container(filename)
@@ -0,0 +1,47 @@
+import random
+import pytest
+
+from circuit_input_formatter import encode_adjlist, required_adjlist_levels, required_bucket_bitwidth, BUCKET_RADICES
+from packing import pack_encoded_adjlist
+
+def random_adjlist(rng, num_nodes):
+    # numified adjacency list like format_adjlist returns it: str(label) -> [str(label), ...]
+    return {str(node): [str(neighbor) for neighbor in rng.sample(range(num_nodes), rng.randint(0, min(num_nodes, 6)))] for node in range(num_nodes)}
+
+def decode_levels(levels, radix):
+    # every neighbor bucket*radix+rem whose rem bit is set in the bucket's rems
+    return set(bucket*radix + rem for bucket,rems in levels.items() for rem in range(radix) if rems >> rem & 1)
+
+def decode_packed(neighbors, bucket_bitwidth, radix, num_levels):
+    # the levels of a packed node, last level in the least significant bits
+    levels = {}
+    for i in range(num_levels):
+        level = neighbors & ((1 << (bucket_bitwidth + radix)) - 1)
+        levels[level & ((1 << bucket_bitwidth) - 1)] = level >> bucket_bitwidth
+        neighbors >>= bucket_bitwidth + radix
+    assert neighbors == 0
+    return levels
+
+@pytest.mark.parametrize('radix', BUCKET_RADICES)
+def test_encode_adjlist_decodes_to_the_neighbors(radix):
+    rng = random.Random(radix)
+    for trial in range(50):
+        adjlist = random_adjlist(rng, rng.randint(1, 200))
+        encoded = encode_adjlist(adjlist, radix)
+        assert [node for node,levels in encoded] == list(adjlist)
+        num_levels = required_adjlist_levels(adjlist, radix)
+        for node,levels in encoded:
+            assert len(levels) <= num_levels
+            assert all(0 < rems < 1 << radix for rems in levels.values())
+            assert decode_levels(levels, radix) == set(int(neighbor) for neighbor in adjlist[node])
+
+@pytest.mark.parametrize('radix', BUCKET_RADICES)
+def test_packed_encoded_adjlist_decodes_to_the_neighbors(radix):
+    rng = random.Random(radix)
+    for trial in range(50):
+        adjlist = random_adjlist(rng, rng.randint(1, 200))
+        bucket_bitwidth = required_bucket_bitwidth(adjlist, radix)
+        encoded = encode_adjlist(adjlist, radix)
+        for (node,neighbors),(_,levels) in zip(pack_encoded_adjlist(encoded, bucket_bitwidth, radix), encoded):
+            assert max(levels, default=0) < 1 << bucket_bitwidth
+            assert decode_levels(decode_packed(neighbors, bucket_bitwidth, radix, len(levels)), radix) == set(int(neighbor) for neighbor in adjlist[node])
@@ -0,0 +1,63 @@
+import os
+import re
+import pytest
+
+import compile_circuit
+from compile_circuit import build_key, build, configure_data_structures, set_dir_properties, set_bucket_radix, read_component, write_build_info, read_build_info, BUILD_INFO_FILENAME
+
+ZEKRA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'zekra_java', 'zekra')
+PARAMS = (300, 3, 500, 15, 9, 6, 32, 8)
+
+def sources(params):
+    # the patched sources that build() names its build directory after
+    program_lines = set_dir_properties(configure_data_structures(read_component(os.path.join(ZEKRA_DIR, 'zekra.java')), *params))
+    return program_lines, read_component(os.path.join(ZEKRA_DIR, 'PoseidonHash.java'))
+
+def test_build_key_is_deterministic():
+    program_lines, poseidon_lines = sources(PARAMS)
+    key = build_key(PARAMS, program_lines, poseidon_lines)
+    assert key == build_key(PARAMS, list(program_lines), list(poseidon_lines))
+    assert key == build_key(PARAMS, *sources(PARAMS))
+    assert key.startswith('%s_300_3_500_15_9_6_32_8_' %compile_circuit.ZEKRA_COMPONENT_NAME)
+
+@pytest.mark.parametrize('index', range(len(PARAMS)))
+def test_build_key_changes_with_every_param(index):
+    params = list(PARAMS)
+    params[index] = 16 if params[index] != 16 else 4
+    assert build_key(tuple(params), *sources(tuple(params))) != build_key(PARAMS, *sources(PARAMS))
+
+def test_build_key_changes_with_the_sources():
+    program_lines, poseidon_lines = sources(PARAMS)
+    key = build_key(PARAMS, program_lines, poseidon_lines)
+    assert build_key(PARAMS, program_lines + ['// patched'], poseidon_lines) != key
+    assert build_key(PARAMS, program_lines, poseidon_lines[:-1]) != key
+    # lines are separated, so moving a line break changes the key
+    assert build_key(PARAMS, ['ab', 'c'], []) != build_key(PARAMS, ['a', 'bc'], [])
+
+def test_build_reuses_a_completed_build(tmp_path):
+    build_dir = tmp_path / build_key(PARAMS, *sources(PARAMS))
+    build_dir.mkdir()
+    write_build_info(str(build_dir), {'params': list(PARAMS), 'constraints': None})
+    assert build(str(tmp_path), PARAMS, ZEKRA_DIR) == (str(build_dir), True)
+    assert read_build_info(str(build_dir)) == {'params': list(PARAMS), 'constraints': None}
+
+def test_build_never_keeps_a_failed_build(tmp_path, monkeypatch):
+    def failed_javac(cmd, **kwargs):
+        raise OSError('javac failed')
+    monkeypatch.setattr(compile_circuit.subprocess, 'run', failed_javac)
+    with pytest.raises(OSError):
+        build(str(tmp_path), PARAMS, ZEKRA_DIR)
+    assert os.listdir(str(tmp_path)) == []
+    # an incomplete build directory (no build info) is not reused either
+    (tmp_path / build_key(PARAMS, *sources(PARAMS))).mkdir()
+    with pytest.raises(OSError):
+        build(str(tmp_path), PARAMS, ZEKRA_DIR)
+    assert not os.path.isfile(str(tmp_path / build_key(PARAMS, *sources(PARAMS)) / BUILD_INFO_FILENAME))
+
+@pytest.mark.parametrize('radix', [2, 4, 8, 16, 32])
+def test_set_bucket_radix_patches_every_bucket_width(radix):
+    contents = '\n'.join(set_bucket_radix(read_component(os.path.join(ZEKRA_DIR, 'zekra.java')), radix))
+    widths = re.findall(r'BUCKET_BITWIDTH ?\+ ?(\d+)\)', contents)
+    assert len(widths) > 0 and all(int(width) == radix for width in widths)
+    assert '"(BUCKET_BITWIDTH+%s)*ADJ_LIST_LEVELS' %radix in contents
+    assert all(int(divisor) == radix for divisor in re.findall(r'destNode\.(?:mod|divide)\(BigInteger\.valueOf\((\d+)\)\)', contents))
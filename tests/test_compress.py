@@ -0,0 +1,153 @@
+import re
+import random
+import statistics
+import pytest
+
+pytest.importorskip('angr')
+from extractor import find_runs, find_repeated_sequences, compress, fold, valid_execution_path
+
+def naive_runs(tokens):
+    # every maximal repetition (start, end, smallest period) by trying all periods at all positions
+    n = len(tokens)
+    runs = set()
+    for period in range(1, n//2 + 1):
+        start = 0
+        while start + period < n:
+            end = start + period
+            while end < n and tokens[end] == tokens[end - period]:
+                end += 1
+            left_maximal = start == 0 or tokens[start - 1] != tokens[start - 1 + period]
+            if left_maximal and end - start >= 2*period:
+                smallest = next(q for q in range(1, period + 1) if all(tokens[k] == tokens[k - q] for k in range(start + q, end)))
+                if smallest == period:
+                    runs.add((start, end, period))
+            start = max(start + 1, end - period)
+    return sorted(runs)
+
+def naive_repeated_sequences(tokens):
+    # at each position the shortest sequence that is immediately repeated, with all of its consecutive repetitions
+    repetitions = []
+    i = 0
+    while i < len(tokens):
+        length = next((l for l in range(1, (len(tokens) - i)//2 + 1) if tokens[i:i+l] == tokens[i+l:i+2*l]), None)
+        if length is None:
+            i += 1
+            continue
+        count = 1
+        while tokens[i:i+length] == tokens[i+count*length:i+(count+1)*length]:
+            count += 1
+        repetitions.append((i, length, count))
+        i += length*count
+    return repetitions
+
+def baseline_compress(path):
+    # compress() as it was before the run-based scan, i.e., a regex over the transitions as text and str.replace
+    transitions_merged_str = ''
+    separator = '-'
+    for transition in path['transitions']:
+        transitions_merged_str += '%s%s%s%s%s ' %(transition['jumpkind'], separator, transition['dst'], separator, transition['ret'])
+    repetitions = [(m[1], int((len(m[0]) + 1) / (len(m[1]) + 1))) for m in re.findall(r'((\b.+?\b)(?:\s\2)+)', transitions_merged_str)]
+    for repetition in repetitions:
+        transitions_merged_str = transitions_merged_str.replace('%s '%repetition[0] * int(repetition[1]), '%s '%repetition[0])
+    tmp = [dict(zip(('jumpkind', 'dst', 'ret'), transition.split(separator))) for transition in transitions_merged_str.strip().split(' ')]
+    sequence_lengths = [len(repetition[0].split(' ')) for repetition in repetitions]
+    sequence_repetitions = [repetition[1] for repetition in repetitions]
+    number_of_repetitions = len(repetitions)
+    stats = {
+        'execution_path_length_pre_compression': len(path['transitions']),
+        'repetitions': repetitions,
+        'number_of_repetitions': number_of_repetitions,
+        'mean_sequence_lengths': sum(sequence_lengths)/number_of_repetitions if number_of_repetitions>0 else 0,
+        'stdev_sequence_lengths': statistics.pstdev(sequence_lengths) if number_of_repetitions>0 else 0,
+        'mean_sequence_repetitions': sum(sequence_repetitions)/number_of_repetitions if number_of_repetitions>0 else 0,
+        'stdev_sequence_repetitions': statistics.pstdev(sequence_repetitions) if number_of_repetitions>0 else 0,
+        'execution_path_length_post_compression': len(tmp)
+    }
+    return {'transitions': tmp, 'initial_node': path['initial_node'], 'final_node': path['final_node']}, stats
+
+def random_transitions(rng, n, num_labels, label):
+    # jumps, calls and rets between few labels, so that loops are frequent and some labels are prefixes of others
+    # (e.g., 1 and 12 or 0x1 and 0x12)
+    transitions = []
+    for i in range(n):
+        jumpkind = rng.choice(['jump', 'jump', 'call', 'ret'])
+        transitions.append({'jumpkind': jumpkind, 'dst': label(rng.randrange(num_labels)), 'ret': label(rng.randrange(num_labels)) if jumpkind == 'call' else None})
+    return transitions
+
+def looping_transitions(rng, transitions, n):
+    # repeats random slices of the transitions (nested, as the slices may already contain repetitions)
+    for i in range(n):
+        start = rng.randrange(len(transitions))
+        end = rng.randint(start + 1, min(len(transitions), start + 6))
+        transitions[start:end] = transitions[start:end]*rng.randint(2, 5)
+    return transitions
+
+def random_calls(rng, n, label):
+    # calls to few functions returning to labels that are prefixes of each other as text (0x1, 0x12, 0x123), so that
+    # a repetition can end inside a call that only extends the last call of the sequence
+    transitions = []
+    for i in range(n):
+        if rng.random() < 0.7:
+            transitions.append({'jumpkind': 'call', 'dst': label(rng.randrange(2)), 'ret': label(rng.choice([0x1, 0x12, 0x123, 0x2, 0x21]))})
+        else:
+            transitions.append({'jumpkind': 'ret', 'dst': label(rng.randrange(3)), 'ret': None})
+    return transitions
+
+def random_tokens(rng, n, alphabet):
+    return [rng.randrange(alphabet) for i in range(n)]
+
+def random_walk(rng, num_nodes, length):
+    # a walk through a small random graph (out-degree 1 or 2), so it is full of (nested) loops
+    adjlist = {node: rng.sample(range(num_nodes), rng.randint(1, 2)) for node in range(num_nodes)}
+    node = 0
+    transitions = []
+    for i in range(length):
+        node = rng.choice(adjlist[node])
+        transitions.append({'jumpkind': 'boring', 'dst': node, 'ret': None})
+    path = {'transitions': transitions, 'initial_node': 0, 'final_node': node}
+    return path, {str(node): [str(neighbor) for neighbor in neighbors] for node,neighbors in adjlist.items()}
+
+@pytest.mark.parametrize('alphabet', [1, 2, 3, 5])
+def test_find_runs_matches_naive(alphabet):
+    rng = random.Random(alphabet)
+    for trial in range(200):
+        tokens = random_tokens(rng, rng.randint(0, 40), alphabet)
+        assert find_runs(tokens) == naive_runs(tokens)
+
+@pytest.mark.parametrize('alphabet', [1, 2, 3, 5])
+def test_find_repeated_sequences_matches_naive(alphabet):
+    rng = random.Random(alphabet)
+    for trial in range(200):
+        tokens = random_tokens(rng, rng.randint(0, 40), alphabet)
+        assert find_repeated_sequences(tokens) == naive_repeated_sequences(tokens)
+
+@pytest.mark.parametrize('compress_path', [compress, fold])
+def test_compressed_path_is_valid(compress_path):
+    rng = random.Random(0)
+    for trial in range(50):
+        path, adjlist = random_walk(rng, rng.randint(2, 8), rng.randint(1, 300))
+        compressed, stats = compress_path({'transitions': list(path['transitions']), 'initial_node': path['initial_node'], 'final_node': path['final_node']})
+        assert stats['execution_path_length_post_compression'] == len(compressed['transitions']) <= len(path['transitions'])
+        assert valid_execution_path(compressed, adjlist)
+
+@pytest.mark.parametrize('label', [int, hex])
+def test_compress_matches_baseline(label):
+    rng = random.Random(0)
+    for trial in range(300):
+        transitions = looping_transitions(rng, random_transitions(rng, rng.randint(1, 40), rng.randint(1, 25), label), rng.randint(0, 8))
+        path = {'transitions': transitions, 'initial_node': 0, 'final_node': 1}
+        assert compress(dict(path)) == baseline_compress(dict(path))
+
+@pytest.mark.parametrize('label', [int, hex])
+def test_compress_matches_baseline_on_extended_calls(label):
+    rng = random.Random(0)
+    for trial in range(300):
+        transitions = looping_transitions(rng, random_calls(rng, rng.randint(1, 30), label), rng.randint(0, 6))
+        path = {'transitions': transitions, 'initial_node': 0, 'final_node': 1}
+        assert compress(dict(path)) == baseline_compress(dict(path))
+
+def test_compress_matches_baseline_on_random_walks():
+    rng = random.Random(1)
+    for trial in range(300):
+        path, adjlist = random_walk(rng, rng.randint(2, 8), rng.randint(1, 300))
+        assert compress(dict(path)) == baseline_compress(dict(path))
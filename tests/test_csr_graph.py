@@ -0,0 +1,69 @@
+import random
+import types
+import pytest
+from csr_graph import GraphBuilder
+from circuit_input_formatter import format_adjlist
+
+class Block:
+    # stands in for the nodes of an angr CFG
+    def __init__(self, addr):
+        self.addr = addr
+        self.block_id = addr
+
+def random_cfg(rng, num_nodes):
+    nx = pytest.importorskip('networkx')
+    graph = nx.DiGraph()
+    blocks = [Block(0x400000 + 16*i) for i in rng.sample(range(4*num_nodes), num_nodes)]
+    for block in blocks:
+        graph.add_node(block)
+    for block in blocks:
+        for successor in rng.sample(blocks, rng.choice([0, 1, 1, 2, 3])):
+            graph.add_edge(block, successor)
+    return types.SimpleNamespace(graph=graph)
+
+def networkx_numified_adjlist(cfg):
+    # how the extractor labeled the CFG before csr_graph.py: relabel, rebuild from the adjacency list, relabel again
+    import networkx as nx
+    labeled_cfg = nx.convert_node_labels_to_integers(cfg.graph, ordering='default')
+    optimized_cfg = nx.DiGraph()
+    for node,neighbors in format_adjlist(list(nx.generate_adjlist(labeled_cfg))).items():
+        optimized_cfg.add_node(node)
+        for neighbor in neighbors:
+            optimized_cfg.add_edge(node, neighbor)
+    return list(nx.generate_adjlist(nx.convert_node_labels_to_integers(optimized_cfg, ordering='default', label_attribute='old_label')))
+
+@pytest.mark.parametrize('seed', range(10))
+def test_label_order_matches_networkx(seed):
+    rng = random.Random(seed)
+    cfg = random_cfg(rng, rng.randint(1, 60))
+    graph = GraphBuilder.from_cfg(cfg).freeze()
+    order,labels = graph.label_order()
+    assert graph.numified_adjlist(order, labels) == networkx_numified_adjlist(cfg)
+
+def random_graph(rng, num_nodes):
+    builder = GraphBuilder()
+    for u in range(num_nodes):
+        builder.add_node(0x1000 + 4*u)
+    for u in range(num_nodes):
+        for v in rng.sample(range(num_nodes), rng.choice([0, 1, 1, 2, 3])):
+            builder.add_edge(u, v)
+    return builder
+
+@pytest.mark.parametrize('seed', range(10))
+def test_prune_keeps_the_order_of_the_reachable_nodes(seed):
+    rng = random.Random(seed)
+    builder = random_graph(rng, rng.randint(1, 80))
+    graph = builder.freeze()
+    roots = rng.sample(range(graph.num_nodes), rng.randint(1, 3))
+    reached = set(roots)
+    pending = list(roots)
+    while len(pending) > 0:
+        for v in builder.successors[pending.pop()]:
+            if v not in reached:
+                reached.add(v)
+                pending.append(v)
+    kept = [u for u in range(graph.num_nodes) if u in reached]
+    pruned = graph.prune(roots)
+    assert pruned.addrs == [builder.addrs[u] for u in kept]
+    assert [[pruned.addrs[v] for v in pruned.successors(u)] for u in range(pruned.num_nodes)] == [[builder.addrs[v] for v in builder.successors[u]] for u in kept]
+    assert all(pruned.addr_index[addr] == u for u,addr in enumerate(pruned.addrs))
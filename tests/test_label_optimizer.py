@@ -0,0 +1,46 @@
+import random
+import pytest
+from csr_graph import GraphBuilder
+from label_optimizer import greedy_clusters, greedy_order, adjlist_levels
+from circuit_input_formatter import BUCKET_RADICES
+
+def random_cfg(rng, num_nodes, branching=0.3):
+    # mostly fall-through/jump blocks with the odd branch or switch, like the CFGs of the applications
+    builder = GraphBuilder()
+    for u in range(num_nodes):
+        builder.add_node(0x1000 + 4*u)
+    for u in range(num_nodes):
+        degree = rng.choice([2, 2, 3, 5, 9]) if rng.random() < branching else 1
+        for v in rng.sample(range(num_nodes), degree):
+            builder.add_edge(u, v)
+    return builder.freeze()
+
+@pytest.mark.parametrize('radix', BUCKET_RADICES)
+@pytest.mark.parametrize('seed', range(10))
+def test_greedy_clusters_keep_to_one_bucket(seed, radix):
+    rng = random.Random(seed)
+    graph = random_cfg(rng, rng.randint(50, 400))
+    order,labels = greedy_order(graph, radix)
+    assert sorted(order) == list(range(graph.num_nodes))
+    assert all(order[labels[u]] == u for u in range(graph.num_nodes))
+    for cluster in greedy_clusters(graph, radix):
+        assert len(cluster) <= radix
+        assert len(set(labels[u] // radix for u in cluster)) == 1
+
+def test_greedy_without_fillers_keeps_clusters_within_two_buckets():
+    # successor sets of 5 nodes only: every node is clustered and no bucket can be padded with unclustered nodes
+    rng = random.Random(0)
+    num_nodes = 200
+    nodes = list(range(num_nodes))
+    rng.shuffle(nodes)
+    builder = GraphBuilder()
+    for u in range(num_nodes):
+        builder.add_node(u)
+    for u in range(num_nodes//5):
+        for v in nodes[5*u:5*u+5]: builder.add_edge(u, v)
+    graph = builder.freeze()
+    order,labels = greedy_order(graph)
+    assert sorted(order) == list(range(graph.num_nodes))
+    for cluster in greedy_clusters(graph):
+        assert len(set(labels[u] // 8 for u in cluster)) <= 2
+    assert adjlist_levels(graph, labels) == 2
@@ -0,0 +1,38 @@
+import random
+import pytest
+from merkle_tree import MerkleTree, hash_nodes, MIN_ARITY, MAX_ARITY
+from poseidon.poseidon_hash import poseidon_hash
+from poseidon.poseidon_field import p
+
+def naive_root(leaves, arity, depth):
+    # every inner node hashed from scratch, padding included
+    level = list(leaves) + [0]*(arity**depth - len(leaves))
+    for height in range(depth):
+        level = [poseidon_hash([0] + level[i:i+arity])[1] for i in range(0, len(level), arity)]
+    return level[0]
+
+@pytest.mark.parametrize('arity', range(MIN_ARITY, MAX_ARITY+1))
+def test_root_matches_naive(arity):
+    rng = random.Random(arity)
+    for num_leaves in [1, arity, arity+1, 3*arity-1]:
+        leaves = [rng.randrange(p) for i in range(num_leaves)]
+        tree = MerkleTree(leaves, arity)
+        assert tree.root == naive_root(leaves, arity, tree.depth)
+
+@pytest.mark.parametrize('arity', [2, 3, 8])
+def test_update_matches_rebuild(arity):
+    rng = random.Random(arity)
+    leaves = [rng.randrange(p) for i in range(2*arity+1)]
+    tree = MerkleTree(leaves, arity, depth=3)
+    for changes in [{0: 1}, {len(leaves)-1: 2, 1: 3}, {len(leaves)+arity: 4}, {i: rng.randrange(p) for i in rng.sample(range(arity**3), 5)}]:
+        for index,value in changes.items():
+            leaves.extend([0]*(index + 1 - len(leaves)))
+            leaves[index] = value
+        calls = tree.num_calls
+        assert tree.update(changes) == MerkleTree(leaves, arity, depth=3).root
+        assert tree.num_calls - calls <= 3*len(changes)
+        assert tree.levels[0] == leaves
+
+def test_hash_nodes_is_poseidon_over_the_capacity_and_children():
+    children = list(range(1, 9))
+    assert hash_nodes(children, 4) == [poseidon_hash([0, 1, 2, 3, 4])[1], poseidon_hash([0, 5, 6, 7, 8])[1]]
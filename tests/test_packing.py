@@ -0,0 +1,70 @@
+import math
+import random
+import pytest
+
+import packing
+import circuit_input_formatter as formatter
+from circuit_input_formatter import binify_path, numify_binified_path, binify_encoded_adjlist, numify_binified_adjlist, encode_adjlist, BUCKET_RADICES, P_BITWIDTH
+from poseidon.poseidon_field import get_field_backend
+
+@pytest.fixture(params=['numpy', 'python'])
+def engine(request, monkeypatch):
+    # packing uses numpy for large lists if it is installed and Python ints otherwise
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(packing, 'numpy', None)
+    return request.param
+
+def string_pack(tmp_list, elem_bitwidth):
+    # compress() as it was before packing.py: one field.pack per field element
+    field = get_field_backend()
+    elems_per_field_element = math.floor(P_BITWIDTH/elem_bitwidth)
+    return [field.pack(tmp_list[i:i+elems_per_field_element], elem_bitwidth) for i in range(0, len(tmp_list), elems_per_field_element)]
+
+def random_path(rng, num_transitions, addr_bitwidth):
+    jumpkinds = [rng.choice(list(formatter.JUMPKIND_CODES.values())) for i in range(num_transitions)]
+    dsts = [rng.getrandbits(addr_bitwidth) for i in range(num_transitions)]
+    rets = [rng.getrandbits(addr_bitwidth) for i in range(num_transitions)] # only kept for calls
+    return jumpkinds, dsts, rets
+
+@pytest.mark.parametrize('addr_bitwidth', [1, 8, 16, 31, 32, 48])
+def test_pack_transitions_matches_string_packing(engine, monkeypatch, addr_bitwidth):
+    monkeypatch.setattr(formatter, 'ADDR_BITWIDTH', addr_bitwidth)
+    names = {code: jumpkind for jumpkind,code in formatter.JUMPKIND_CODES.items()}
+    transition_bitwidth = formatter.JUMPKIND_BITWIDTH + 2*addr_bitwidth
+    elems_per_field_element = math.floor(P_BITWIDTH/transition_bitwidth)
+    rng = random.Random(addr_bitwidth)
+    for num_transitions in [0, 1, 7, packing.NUMPY_MIN_ELEMS - 1, packing.NUMPY_MIN_ELEMS, 1000]:
+        jumpkinds, dsts, rets = random_path(rng, num_transitions, addr_bitwidth)
+        path = {'transitions': [{'jumpkind': names[jumpkind], 'dst': hex(dst), 'ret': hex(ret)} for jumpkind,dst,ret in zip(jumpkinds, dsts, rets)]}
+        numified = numify_binified_path(binify_path(path))
+        packed = packing.pack_transitions(jumpkinds, dsts, rets, formatter.JUMPKIND_BITWIDTH, addr_bitwidth)
+        assert [int(transition) for transition in packed] == numified
+        assert packing.pack_fields(packed, transition_bitwidth, elems_per_field_element) == string_pack(numified, transition_bitwidth)
+
+@pytest.mark.parametrize('radix', BUCKET_RADICES)
+def test_pack_encoded_adjlist_matches_string_packing(engine, monkeypatch, radix):
+    rng = random.Random(radix)
+    for num_nodes in [1, 10, 300]:
+        adjlist = {str(node): rng.sample(range(num_nodes), rng.randint(0, min(num_nodes, 4))) for node in range(num_nodes)}
+        encoded = encode_adjlist(adjlist, radix)
+        levels = max(1, len(max([list(levels) for node,levels in encoded], key=len)))
+        bucket_bitwidth = len(format(math.floor(num_nodes/radix), '0b'))
+        monkeypatch.setattr(formatter, 'BUCKET_BITWIDTH', bucket_bitwidth)
+        monkeypatch.setattr(formatter, 'BUCKET_RADIX', radix)
+        numified = numify_binified_adjlist(binify_encoded_adjlist(encoded))
+        packed = packing.pack_encoded_adjlist(encoded, bucket_bitwidth, radix)
+        assert packed == numified
+        neighbors_bitwidth = levels*(bucket_bitwidth + radix)
+        if neighbors_bitwidth >= P_BITWIDTH: continue
+        compressed = packing.pack_fields([neighbors for node,neighbors in packed], neighbors_bitwidth, math.floor(P_BITWIDTH/neighbors_bitwidth))
+        assert compressed == string_pack([neighbors for node,neighbors in numified], neighbors_bitwidth)
+
+@pytest.mark.parametrize('bitwidth', [1, 2, 7, 63, 64, 65, 127])
+def test_pack_fields_matches_string_packing(engine, bitwidth):
+    rng = random.Random(bitwidth)
+    elems_per_field_element = math.floor(P_BITWIDTH/bitwidth)
+    for num_elems in [0, 1, elems_per_field_element, elems_per_field_element + 1, packing.NUMPY_MIN_ELEMS, 1000]:
+        elems = [rng.getrandbits(bitwidth) for i in range(num_elems)]
+        assert packing.pack_fields(elems, bitwidth, elems_per_field_element) == string_pack(elems, bitwidth)
@@ -0,0 +1,44 @@
+import os
+import getopt
+import compile_circuit
+from pipeline import ExtractionResult, CircuitConfig, format_inputs, format_paths
+
+APPS = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'embench-iot-applications')
+ZEKRA_JAVA = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'zekra_java', 'zekra', 'zekra.java')
+
+def test_format_paths_reports_bad_paths_and_formats_the_others():
+    extraction = ExtractionResult.from_dir(os.path.join(APPS, 'crc32'))
+    foreign = ExtractionResult.from_dir(os.path.join(APPS, 'picojpeg')).recorded_path
+    inputs = format_inputs(extraction, nonce_adjlist=3)
+    results = format_paths(inputs, extraction.translator, [extraction.recorded_path, foreign, extraction.recorded_path], processes=1)
+    assert [status for status,result in results] == ['ok', 'error', 'ok']
+    assert 'not a node of the CFG' in results[1][1]
+    assert results[0][1].digests == results[2][1].digests == inputs.digests
+
+# compile_circuit.py option -> the module global it sets
+COMPILE_CIRCUIT_OPTIONS = {'--adjlist-len': 'ADJLIST_SIZE', '--adjlist-levels': 'ADJLIST_LEVELS', '--path-len': 'EXECUTION_PATH_SIZE', '--stack-depth': 'SHADOWSTACK_DEPTH',
+    '--label-bitwidth': 'LABEL_BITWIDTH', '--bucket-bitwidth': 'BUCKET_BITWIDTH', '--address-bitwidth': 'ADDR_BITWIDTH', '--bucket-radix': 'BUCKET_RADIX'}
+
+def test_config_key_is_stable():
+    extraction = ExtractionResult.from_dir(os.path.join(APPS, 'crc32'))
+    configs = [format_inputs(extraction, nonce_verifier=nonce, pad_path=500).config(stack_depth=15) for nonce in [1, 2]]
+    configs.append(format_inputs(ExtractionResult.from_dir(os.path.join(APPS, 'crc32')), pad_path=500).config(stack_depth=15))
+    assert configs[0].key() == configs[1].key() == configs[2].key()
+    assert hash(configs[0].key()) == hash(configs[2].key())
+    assert CircuitConfig(*configs[0].key()).key() == configs[0].key()
+    assert format_inputs(extraction, pad_path=501).config(stack_depth=15).key() != configs[0].key()
+    assert format_inputs(extraction, pad_path=500).config(stack_depth=16).key() != configs[0].key()
+
+def test_config_key_matches_compile_circuit(monkeypatch):
+    # the options of args() set compile_circuit's globals to build_params() == key(), in the order of configure_data_structures
+    config = CircuitConfig(300, 3, 500, 15, 9, 6, 32, 16)
+    opts,args = getopt.getopt(config.args(), '', [option[2:]+'=' for option in COMPILE_CIRCUIT_OPTIONS])
+    assert len(args) == 0
+    for name in COMPILE_CIRCUIT_OPTIONS.values():
+        monkeypatch.setattr(compile_circuit, name, None)
+    monkeypatch.setattr(compile_circuit, 'BUCKET_RADIX', 8)
+    for opt,arg in opts:
+        monkeypatch.setattr(compile_circuit, COMPILE_CIRCUIT_OPTIONS[opt], int(arg))
+    assert compile_circuit.build_params() == config.key()
+    program_lines = compile_circuit.read_component(ZEKRA_JAVA)
+    assert config.configure(list(program_lines)) == compile_circuit.adjust_data_structures(list(program_lines))
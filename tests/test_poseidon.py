@@ -0,0 +1,77 @@
+import os
+import random
+import pytest
+from poseidon import poseidon_hash as poseidon
+from poseidon.poseidon_hash import poseidon_hash, poseidon_hash_many, LOCKSTEP_MIN_STATES
+from poseidon.poseidon_field import p
+from circuit_input_formatter import hash, hash_many, compress, make_multiple_of
+
+APPLICATIONS_DIR = os.path.join(os.path.dirname(__file__), '..', 'embench-iot-applications')
+
+# poseidon_hash(list(range(t))) as computed by the baseline implementation (before the parameters were cached and
+# the partial rounds made sparse)
+KNOWN_ANSWERS = {
+    3: [7853200120776062878684798364095072458815029376092732009249414926327459813530, 7142104613055408817911962100316808866448378443474503659992478482890339429929, 6549537674122432311777789598043107870002137484850126429160507761192163713804],
+    9: [18604317144381847857886385684060986177838410221561136253933256952257712543953, 6918858823749561268900116297149718140462749013021567516691205380764300138990, 18853273858368200691669364850581035891860100876042779706280443281226809164571, 452929785468403373762752944454393102757688456143017478468722783334653078921, 6785503497376789565336502723672924708783713974874607904097053716895470194948, 15242777589708589290764631782271947333494547836641334791336929547796750363713, 1423264237357468953062090802538830935937666790208071227577230887538595522049, 13714160507221332214231353583451736012949398785576064598064450903866090199381, 20152903585575653228134380791617231896388103909484509093865934106990217606985],
+}
+
+@pytest.fixture(params=['lockstep', 'one at a time'])
+def batching(request, monkeypatch):
+    # permute_many runs batches in lockstep with numpy and one state at a time without it
+    if request.param == 'lockstep':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(poseidon, 'numpy', None)
+    return request.param
+
+def baseline_hash(padded_list):
+    # hash() as it was before the sponge, i.e., one call to poseidon_hash per chunk of 8 field elements
+    state = [0]*9
+    for i in range(0, len(padded_list), 8):
+        state = poseidon_hash([state[0]] + [elem + state[j+1] for j,elem in enumerate(padded_list[i:i+8])])
+    return state[2]
+
+def read_ints(filename):
+    # the lines of one of crc32's circuit input files, each a list of ints
+    with open(os.path.join(APPLICATIONS_DIR, 'crc32', filename)) as file_in:
+        return [[int(value) for value in line.split()] for line in file_in.read().splitlines()]
+
+def committed_digest_inputs():
+    # the padded lists whose digests the baseline formatter wrote to crc32's in_*_digest files (24-bit addresses)
+    translator = [line[0] for line in read_ints('in_translator')]
+    transitions = [int(format(ret,'024b')+format(dst,'024b')+format(jumpkind,'02b'),2) for jumpkind,dst,ret in read_ints('in_recorded_path')]
+    nonce_translator = read_ints('in_nonce_translator')[0][0]
+    nonce_verifier = read_ints('in_nonce_verifier')[0][0]
+    nonce_path = read_ints('in_nonce_path')[0][0]
+    translator_padded = make_multiple_of(compress(translator, 24), 8, 1)
+    translator_padded[-1] = nonce_translator
+    path_padded = make_multiple_of(compress(transitions, 2+2*24), 8, 2)
+    path_padded[-2:] = [nonce_verifier, nonce_path]
+    digests = [read_ints('in_translator_digest')[0][0], read_ints('in_recorded_path_digest')[0][0]]
+    return [translator_padded, path_padded], digests
+
+@pytest.mark.parametrize('t', sorted(KNOWN_ANSWERS))
+def test_poseidon_hash_known_answers(t):
+    assert poseidon_hash(list(range(t))) == KNOWN_ANSWERS[t]
+
+def test_poseidon_hash_many_known_answers(batching):
+    states = [list(range(t)) for t in sorted(KNOWN_ANSWERS) for i in range(LOCKSTEP_MIN_STATES)]
+    assert poseidon_hash_many(states) == [KNOWN_ANSWERS[len(state)] for state in states]
+
+def test_hash_reproduces_the_committed_digests(batching):
+    padded_lists, digests = committed_digest_inputs()
+    assert [baseline_hash(padded_list) for padded_list in padded_lists] == digests
+    assert [hash(padded_list) for padded_list in padded_lists] == digests
+    assert hash_many(padded_lists) == digests
+
+def test_poseidon_hash_many_matches_poseidon_hash(batching):
+    rng = random.Random(0)
+    states = [[rng.randrange(p) for i in range(t)] for t in [2, 3, 9, 5, 9, 3]]
+    states += [[rng.randrange(p) for i in range(t)] for t in [3, 9] for j in range(LOCKSTEP_MIN_STATES)]
+    rng.shuffle(states)
+    assert poseidon_hash_many(states) == [poseidon_hash(state) for state in states]
+
+def test_hash_many_matches_hash(batching):
+    rng = random.Random(1)
+    padded_lists = [[rng.randrange(p) for i in range(8*rng.randint(0, 4))] for j in range(2*LOCKSTEP_MIN_STATES)]
+    assert hash_many(padded_lists) == [hash(padded_list) for padded_list in padded_lists]
@@ -0,0 +1,55 @@
+import random
+import pytest
+from poseidon.poseidon_field import available_backends, set_field_backend, get_field_backend, p
+from poseidon.poseidon_hash import poseidon_hash
+from poseidon.poseidon_sponge import PoseidonSponge
+import packing
+
+@pytest.fixture
+def restore_backend():
+    backend = get_field_backend().name
+    yield
+    set_field_backend(backend)
+
+def reference(function):
+    set_field_backend('python')
+    return function()
+
+@pytest.mark.parametrize('backend', available_backends())
+def test_poseidon_hash_matches_python_backend(backend, restore_backend):
+    rng = random.Random(1)
+    states = [[rng.randrange(p) for i in range(t)] for t in range(2, 10)]
+    expected = reference(lambda: [poseidon_hash(state) for state in states])
+    set_field_backend(backend)
+    assert [poseidon_hash(state) for state in states] == expected
+
+@pytest.mark.parametrize('backend', available_backends())
+def test_sponge_matches_python_backend(backend, restore_backend):
+    rng = random.Random(2)
+    elems = [rng.getrandbits(50) for i in range(100)]
+    field_elements = [rng.randrange(p) for i in range(21)]
+    def digests():
+        packed = PoseidonSponge(50).absorb(elems)
+        checkpoint = PoseidonSponge().absorb(field_elements).checkpoint(2)
+        return [packed.finalize([7]), PoseidonSponge.from_checkpoint(checkpoint).finalize([3, 4]), PoseidonSponge().absorb(field_elements).finalize([3, 4])]
+    expected = reference(digests)
+    set_field_backend(backend)
+    assert digests() == expected
+
+@pytest.mark.parametrize('backend', available_backends())
+def test_pack_matches_python_backend(backend, restore_backend):
+    elems = [3, 1, 4, 1, 5, 9, 2, 6]
+    expected = reference(lambda: get_field_backend().pack(elems, 13))
+    assert set_field_backend(backend).pack(elems, 13) == expected
+
+@pytest.mark.parametrize('backend', available_backends())
+def test_pack_fields_packs_through_the_selected_backend(backend, restore_backend, monkeypatch):
+    monkeypatch.setattr(packing, 'numpy', None) # numpy packs large lists column-wise, without the backend
+    rng = random.Random(3)
+    elems = [rng.getrandbits(50) for i in range(1000)]
+    expected = reference(lambda: packing.pack_fields(elems, 50, 5))
+    field = set_field_backend(backend)
+    pack, calls = field.pack, []
+    monkeypatch.setattr(field, 'pack', lambda elems, bitwidth: calls.append(len(elems)) or pack(elems, bitwidth))
+    assert packing.pack_fields(elems, 50, 5) == expected
+    assert calls == [5]*200
@@ -0,0 +1,80 @@
+import os
+import shutil
+import pytest
+
+angr = pytest.importorskip('angr')
+from trace_recorder import TransitionBuffer, TraceRecorder, load_checkpoint
+import extractor
+
+APPLICATIONS_DIR = os.path.join(os.path.dirname(__file__), '..', 'embench-iot-applications')
+
+def project():
+    return angr.load_shellcode(b'\x90\x90\xc3', 'amd64')
+
+def recorder(tmp_path, checkpoint_interval):
+    recorder = TraceRecorder(TransitionBuffer(), checkpoint_filename=str(tmp_path/'trace.checkpoint'), checkpoint_interval=checkpoint_interval)
+    recorder.last_state = project().factory.blank_state(addr=1)
+    recorder.transitions.append({'jumpkind': 'jump', 'dst': 1, 'ret': None})
+    recorder.initial_node = 0
+    recorder.steps = 1
+    return recorder
+
+def test_no_checkpoint_unless_asked_for(tmp_path):
+    assert not recorder(tmp_path, None).save_checkpoint()
+    assert not os.path.exists(tmp_path/'trace.checkpoint')
+
+def test_checkpoint_is_rebound_to_the_live_project(tmp_path):
+    saved = recorder(tmp_path, 10)
+    assert saved.save_checkpoint()
+    assert saved.last_state.project is not None # only detached while pickling
+    live = project()
+    checkpoint = load_checkpoint(str(tmp_path/'trace.checkpoint'), live)
+    resumed = TraceRecorder(TransitionBuffer())
+    state = resumed.resume(checkpoint)
+    assert state.project is live
+    assert state.addr == 1
+    assert (resumed.steps, resumed.initial_node, list(resumed.transitions)) == (1, 0, [{'jumpkind': 'jump', 'dst': 1, 'ret': None}])
+
+def history_depth(state):
+    depth, history = 0, state.history
+    while history is not None:
+        depth, history = depth + 1, history.parent
+    return depth
+
+@pytest.mark.parametrize('trim_history', [True, False])
+def test_recorder_trims_the_history(trim_history):
+    # five jumps to the next instruction: each step is recorded from the most recent history entry, which is all
+    # that is left of the history of a trimmed state (besides the step it was trimmed at)
+    proj = angr.load_shellcode(b'\xeb\x00'*5 + b'\xc3', 'amd64')
+    recorder = TraceRecorder(TransitionBuffer(), trim_history=trim_history)
+    depths = []
+    record = recorder.record
+    def record_depth(state):
+        depths.append(history_depth(state))
+        record(state)
+    recorder.record = record_depth
+    simgr = proj.factory.simgr(proj.factory.entry_state())
+    simgr.use_technique(recorder)
+    simgr.run()
+    assert list(recorder.transitions) == [{'jumpkind': 'jump', 'dst': dst, 'ret': None} for dst in range(2, 12, 2)]
+    if trim_history:
+        assert depths == [2]*5
+        assert recorder.last_state.history.parent is None
+    else:
+        assert depths == list(range(2, 7))
+
+@pytest.mark.parametrize('application', ['crc32', 'nettle-sha256']) # nettle-sha256 enters a loop by falling through
+def test_unicorn_records_the_same_path_as_vex(tmp_path, application):
+    # a sample application recorded block by block (VEX) and natively (unicorn)
+    unicorn_engine = pytest.importorskip('angr.state_plugins.unicorn_engine')
+    if unicorn_engine._UC_NATIVE is None:
+        pytest.skip('angr was built without unicorn support')
+    if shutil.which(extractor.COMPILER) is None:
+        pytest.skip('%s is not installed' %extractor.COMPILER)
+    out_file = str(tmp_path/'main')
+    extractor.compile(extractor.find_c_file(os.path.join(APPLICATIONS_DIR, application)), out_file)
+    vex = extractor.get_execution_path(angr.Project(out_file, load_options={'auto_load_libs': False}))
+    unicorn = extractor.get_execution_path(angr.Project(out_file, load_options={'auto_load_libs': False}), use_unicorn=True)
+    assert vex[0] == unicorn[0] == 'reached an exit'
+    assert vex[2] == unicorn[2]
+    assert vex[2]['transitions'][0]['ret'] != 0 # the call out of _start is tracked as well